@@ -0,0 +1,234 @@
+"""
+Общая подготовка для бенчмарков.
+
+bot.py читает конфигурацию и сохраненное состояние при импорте, а main()
+создает файлы состояния в текущем каталоге, поэтому бенчмарки импортируют его
+с тестовыми переменными окружения из временного каталога.
+"""
+
+import asyncio
+import base64
+import os
+import statistics
+import sys
+import tempfile
+import threading
+import time
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, List, Optional
+
+from aiohttp import web
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+TEST_ENV = {
+    "BOT_TOKEN": "123456:TEST",
+    "BOT_ID": "123456",
+    "MAIN_GROUP": "-1001",
+    "MONITORED_GROUPS": "-1001,-1002",
+    "ADMIN_IDS": "1",
+    "SPECIAL_SEND_USER": "1",
+}
+
+
+def import_bot(**env):
+    """Импортирует bot.py во временном каталоге; env переопределяет переменные окружения"""
+    for name, value in {**TEST_ENV, **env}.items():
+        os.environ[name] = str(value)
+    os.chdir(tempfile.mkdtemp(prefix="bench-"))
+    if ROOT not in sys.path:
+        sys.path.insert(0, ROOT)
+    import bot
+    return bot
+
+
+def use_api_server(bot_module, base_url: str):
+    """Направляет запросы бота, созданного в bot.initialize_bot, на локальный сервер"""
+    from aiogram.client.telegram import TelegramAPIServer
+
+    initialize_bot = bot_module.initialize_bot
+
+    async def initialize_local_bot():
+        created = await initialize_bot()
+        created.session.api = TelegramAPIServer.from_base(base_url)
+        return created
+
+    bot_module.initialize_bot = initialize_local_bot
+
+
+def message_update(update_id: int, chat_id: int, user_id: int, text: str) -> dict:
+    """Обновление Bot API с текстовым сообщением из группы"""
+    return {
+        "update_id": update_id,
+        "message": {
+            "message_id": update_id,
+            "date": int(time.time()),
+            "chat": {"id": chat_id, "type": "supergroup", "title": "bench"},
+            "from": {"id": user_id, "is_bot": False, "first_name": "Bench"},
+            "text": text,
+        },
+    }
+
+
+class FakeTelegramServer:
+    """
+    Локальная замена Bot API.
+
+    Отвечает на любой метод: getMe — ботом из TEST_ENV, getUpdates — обновлениями,
+    добавленными через push (long polling до секунды), остальные — ответом из
+    responses или True. Время каждого ответа на getUpdates пишется в delivered.
+    """
+
+    def __init__(self):
+        self.calls: Counter = Counter()
+        self.responses: Dict[str, object] = {
+            "getMe": {"id": int(TEST_ENV["BOT_ID"]), "is_bot": True, "first_name": "Bench", "username": "bench_bot"},
+            "getChatAdministrators": [],
+            "getChatMember": {"status": "member", "user": {"id": 777, "is_bot": False, "first_name": "Bench"}},
+        }
+        self.delivered: Dict[int, float] = {}
+        self._updates: Optional[asyncio.Queue] = None
+        self._runner: Optional[web.AppRunner] = None
+
+    async def start(self) -> str:
+        self._updates = asyncio.Queue()
+        app = web.Application()
+        app.router.add_post("/bot{token}/{method}", self._handle)
+        self._runner = web.AppRunner(app)
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, "127.0.0.1", 0)
+        await site.start()
+        port = site._server.sockets[0].getsockname()[1]
+        return f"http://127.0.0.1:{port}"
+
+    async def stop(self):
+        await self._runner.cleanup()
+
+    def push(self, update: dict):
+        self._updates.put_nowait(update)
+
+    async def _handle(self, request: web.Request) -> web.Response:
+        method = request.match_info["method"]
+        self.calls[method] += 1
+        if method == "getUpdates":
+            result = []
+            try:
+                result.append(await asyncio.wait_for(self._updates.get(), 1.0))
+            except asyncio.TimeoutError:
+                pass
+            while not self._updates.empty():
+                result.append(self._updates.get_nowait())
+            now = time.perf_counter()
+            for update in result:
+                self.delivered[update["update_id"]] = now
+        else:
+            result = self.responses.get(method, True)
+        return web.json_response({"ok": True, "result": result})
+
+
+class FakeTtsServer:
+    """
+    Локальная замена эндпоинта Google Translate, к которому обращается gTTS.
+
+    На каждый запрос (gTTS режет текст по знакам препинания на фрагменты
+    не длиннее 100 символов и запрашивает их по одному) через latency секунд отвечает в формате batchexecute фиктивным MP3 из
+    audio_bytes байт. Работает в своем потоке, чтобы отвечать, даже когда
+    event loop заблокирован синхронным вызовом gTTS.
+    """
+
+    def __init__(self, latency: float = 0.2, audio_bytes: int = 16 * 1024):
+        self.latency = latency
+        self.requests = 0
+        self.max_concurrent = 0
+        self._concurrent = 0
+        self._lock = threading.Lock()
+        audio = base64.b64encode(os.urandom(audio_bytes)).decode("ascii")
+        self._body = f'[["wrb.fr","jQ1olc","[\\"{audio}\\"]",null,null,null,"generic"]]\n'.encode()
+        self._server: Optional[ThreadingHTTPServer] = None
+        self._original_url = None
+
+    def start(self):
+        """Запускает сервер и направляет на него запросы gTTS"""
+        import gtts.tts
+
+        fake = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_POST(self):
+                self.rfile.read(int(self.headers.get("Content-Length", 0)))
+                with fake._lock:
+                    fake.requests += 1
+                    fake._concurrent += 1
+                    fake.max_concurrent = max(fake.max_concurrent, fake._concurrent)
+                time.sleep(fake.latency)
+                with fake._lock:
+                    fake._concurrent -= 1
+                self.send_response(200)
+                self.send_header("Content-Length", str(len(fake._body)))
+                self.end_headers()
+                self.wfile.write(fake._body)
+
+            def log_message(self, *args):
+                pass
+
+        self._server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self._server.daemon_threads = True
+        threading.Thread(target=self._server.serve_forever, daemon=True).start()
+        port = self._server.server_address[1]
+        self._original_url = gtts.tts._translate_url
+        gtts.tts._translate_url = lambda tld="com", path="": f"http://127.0.0.1:{port}/{path}"
+
+    def stop(self):
+        import gtts.tts
+
+        gtts.tts._translate_url = self._original_url
+        self._server.shutdown()
+        self._server.server_close()
+
+
+class LoopLagSampler:
+    """Замеряет задержки event loop: насколько позже заказанного просыпается короткий sleep"""
+
+    def __init__(self, interval: float = 0.001):
+        self.interval = interval
+        self.lags: List[float] = []
+        self._task = None
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            started = loop.time()
+            await asyncio.sleep(self.interval)
+            self.lags.append(loop.time() - started - self.interval)
+
+    def start(self):
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+
+    def summary(self) -> str:
+        lags = sorted(self.lags)
+        p99 = lags[int(len(lags) * 0.99) - 1] if lags else 0.0
+        return (
+            f"задержка loop: медиана {statistics.median(lags) * 1000:.2f} мс, "
+            f"p99 {p99 * 1000:.2f} мс, максимум {lags[-1] * 1000:.2f} мс"
+        )
+
+
+def percentile(values: List[float], fraction: float) -> float:
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * fraction))]
+
+
+def timed(func, *args, repeat: int = 1):
+    """Вызывает func repeat раз, возвращает результат последнего вызова и среднее время вызова"""
+    started = time.perf_counter()
+    for _ in range(repeat):
+        result = func(*args)
+    return result, (time.perf_counter() - started) / repeat
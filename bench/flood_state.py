@@ -0,0 +1,117 @@
+"""
+Состояние антифлуда: пропускная способность и память (user-005).
+
+  до:    словарь списков на пользователя, окна пересобираются list comprehension,
+         повторы пересчитываются заново для каждого сообщения (как было)
+  после: FloodState (__slots__, окна — плоские списки до FLOOD_HISTORY_CAP записей,
+         повторы считаются по хешам окна, окно длинных сообщений создается по требованию)
+
+Пропускная способность — сообщения/с при 1000 активных пользователях, каждый пишет
+раз в ~0,5 с (в окнах лежит несколько записей). Память — 100000 активных
+пользователей по 3 сообщения в окнах, замер tracemalloc.
+
+    python bench/flood_state.py
+"""
+
+import random
+import time
+import tracemalloc
+
+from _common import import_bot
+
+ACTIVE_USERS = 1000
+MESSAGES = 300000
+MEMORY_USERS = 100000
+
+
+def old_check(history, user_id, now, msg_hash, message_id):
+    """Проверка окон из прежней реализации check_flood (без длинных сообщений)"""
+    user_history = history.get(user_id)
+    if user_history is None:
+        user_history = history[user_id] = {"messages": [], "last_messages": [], "long_messages": []}
+    user_history["last_messages"].append((now, msg_hash, message_id))
+    user_history["last_messages"] = [
+        (t, h, mid) for t, h, mid in user_history["last_messages"] if now - t <= 10
+    ]
+    hash_counts = {}
+    for _, h, _ in user_history["last_messages"]:
+        hash_counts[h] = hash_counts.get(h, 0) + 1
+    user_history["messages"].append((now, message_id))
+    user_history["messages"] = [(t, mid) for t, mid in user_history["messages"] if now - t <= 3]
+    return len(user_history["messages"]), max(hash_counts.values())
+
+
+def new_check(bot, history, user_id, now, msg_hash, message_id):
+    state = history.get(user_id)
+    if state is None:
+        state = history[user_id] = bot.FloodState()
+    state.last_seen = now
+    repeats = state.add_hash(now, msg_hash, message_id)
+    return state.add_message(now, message_id), repeats
+
+
+def workload():
+    rng = random.Random(1)
+    now = 0.0
+    events = []
+    for message_id in range(MESSAGES):
+        now += 0.5 / ACTIVE_USERS
+        events.append((rng.randrange(ACTIVE_USERS), now, rng.randrange(50), message_id))
+    return events
+
+
+def throughput(check, events) -> float:
+    history = {}
+    started = time.perf_counter()
+    for user_id, now, msg_hash, message_id in events:
+        check(history, user_id, now, msg_hash, message_id)
+    return len(events) / (time.perf_counter() - started)
+
+
+def memory(fill) -> int:
+    tracemalloc.start()
+    history = {}
+    fill(history)
+    size, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return size
+
+
+def main():
+    bot = import_bot()
+    events = workload()
+
+    old_rate = throughput(old_check, events)
+    new_rate = throughput(lambda *args: new_check(bot, *args), events)
+
+    def fill_old(history):
+        for user_id in range(MEMORY_USERS):
+            for i in range(3):
+                old_check(history, user_id, float(i), i, user_id * 3 + i)
+
+    def fill_new(history):
+        for user_id in range(MEMORY_USERS):
+            for i in range(3):
+                new_check(bot, history, user_id, float(i), i, user_id * 3 + i)
+
+    old_memory = memory(fill_old)
+    new_memory = memory(fill_new)
+
+    # Очистка: все пользователи неактивны дольше самого длинного окна
+    bot.flood_history.clear()
+    fill_new(bot.flood_history.setdefault(-1001, {}))
+    started = time.perf_counter()
+    removed = bot.sweep_flood_history(3.0 + bot.FLOOD_IDLE_TIMEOUT + 1)
+    sweep_ms = (time.perf_counter() - started) * 1000
+
+    print(f"пропускная способность ({ACTIVE_USERS} активных пользователей):")
+    print(f"  до:    {old_rate:,.0f} сообщений/с")
+    print(f"  после: {new_rate:,.0f} сообщений/с")
+    print(f"память на {MEMORY_USERS} пользователей по 3 сообщения:")
+    print(f"  до:    {old_memory / 2**20:.1f} МБ ({old_memory / MEMORY_USERS:.0f} Б на пользователя)")
+    print(f"  после: {new_memory / 2**20:.1f} МБ ({new_memory / MEMORY_USERS:.0f} Б на пользователя)")
+    print(f"очистка неактивных: удалено {removed} за {sweep_ms:.0f} мс (раньше история не очищалась)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,94 @@
+"""
+Микропакеты определения языка против вызова lingua на каждое сообщение (user-009).
+
+Несколько чатов с ua_mode присылают сообщения волнами: WAVES раз по WAVE_SIZE
+сообщений почти одновременно. Кэш отключен, чтобы каждый текст доходил до
+lingua. Сравниваются:
+  по одному: LanguageDetectionService с batch_size=1 — задача пула на текст
+  пакетами:  окно BATCH_WINDOW_MS и до BATCH_SIZE текстов за вызов
+
+Дополнительно — чистое время lingua без event loop: цикл
+compute_language_confidence_values против одного параллельного вызова.
+
+    python bench/language_batching.py
+"""
+
+import asyncio
+import time
+
+from _common import import_bot, percentile, timed
+
+WAVES = 20
+WAVE_SIZE = 32
+WORKERS = 2
+BATCH_WINDOW_MS = 5
+BATCH_SIZE = 32
+
+SAMPLES = [
+    "Привіт, хто сьогодні йде на зустріч біля ратуші?",
+    "Всем привет, подскажите, где купить билеты на поезд?",
+    "Does anyone know if the border crossing is open today?",
+    "Dzień dobry, czy ktoś wie, gdzie jest najbliższa apteka?",
+    "Дякую всім за допомогу, все вийшло!",
+    "Ну это уже слишком, давайте без оскорблений",
+    "The meeting was moved to Friday evening, see you there",
+    "Szukam mieszkania do wynajęcia w centrum miasta",
+]
+
+
+def make_texts(count: int):
+    # Номер в конце делает тексты разными, а язык от него не зависит
+    return [f"{SAMPLES[i % len(SAMPLES)]} {i}" for i in range(count)]
+
+
+async def run_waves(bot, batch_window: float, batch_size: int):
+    service = bot.LanguageDetectionService(
+        "thread", WORKERS, max_pending=10000, timeout=60,
+        batch_window=batch_window, batch_size=batch_size, cache_size=0
+    )
+    await service.warm_up()
+    # Модели языков lingua подгружает при первом тексте — загружаем их до замера
+    for sample in SAMPLES:
+        await service.detect(sample)
+    texts = make_texts(WAVES * WAVE_SIZE)
+    latencies = []
+
+    async def detect(text):
+        started = time.perf_counter()
+        await service.detect(text)
+        latencies.append(time.perf_counter() - started)
+
+    started = time.perf_counter()
+    for wave in range(WAVES):
+        await asyncio.gather(*(detect(text) for text in texts[wave * WAVE_SIZE:(wave + 1) * WAVE_SIZE]))
+    elapsed = time.perf_counter() - started
+    service.shutdown()
+    return len(texts) / elapsed, latencies, service.completed - len(SAMPLES)
+
+
+def report(title, throughput, latencies, jobs):
+    print(
+        f"  {title}: {throughput:,.0f} текстов/с, задач пула: {jobs}, "
+        f"задержка медиана {percentile(latencies, 0.5) * 1000:.1f} мс, p99 {percentile(latencies, 0.99) * 1000:.1f} мс"
+    )
+
+
+def main():
+    bot = import_bot()
+    import language_worker
+
+    print(f"{WAVES} волн по {WAVE_SIZE} сообщений, пул потоков x{WORKERS}, кэш отключен:")
+    report("по одному", *asyncio.run(run_waves(bot, 0.0, 1)))
+    report("пакетами ", *asyncio.run(run_waves(bot, BATCH_WINDOW_MS / 1000, BATCH_SIZE)))
+
+    texts = make_texts(WAVE_SIZE)
+    detector = language_worker.get_detector()
+    _, single = timed(lambda: [detector.compute_language_confidence_values(text) for text in texts], repeat=10)
+    _, batched = timed(language_worker.detect_languages_batch, texts, repeat=10)
+    print(f"lingua без event loop, {WAVE_SIZE} текстов:")
+    print(f"  цикл по текстам:     {single * 1000:.1f} мс")
+    print(f"  параллельный вызов:  {batched * 1000:.1f} мс")
+
+
+if __name__ == "__main__":
+    main()
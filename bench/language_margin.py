@@ -0,0 +1,68 @@
+"""
+Порог LANG_MIN_CONFIDENCE_MARGIN против правила detect_language_of (user-010).
+
+Язык определяется по compute_language_confidence_values, чтобы язык и
+уверенность получались за один проход модели. Раньше бот вызывал
+detect_language_of с with_minimum_relative_distance(0.25): lingua возвращает
+None, если уверенность лучшего языка опережает второй меньше чем на 0.25.
+Скрипт проверяет на коротких и неоднозначных текстах, что отрыв по умолчанию
+дает те же решения, и показывает, какие тексты меняются при другом пороге.
+Завершается с кодом 1, если решения расходятся.
+
+    python bench/language_margin.py [порог для сравнения]
+"""
+
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import language_worker  # noqa: E402
+from lingua import LanguageDetectorBuilder  # noqa: E402
+
+DEFAULT_MARGIN = 0.25
+
+TEXTS = [
+    "да", "так", "ні", "ok", "ну", "і", "ї", "це", "это", "мир", "світ", "дом", "дім", "мама",
+    "привет", "привіт", "дякую", "спасибо", "добре", "хорошо", "tak", "nie", "cześć", "hello",
+    "thanks", "lol", "ахаха", "хаха", "Zgoda", "przepraszam", "👍", "123",
+    "Привет всем", "Як справи?", "Как дела?", "Добрий день", "Добрый день", "а що", "а что",
+    "не знаю", "не знаю що", "я не знаю", "так так", "Ну да", "Я тут", "Ok, дякую",
+    "Слава Україні", "Героям слава", "Хорошо, дякую", "Привет, як справи?",
+    "Всем привет, подскажите, где купить билеты на поезд?",
+    "Привіт, хто сьогодні йде на зустріч біля ратуші?",
+    "Does anyone know if the border crossing is open today?",
+    "Dzień dobry, czy ktoś wie, gdzie jest najbliższa apteka?",
+]
+
+
+def decisions(margin: float):
+    language_worker.configure({"min_confidence_margin": margin})
+    return {text: language_worker.detect_language(text)[0] for text in TEXTS}
+
+
+def main():
+    other_margin = float(sys.argv[1]) if len(sys.argv) > 1 else 0.1
+    detector = LanguageDetectorBuilder.from_languages(*language_worker.LANGUAGES) \
+        .with_minimum_relative_distance(DEFAULT_MARGIN).build()
+    reference = {}
+    for text in TEXTS:
+        language = detector.detect_language_of(text)
+        reference[text] = language.name if language else None
+
+    default = decisions(DEFAULT_MARGIN)
+    mismatches = [text for text in TEXTS if default[text] != reference[text]]
+    print(f"отрыв {DEFAULT_MARGIN} против detect_language_of: {len(TEXTS)} текстов, расхождений {len(mismatches)}")
+    for text in mismatches:
+        print(f"  {text!r}: detect_language_of={reference[text]}, отрыв={default[text]}")
+
+    other = decisions(other_margin)
+    changed = [text for text in TEXTS if other[text] != default[text]]
+    print(f"отрыв {other_margin}: меняется решение для {len(changed)} текстов")
+    for text in changed:
+        print(f"  {text!r}: {default[text]} -> {other[text]}")
+    return 1 if mismatches else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
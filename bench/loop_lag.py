@@ -0,0 +1,73 @@
+"""
+Задержка event loop при сохранении состояния модерации (user-001).
+
+Во время «рейда» 50 раз в секунду меняется словарь предупреждений на 20000
+пользователей и вызывается сохранение. Сравниваются:
+  до:    синхронная запись всего JSON с indent=2 прямо в event loop (как было)
+  после: WriteBehindStore — пометка «изменено» и одна фоновая запись за интервал
+
+    python bench/loop_lag.py
+"""
+
+import asyncio
+import json
+import os
+
+from _common import LoopLagSampler, import_bot
+
+USERS = 20000
+SAVES_PER_SECOND = 50
+DURATION = 4.0
+
+
+async def raid(save):
+    warnings = {user_id: user_id % 3 for user_id in range(USERS)}
+    for i in range(int(SAVES_PER_SECOND * DURATION)):
+        warnings[i] = warnings.get(i, 0) + 1
+        save(warnings)
+        await asyncio.sleep(1 / SAVES_PER_SECOND)
+    return warnings
+
+
+async def run_sync():
+    def save(data):
+        with open("warnings_sync.json", "w", encoding="utf-8") as f:
+            json.dump(data, f, ensure_ascii=False, indent=2)
+
+    sampler = LoopLagSampler()
+    sampler.start()
+    await raid(save)
+    await sampler.stop()
+    return sampler
+
+
+async def run_write_behind(bot):
+    store = bot.WriteBehindStore(interval=1.0)
+    state = {}
+    store.register("warnings_wb.json", lambda: dict(state["warnings"]))
+
+    def save(data):
+        state["warnings"] = data
+        store.mark_dirty("warnings_wb.json")
+
+    sampler = LoopLagSampler()
+    store.start()
+    sampler.start()
+    await raid(save)
+    await sampler.stop()
+    await store.stop()
+    return sampler
+
+
+async def main():
+    bot = import_bot()
+    before = await run_sync()
+    after = await run_write_behind(bot)
+    print(f"{USERS} пользователей, {SAVES_PER_SECOND} сохранений/с, {DURATION:.0f} с")
+    print(f"до (синхронная запись):  {before.summary()}")
+    print(f"после (WriteBehindStore): {after.summary()}")
+    assert os.path.getsize("warnings_wb.json") > 0
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,114 @@
+"""
+Время запуска и первого определения языка (user-011).
+
+Каждый вариант запускается в отдельном процессе с локальной заменой Bot API,
+которая сразу отдает одно сообщение. Замеряются:
+  - время от старта процесса до первого обновления;
+  - первое определение языка, запрошенное в момент этого обновления;
+  - определение языка, модели которого еще не загружались, через LATER секунд;
+  - самая долгая остановка event loop (загрузка моделей lingua держит GIL).
+Тексты неоднозначные: украинский с буквами і/ї lingua узнает без моделей.
+Сравниваются:
+  до:               детектор собирается при импорте bot.py (как было), без прогрева
+  лениво:           детектор создается при первом определении (LANG_WARMUP=false)
+  лениво+прогрев:   модели загружаются в фоне с первым обновлением (LANG_WARMUP=true)
+  процессы+прогрев: то же в пуле процессов, каждый процесс прогревается в initializer
+
+    python bench/startup.py [повторов]
+"""
+
+import time
+
+process_started = time.perf_counter()
+
+import asyncio  # noqa: E402
+import json  # noqa: E402
+import statistics  # noqa: E402
+import subprocess  # noqa: E402
+import sys  # noqa: E402
+
+from _common import ROOT, FakeTelegramServer, LoopLagSampler, import_bot, message_update, use_api_server  # noqa: E402
+
+SCENARIOS = {
+    "до": {"eager": True, "env": {"LANG_WARMUP": "false"}},
+    "лениво": {"eager": False, "env": {"LANG_WARMUP": "false"}},
+    "лениво+прогрев": {"eager": False, "env": {"LANG_WARMUP": "true"}},
+    "процессы+прогрев": {"eager": False, "env": {"LANG_WARMUP": "true", "LANG_DETECT_EXECUTOR": "process"}},
+}
+
+FIRST_TEXT = "Всем привет, подскажите, где купить билеты на поезд?"
+LATER_TEXT = "Does anyone know if the border crossing is open today?"
+LATER = 3.0
+
+
+async def timed_detection(bot, text: str) -> float:
+    """Время определения языка; бесконечность, если бот не дождался результата и пропустил проверку"""
+    started = time.perf_counter()
+    try:
+        await bot.language_service.detect(text)
+    except bot.LanguageDetectionUnavailable:
+        return float("inf")
+    return time.perf_counter() - started
+
+
+def milliseconds(seconds: float) -> str:
+    return "таймаут" if seconds == float("inf") else f"{seconds * 1000:.0f} мс"
+
+
+async def run_child(scenario: dict) -> dict:
+    if scenario["eager"]:
+        sys.path.insert(0, ROOT)
+        import language_worker
+        language_worker.get_detector()
+    bot = import_bot(**scenario["env"])
+    imported = time.perf_counter() - process_started
+
+    server = FakeTelegramServer()
+    use_api_server(bot, await server.start())
+    server.push(message_update(1, int(bot.MAIN_GROUP), 777, "hi"))
+    sampler = LoopLagSampler()
+    sampler.start()
+    main_task = asyncio.create_task(bot.main())
+    while bot.time_to_first_update is None:
+        await asyncio.sleep(0.001)
+    first_update = time.perf_counter() - process_started
+
+    first_detection = await timed_detection(bot, FIRST_TEXT)
+    await asyncio.sleep(LATER)
+    later_detection = await timed_detection(bot, LATER_TEXT)
+
+    await sampler.stop()
+    await bot.dp.stop_polling()
+    await main_task
+    await server.stop()
+    return {
+        "import": imported, "first_update": first_update, "first_detection": first_detection,
+        "later_detection": later_detection, "max_stall": max(sampler.lags),
+    }
+
+
+def main():
+    if len(sys.argv) > 2 and sys.argv[1] == "--child":
+        print(json.dumps(asyncio.run(run_child(SCENARIOS[sys.argv[2]]))))
+        return
+    repeat = int(sys.argv[1]) if len(sys.argv) > 1 else 3
+    print(f"медиана из {repeat} запусков:")
+    for name in SCENARIOS:
+        runs = []
+        for _ in range(repeat):
+            output = subprocess.run(
+                [sys.executable, __file__, "--child", name], capture_output=True, text=True, check=True
+            ).stdout
+            runs.append(json.loads(output.strip().splitlines()[-1]))
+        median = {key: statistics.median(run[key] for run in runs) for key in runs[0]}
+        print(
+            f"  {name}: импорт {median['import']:.2f} с, первое обновление через {median['first_update']:.2f} с "
+            f"({median['first_update'] - median['import']:.2f} с после импорта), "
+            f"первое определение {milliseconds(median['first_detection'])}, "
+            f"через {LATER:.0f} с {milliseconds(median['later_detection'])}, "
+            f"остановка loop до {median['max_stall'] * 1000:.0f} мс"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,79 @@
+"""
+Задержка /tts с локальной заменой эндпоинта синтеза (user-013).
+
+REQUESTS запросов /tts приходят одновременно; эндпоинт отвечает через
+LATENCY секунд на каждый запрос gTTS. Отправка в Telegram не замеряется:
+сравнивается путь от текста до готовых для отправки байтов. Сравниваются:
+  до:    gTTS.save во временный файл прямо в обработчике, затем чтение файла
+         для FSInputFile и удаление (как было)
+  после: синтез в пуле потоков в память (synthesize_long_speech), BufferedInputFile
+
+    python bench/tts_latency.py
+"""
+
+import asyncio
+import os
+import tempfile
+import time
+
+from _common import FakeTtsServer, LoopLagSampler, import_bot, percentile
+
+REQUESTS = 5
+LATENCY = 0.2
+TEXT = "Доброе утро всем, напоминаю, что встреча сегодня в семь вечера у ратуши"
+
+
+async def old_tts(text: str, lang: str) -> bytes:
+    from gtts import gTTS
+
+    with tempfile.NamedTemporaryFile(suffix=".mp3", delete=False) as temp_file:
+        gTTS(text=text, lang=lang).save(temp_file.name)
+        with open(temp_file.name, "rb") as audio:
+            data = audio.read()
+    os.unlink(temp_file.name)
+    return data
+
+
+async def new_tts(bot, text: str, lang: str) -> bytes:
+    audio = await bot.synthesize_long_speech(text, lang)
+    bot.BufferedInputFile(audio, filename="voice.mp3")
+    return audio
+
+
+async def measure(synthesize) -> str:
+    latencies = []
+
+    async def request(number: int):
+        # Отсчет от общего момента прихода: при заблокированном loop запрос ждет еще до начала обработки
+        await synthesize(f"{TEXT} {number}", "ru")
+        latencies.append(time.perf_counter() - started)
+
+    sampler = LoopLagSampler()
+    sampler.start()
+    started = time.perf_counter()
+    await asyncio.gather(*(request(number) for number in range(REQUESTS)))
+    elapsed = time.perf_counter() - started
+    await asyncio.sleep(0.05)
+    await sampler.stop()
+    return (
+        f"все за {elapsed:.2f} с, запрос медиана {percentile(latencies, 0.5):.2f} с, "
+        f"максимум {max(latencies):.2f} с, остановка loop до {max(sampler.lags) * 1000:.0f} мс"
+    )
+
+
+def main():
+    bot = import_bot()
+    server = FakeTtsServer(latency=LATENCY)
+    server.start()
+    try:
+        # Первый вызов импортирует gTTS и создает пул потоков — не учитываем
+        asyncio.run(new_tts(bot, TEXT, "ru"))
+        print(f"{REQUESTS} одновременных /tts, ответ эндпоинта {LATENCY * 1000:.0f} мс:")
+        print(f"  до:    {asyncio.run(measure(old_tts))}")
+        print(f"  после: {asyncio.run(measure(lambda text, lang: new_tts(bot, text, lang)))}")
+    finally:
+        server.stop()
+
+
+if __name__ == "__main__":
+    main()
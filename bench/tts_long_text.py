@@ -0,0 +1,76 @@
+"""
+Озвучка длинных текстов по частям против одного вызова gTTS (user-015).
+
+Локальная замена эндпоинта отвечает через LATENCY секунд на каждый запрос
+gTTS (фрагмент текста до знака препинания, не длиннее 100 символов). Сравниваются:
+  целиком:   один gTTS на весь текст — запросы идут последовательно
+  по частям: synthesize_long_speech — части по TTS_CHUNK_CHARS символов,
+             до TTS_CHUNK_CONCURRENCY одновременно, MP3 склеиваются по порядку
+
+    python bench/tts_long_text.py
+"""
+
+import asyncio
+import time
+
+from _common import FakeTtsServer, import_bot
+
+LATENCY = 0.2
+LENGTHS = (300, 1000, 3000)
+
+SENTENCES = [
+    "Напоминаю всем участникам чата о правилах группы.",
+    "Сообщения с оскорблениями удаляются без предупреждения.",
+    "Реклама и ссылки на сторонние каналы запрещены!",
+    "Вопросы по документам задавайте в закрепленной теме.",
+    "Спасибо, что помогаете друг другу?",
+]
+
+
+def make_text(length: int) -> str:
+    words = []
+    while sum(len(word) + 1 for word in words) < length:
+        words.append(SENTENCES[len(words) % len(SENTENCES)])
+    return " ".join(words)[:length]
+
+
+def run(server: FakeTtsServer, synthesize) -> str:
+    requests_before = server.requests
+    server.max_concurrent = 0
+    started = time.perf_counter()
+    audio = asyncio.run(synthesize())
+    elapsed = time.perf_counter() - started
+    return (
+        f"{elapsed:.2f} с, запросов к эндпоинту: {server.requests - requests_before}, "
+        f"одновременно до {server.max_concurrent}, {len(audio) // 1024} КБ"
+    )
+
+
+def main():
+    bot = import_bot()
+    server = FakeTtsServer(latency=LATENCY)
+    server.start()
+    try:
+        print(
+            f"ответ эндпоинта {LATENCY * 1000:.0f} мс, части по {bot.TTS_CHUNK_CHARS} символов, "
+            f"до {bot.TTS_CHUNK_CONCURRENCY} одновременно:"
+        )
+        for length in LENGTHS:
+            text = make_text(length)
+            chunks = len(bot.split_tts_text(text, bot.TTS_CHUNK_CHARS))
+
+            async def whole():
+                return await asyncio.get_running_loop().run_in_executor(bot.tts_executor, bot.synthesize_speech, text, "ru")
+
+            async def chunked():
+                return await bot.synthesize_long_speech(text, "ru")
+
+            print(f"  {length} символов, частей: {chunks}")
+            print(f"    целиком:   {run(server, whole)}")
+            print(f"    по частям: {run(server, chunked)}")
+    finally:
+        server.stop()
+
+
+if __name__ == "__main__":
+    main()
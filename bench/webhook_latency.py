@@ -0,0 +1,132 @@
+"""
+Вебхук против long polling: задержка от поступления обновления до конца обработки (user-020).
+
+Обновления из updates.json (сообщения в формате Bot API: текст, ответ, фото
+с подписью, стикер, длинный текст) по кругу отправляются боту RATE раз в
+секунду в течение DURATION секунд, каждое от нового пользователя, чтобы не
+срабатывал антифлуд. Запросы бота принимает локальная замена Bot API.
+  polling: обновления отдает getUpdates замены Bot API
+  webhook: обновления POST-запросом отправляются на вебхук-сервер бота
+Задержка считается от отправки (для polling — от появления в очереди
+getUpdates) до выхода обновления из dispatcher. Сеть до Telegram здесь не
+учитывается: в реальной работе polling добавляет еще время ответа getUpdates.
+
+    python bench/webhook_latency.py
+"""
+
+import asyncio
+import copy
+import json
+import os
+import signal
+import socket
+import subprocess
+import sys
+import time
+
+import aiohttp
+
+from _common import FakeTelegramServer, import_bot, percentile, use_api_server
+
+RATE = 100
+DURATION = 3.0
+
+with open(os.path.join(os.path.dirname(os.path.abspath(__file__)), "updates.json"), encoding="utf-8") as f:
+    RECORDED_UPDATES = json.load(f)
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def make_updates(count: int):
+    """Копии записанных обновлений с новыми id, временем и отправителем"""
+    updates = []
+    for number in range(1, count + 1):
+        update = copy.deepcopy(RECORDED_UPDATES[number % len(RECORDED_UPDATES)])
+        update["update_id"] = number
+        message = update["message"]
+        message["message_id"] = number
+        message["date"] = int(time.time()) + 1
+        message["from"]["id"] = 100000 + number
+        updates.append(update)
+    return updates
+
+
+async def run_child(mode: str) -> dict:
+    port = free_port()
+    # Прогрев lingua на первом обновлении останавливает loop на ~0.5 с (см. startup.py) и попадает
+    # в задержку того режима, где в этот момент обновление уже в пути, поэтому здесь он выключен
+    env = {"LANG_WARMUP": "false"}
+    if mode == "webhook":
+        env.update(WEBHOOK_URL="http://127.0.0.1", WEBAPP_HOST="127.0.0.1", WEBAPP_PORT=port)
+    bot = import_bot(**env)
+    server = FakeTelegramServer()
+    use_api_server(bot, await server.start())
+
+    handled = {}
+
+    @bot.dp.update.outer_middleware()
+    async def record_handled(handler, update, data):
+        try:
+            return await handler(update, data)
+        finally:
+            handled[update.update_id] = time.perf_counter()
+
+    main_task = asyncio.create_task(bot.main())
+    ready_method = "setWebhook" if mode == "webhook" else "getUpdates"
+    while not server.calls[ready_method]:
+        await asyncio.sleep(0.01)
+    # Сообщения, отправленные до запуска, бот пропускает; даты обновлений — следующая секунда
+    await asyncio.sleep(1.2)
+
+    updates = make_updates(int(RATE * DURATION))
+    sent = {}
+    async with aiohttp.ClientSession() as session:
+        for update in updates:
+            sent[update["update_id"]] = time.perf_counter()
+            if mode == "webhook":
+                async with session.post(
+                    f"http://127.0.0.1:{port}{bot.WEBHOOK_PATH}", json=update,
+                    headers={"X-Telegram-Bot-Api-Secret-Token": bot.WEBHOOK_SECRET}
+                ) as response:
+                    await response.read()
+            else:
+                server.push(update)
+            await asyncio.sleep(1 / RATE)
+    deadline = time.perf_counter() + 10
+    while len(handled) < len(updates) and time.perf_counter() < deadline:
+        await asyncio.sleep(0.01)
+
+    if mode == "webhook":
+        os.kill(os.getpid(), signal.SIGINT)
+    else:
+        await bot.dp.stop_polling()
+    await main_task
+    await server.stop()
+    latencies = [handled[update_id] - sent[update_id] for update_id in sent if update_id in handled]
+    return {"handled": len(latencies), "sent": len(sent), "latencies": latencies, "requests": dict(server.calls)}
+
+
+def main():
+    if len(sys.argv) > 2 and sys.argv[1] == "--child":
+        print(json.dumps(asyncio.run(run_child(sys.argv[2]))))
+        return
+    print(f"{int(RATE * DURATION)} обновлений, {RATE} в секунду:")
+    for mode in ("polling", "webhook"):
+        output = subprocess.run(
+            [sys.executable, __file__, "--child", mode], capture_output=True, text=True, check=True
+        ).stdout
+        result = json.loads(output.strip().splitlines()[-1])
+        latencies = result["latencies"]
+        print(
+            f"  {mode}: обработано {result['handled']}/{result['sent']}, задержка медиана "
+            f"{percentile(latencies, 0.5) * 1000:.1f} мс, p99 {percentile(latencies, 0.99) * 1000:.1f} мс, "
+            f"максимум {max(latencies) * 1000:.1f} мс, getUpdates: {result['requests'].get('getUpdates', 0)}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -2,35 +2,278 @@ import asyncio
 import logging
 import sys
 import re
+import gzip
+import hashlib
+import heapq
+import io
 import json
+import multiprocessing
 import os
+import queue
+import secrets
+import shutil
 import signal
+import sqlite3
+import threading
 import time
+import unicodedata
+from collections import OrderedDict, deque
+from collections.abc import MutableMapping
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
 from datetime import datetime, timedelta
-from typing import Dict, Optional, List, Set, Tuple, Union
+from typing import Awaitable, Callable, Dict, Iterable, Optional, List, Set, Tuple, Union
 
 from aiogram import Bot, Dispatcher, types, F
+from aiogram.client.session.middlewares.base import BaseRequestMiddleware
+from aiogram.exceptions import TelegramRetryAfter
 from aiogram.filters import Command
-from aiogram.types import InlineKeyboardButton, InlineKeyboardMarkup, FSInputFile
-from gtts import gTTS
-import tempfile
-from lingua import Language, LanguageDetectorBuilder
+from aiogram.types import BufferedInputFile, InlineKeyboardButton, InlineKeyboardMarkup, FSInputFile
+from aiogram.methods import TelegramMethod
+from aiogram.webhook.aiohttp_server import setup_application
+from aiohttp import web
+from lingua import Language
 from dotenv import load_dotenv
 
+import language_worker
+from message_archive import MessageArchive, format_record, parse_time as parse_archive_time, parse_user
+
 # Загружаем переменные окружения
 load_dotenv()
 
+# Время запуска процесса (для замера времени до первого обновления)
+process_start_time = time.perf_counter()
+
 # Настройка логирования
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-# Создаем детектор языка
-language_detector = LanguageDetectorBuilder.from_languages(
-    Language.RUSSIAN,
-    Language.UKRAINIAN,
-    Language.ENGLISH,
-    Language.POLISH
-).with_minimum_relative_distance(0.25).build()
+# Режим пониженной точности lingua: меньше памяти и быстрее загрузка, хуже на коротких текстах
+LANG_LOW_ACCURACY = os.getenv("LANG_LOW_ACCURACY", "false").lower() == "true"
+# Загружать все языковые модели сразу при создании детектора, а не по мере надобности
+LANG_PRELOAD_MODELS = os.getenv("LANG_PRELOAD_MODELS", "false").lower() == "true"
+# Создавать детектор и загружать модели языков в фоне сразу после запуска, а не при первом определении языка
+LANG_WARMUP = os.getenv("LANG_WARMUP", "true").lower() == "true"
+# Прогрев начинается с первым обновлением или через столько секунд после запуска, если обновлений нет.
+# В пуле потоков загрузка моделей lingua держит GIL и останавливает event loop, поэтому не мешаем запуску
+LANG_WARMUP_DELAY = float(os.getenv("LANG_WARMUP_DELAY", "5"))
+
+# Пул для определения языка: "thread" или "process"
+LANG_DETECT_EXECUTOR = os.getenv("LANG_DETECT_EXECUTOR", "thread").lower()
+LANG_DETECT_WORKERS = int(os.getenv("LANG_DETECT_WORKERS", "2"))
+# Максимум одновременных задач; сверх него определение языка пропускается
+LANG_DETECT_MAX_PENDING = int(os.getenv("LANG_DETECT_MAX_PENDING", "100"))
+LANG_DETECT_TIMEOUT = float(os.getenv("LANG_DETECT_TIMEOUT", "2"))
+# Микропакеты: тексты копятся до LANG_BATCH_WINDOW_MS миллисекунд или LANG_BATCH_SIZE штук (0 — без пакетов)
+LANG_BATCH_WINDOW_MS = float(os.getenv("LANG_BATCH_WINDOW_MS", "5"))
+LANG_BATCH_SIZE = int(os.getenv("LANG_BATCH_SIZE", "32"))
+# Размер LRU-кэша результатов определения языка (0 — без кэша)
+LANG_CACHE_SIZE = int(os.getenv("LANG_CACHE_SIZE", "10000"))
+# Минимальный отрыв уверенности лучшего языка от второго, иначе язык считается неопределенным.
+# 0.25 — прежнее правило detect_language_of с with_minimum_relative_distance(0.25)
+LANG_MIN_CONFIDENCE_MARGIN = float(os.getenv("LANG_MIN_CONFIDENCE_MARGIN", "0.25"))
+
+class LanguageDetectionUnavailable(Exception):
+    """Определение языка не выполнено: очередь переполнена или истекло время ожидания"""
+
+class LanguageDetectionService:
+    """
+    Определение языка вне event loop.
+
+    Задачи lingua выполняются в пуле потоков или процессов. Число одновременных
+    задач ограничено, а ожидание результата — таймаутом; в обоих случаях
+    вызывающий получает LanguageDetectionUnavailable и использует запасной вариант.
+    Результаты кэшируются в LRU по хешу нормализованного текста.
+
+    Сами задачи лежат в модуле language_worker: процессы пула запускаются
+    через spawn и импортируют только его, а не bot.py с его побочными
+    эффектами. Настройки детектора передаются в initializer пула, он же
+    прогревает каждый процесс, если прогрев запрошен до создания пула.
+    """
+
+    def __init__(self, executor_type: str, workers: int, max_pending: int, timeout: float,
+                 batch_window: float = 0.0, batch_size: int = 1, cache_size: int = 0,
+                 worker_settings: Optional[Dict[str, object]] = None):
+        self.executor_type = executor_type
+        self.worker_settings = worker_settings or {}
+        self.warm_workers = False
+        self.workers = workers
+        self.max_pending = max_pending
+        self.timeout = timeout
+        self.batch_window = batch_window
+        self.batch_size = batch_size
+        self.cache_size = cache_size
+        self.pending = 0
+        self.completed = 0
+        self.rejected = 0
+        self.timeouts = 0
+        self.batches = 0
+        self.batched_texts = 0
+        self.cache_hits = 0
+        self.cache_misses = 0
+        self.cache_evictions = 0
+        self._cache: OrderedDict[int, Tuple[Optional[str], float]] = OrderedDict()
+        self._executor: Optional[Executor] = None
+        self._batch: List[Tuple[str, asyncio.Future]] = []
+        self._batch_timer: Optional[asyncio.TimerHandle] = None
+
+    def _get_executor(self) -> Executor:
+        if self._executor is None:
+            if self.executor_type == "process":
+                self._executor = ProcessPoolExecutor(
+                    max_workers=self.workers,
+                    mp_context=multiprocessing.get_context("spawn"),
+                    initializer=language_worker.init_worker,
+                    initargs=(self.worker_settings, self.warm_workers)
+                )
+            else:
+                language_worker.configure(self.worker_settings)
+                self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="lang-detect")
+        return self._executor
+
+    def _job_done(self, _future):
+        self.pending -= 1
+        self.completed += 1
+
+    async def _run(self, job: Callable, argument):
+        if self.pending >= self.max_pending:
+            self.rejected += 1
+            raise LanguageDetectionUnavailable("очередь определения языка переполнена")
+        loop = asyncio.get_running_loop()
+        future = loop.run_in_executor(self._get_executor(), job, argument)
+        self.pending += 1
+        future.add_done_callback(self._job_done)
+        try:
+            # shield: задача продолжит выполняться в пуле, но место в очереди освободится только по ее завершении
+            return await asyncio.wait_for(asyncio.shield(future), self.timeout)
+        except asyncio.TimeoutError:
+            self.timeouts += 1
+            raise LanguageDetectionUnavailable("истекло время определения языка")
+
+    def _cache_get(self, key: int) -> Optional[Tuple[Optional[str], float]]:
+        result = self._cache.get(key)
+        if result is None:
+            self.cache_misses += 1
+            return None
+        self._cache.move_to_end(key)
+        self.cache_hits += 1
+        return result
+
+    def _cache_put(self, key: int, result: Tuple[Optional[str], float]):
+        if self.cache_size <= 0:
+            return
+        self._cache[key] = result
+        self._cache.move_to_end(key)
+        while len(self._cache) > self.cache_size:
+            self._cache.popitem(last=False)
+            self.cache_evictions += 1
+
+    async def detect_with_confidence(self, text: str) -> Tuple[Optional[Language], float]:
+        """Определяет язык текста и уверенность в нем"""
+        key = digest64(normalize_text(text))
+        result = self._cache_get(key)
+        if result is None:
+            if self.batch_window <= 0 or self.batch_size <= 1:
+                result = await self._run(language_worker.detect_language, text)
+            else:
+                result = await self._enqueue(text)
+            self._cache_put(key, result)
+        name, confidence = result
+        return (getattr(Language, name) if name else None), confidence
+
+    async def detect(self, text: str) -> Optional[Language]:
+        """Определяет язык текста"""
+        detected, _ = await self.detect_with_confidence(text)
+        return detected
+
+    def _enqueue(self, text: str) -> asyncio.Future:
+        """Добавляет текст в текущий микропакет"""
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._batch.append((text, future))
+        if len(self._batch) >= self.batch_size:
+            self._flush_batch()
+        elif self._batch_timer is None:
+            self._batch_timer = loop.call_later(self.batch_window, self._flush_batch)
+        return future
+
+    def _flush_batch(self):
+        """Отправляет накопленные тексты на определение одним вызовом"""
+        if self._batch_timer is not None:
+            self._batch_timer.cancel()
+            self._batch_timer = None
+        batch, self._batch = self._batch, []
+        if batch:
+            asyncio.create_task(self._process_batch(batch))
+
+    async def _process_batch(self, batch: List[Tuple[str, asyncio.Future]]):
+        self.batches += 1
+        self.batched_texts += len(batch)
+        try:
+            results = await self._run(language_worker.detect_languages_batch, [text for text, _ in batch])
+        except Exception as e:
+            for _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+        for (_, future), result in zip(batch, results):
+            if not future.done():
+                future.set_result(result)
+
+    def stats_lines(self) -> List[str]:
+        lines = [
+            f"Пул: {self.executor_type} x{self.workers}, в работе: {self.pending}/{self.max_pending}",
+            f"Выполнено: {self.completed}, отклонено: {self.rejected}, таймаутов: {self.timeouts}",
+        ]
+        if self.batches:
+            lines.append(f"Пакетов: {self.batches}, средний размер: {self.batched_texts / self.batches:.1f}")
+        lookups = self.cache_hits + self.cache_misses
+        if lookups:
+            lines.append(
+                f"Кэш: {len(self._cache)}/{self.cache_size}, попаданий: {self.cache_hits} "
+                f"({self.cache_hits / lookups:.0%}), промахов: {self.cache_misses}, вытеснено: {self.cache_evictions}"
+            )
+        return lines
+
+    async def warm_up(self):
+        """
+        Создает детектор и загружает модели в фоне, чтобы первое определение языка не ждало.
+
+        В пуле процессов каждый процесс прогревается в initializer, а задачи по числу
+        процессов заставляют пул запустить их все сразу. В пуле потоков загрузка моделей
+        держит GIL, поэтому каждый язык загружается отдельной задачей и event loop
+        успевает обрабатывать обновления между ними.
+        """
+        self.warm_workers = True
+        loop = asyncio.get_running_loop()
+        started = time.perf_counter()
+        try:
+            if self.executor_type == "process":
+                await asyncio.gather(*(
+                    loop.run_in_executor(self._get_executor(), language_worker.warm_up, None)
+                    for _ in range(self.workers)
+                ))
+            else:
+                for text in language_worker.WARM_UP_TEXTS:
+                    await loop.run_in_executor(self._get_executor(), language_worker.detect_language, text)
+            logger.info(f"Детектор языка прогрет за {time.perf_counter() - started:.2f} с")
+        except Exception as e:
+            logger.error(f"Ошибка при прогреве детектора языка: {e}")
+
+    def shutdown(self):
+        """Останавливает пул, не дожидаясь незавершенных задач"""
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+language_service = LanguageDetectionService(
+    LANG_DETECT_EXECUTOR, LANG_DETECT_WORKERS, LANG_DETECT_MAX_PENDING, LANG_DETECT_TIMEOUT,
+    batch_window=LANG_BATCH_WINDOW_MS / 1000, batch_size=LANG_BATCH_SIZE, cache_size=LANG_CACHE_SIZE,
+    worker_settings={
+        "low_accuracy": LANG_LOW_ACCURACY,
+        "preload_models": LANG_PRELOAD_MODELS,
+        "min_confidence_margin": LANG_MIN_CONFIDENCE_MARGIN,
+    }
+)
 
 # Флаг для отслеживания состояния бота
 is_running = True
@@ -66,9 +309,11 @@ BINDS_FILE = "binds.json"  # Файл для хранения биндов
 
 # Хранилище активных голосований: vote_id -> (set of voters, message_id, chat_id, end_time)
 active_votes: Dict[str, Tuple[Set[int], int, int, datetime]] = {}
+# Голосования, по которым уже выдается предупреждение (между набором голосов и end_vote есть await)
+settling_votes: Set[str] = set()
 
-# Хранилище для отслеживания флуда: chat_id -> {user_id -> {"messages": [(timestamp, message_id)], "last_long_msg": (timestamp, message_id)}}
-flood_history: Dict[int, Dict[int, Dict[str, Union[List[Tuple[float, int]], Optional[Tuple[float, int]]]]]] = {}
+# Хранилище для отслеживания флуда: chat_id -> {user_id -> FloodState}
+flood_history: Dict[int, Dict[int, "FloodState"]] = {}
 
 # Хранилище сообщений, отправленных через /send
 sent_messages: Set[int] = set()
@@ -98,6 +343,638 @@ links_mode_counter: Optional[int] = None  # Счетчик для режима 
 # Состояние украинского режима: chat_id -> end_time
 ua_mode: Dict[int, datetime] = {}
 
+# Источники статистики для команды /stats: раздел -> функция, возвращающая строки отчета
+stats_providers: Dict[str, Callable[[], List[str]]] = {}
+
+# Хранилище состояния модерации: "json" (по умолчанию) или "sqlite"
+STORAGE_BACKEND = os.getenv("STORAGE_BACKEND", "json").lower()
+SQLITE_DB_FILE = os.getenv("SQLITE_DB_FILE", "moderation.db")
+
+# Интервал (в секундах), с которым накопленные изменения сбрасываются на диск
+STORAGE_FLUSH_INTERVAL = float(os.getenv("STORAGE_FLUSH_INTERVAL", "2"))
+
+class WriteBehindStore:
+    """
+    Отложенная запись JSON-файлов.
+
+    Сохранение только помечает файл как измененный. Фоновая задача раз в
+    STORAGE_FLUSH_INTERVAL секунд снимает копии измененных данных в event loop,
+    а сериализацию и запись выполняет в пуле потоков. Файл пишется атомарно:
+    временный файл + fsync + rename. Сбросы выполняются строго по очереди:
+    снимок берется только после завершения предыдущей записи, поэтому более
+    старый снимок не может перезаписать более новый.
+    """
+
+    def __init__(self, interval: float):
+        self.interval = interval
+        self._snapshots: Dict[str, Tuple[Callable[[], object], int]] = {}
+        self._dirty: Set[str] = set()
+        self._flush_lock = asyncio.Lock()
+        self._stopping = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+
+    def register(self, path: str, snapshot: Callable[[], object], indent: int = 2):
+        """Регистрирует файл и функцию, возвращающую копию данных для записи"""
+        self._snapshots[path] = (snapshot, indent)
+
+    def mark_dirty(self, path: str):
+        """Помечает файл как требующий записи"""
+        self._dirty.add(path)
+
+    def mark_all_dirty(self):
+        """Помечает все зарегистрированные файлы как требующие записи"""
+        self._dirty.update(self._snapshots)
+
+    def _take_batch(self) -> List[Tuple[str, object, int]]:
+        dirty, self._dirty = self._dirty, set()
+        batch = []
+        for path in dirty:
+            snapshot, indent = self._snapshots[path]
+            batch.append((path, snapshot(), indent))
+        return batch
+
+    def _write_batch(self, batch: List[Tuple[str, object, int]]) -> List[str]:
+        """Записывает пачку файлов, возвращает пути, которые не удалось записать"""
+        failed = []
+        for path, data, indent in batch:
+            try:
+                atomic_write_json(path, data, indent)
+            except Exception as e:
+                logger.error(f"Ошибка при сохранении {path}: {e}")
+                failed.append(path)
+        return failed
+
+    async def flush(self) -> bool:
+        """
+        Сбрасывает измененные данные на диск вне event loop.
+        Возвращает True, если все, что было помечено до вызова, записано.
+        """
+        async with self._flush_lock:
+            batch = self._take_batch()
+            if not batch:
+                return True
+            loop = asyncio.get_running_loop()
+            failed = await loop.run_in_executor(None, self._write_batch, batch)
+            # Неудачные записи повторим при следующем сбросе
+            self._dirty.update(failed)
+            return not failed
+
+    async def _run(self):
+        while not self._stopping.is_set():
+            try:
+                await asyncio.wait_for(self._stopping.wait(), self.interval)
+            except asyncio.TimeoutError:
+                pass
+            try:
+                await self.flush()
+            except Exception as e:
+                logger.error(f"Ошибка при фоновом сохранении данных: {e}")
+
+    def start(self):
+        """Запускает фоновую задачу сброса"""
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        """Останавливает фоновую задачу и записывает оставшиеся изменения"""
+        if self._task is not None:
+            # Задачу не отменяем: запись, уже идущая в потоке, должна закончиться до финального сброса
+            self._stopping.set()
+            await self._task
+            self._task = None
+        await self.flush()
+
+def atomic_write_json(path: str, data, indent: int = 2):
+    """Атомарно записывает JSON: временный файл, fsync и замена исходного"""
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(data, f, ensure_ascii=False, indent=indent)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+
+def _write_through_class(base: type, methods: Tuple[str, ...]) -> type:
+    """Создает подкласс dict/list, который после каждого изменения вызывает self._commit()"""
+    namespace = {}
+    for name in methods:
+        def method(self, *args, _name=name, **kwargs):
+            result = getattr(base, _name)(self, *args, **kwargs)
+            self._commit()
+            return result
+        namespace[name] = method
+    return type(f"WriteThrough{base.__name__.capitalize()}", (base,), namespace)
+
+_WriteThroughDict = _write_through_class(dict, (
+    "__setitem__", "__delitem__", "__ior__", "update", "pop", "popitem", "setdefault", "clear"
+))
+_WriteThroughList = _write_through_class(list, (
+    "__setitem__", "__delitem__", "__iadd__", "__imul__", "append", "extend", "insert",
+    "remove", "pop", "clear", "sort", "reverse"
+))
+
+def _write_through(value, commit: Callable[[], None]):
+    """Оборачивает вложенные dict/list так, что любое их изменение вызывает commit"""
+    if isinstance(value, dict):
+        wrapped = _WriteThroughDict((key, _write_through(item, commit)) for key, item in value.items())
+    elif isinstance(value, list):
+        wrapped = _WriteThroughList(_write_through(item, commit) for item in value)
+    else:
+        return value
+    wrapped._commit = commit
+    return wrapped
+
+class SqliteTable(MutableMapping):
+    """
+    Таблица SQLite с интерфейсом словаря.
+
+    Чтение выполняет точечный запрос по первичному ключу, а каждое изменение —
+    upsert одной строки, поэтому ни загрузка, ни запись не зависят от общего
+    количества записей. Значения-словари и списки возвращаются обертками,
+    которые сохраняют строку заново при изменении на месте (например,
+    table[key]["reason"] = ... или table[key].append(...)).
+    """
+
+    def __init__(self, conn: sqlite3.Connection, table: str, key_column: str,
+                 value_columns: Tuple[str, ...],
+                 encode: Callable[[object], tuple], decode: Callable[[tuple], object]):
+        self._conn = conn
+        self._table = table
+        self._key = key_column
+        self._encode = encode
+        self._decode = decode
+        columns = ", ".join(value_columns)
+        placeholders = ", ".join("?" for _ in value_columns)
+        updates = ", ".join(f"{c} = excluded.{c}" for c in value_columns)
+        self._select_sql = f"SELECT {columns} FROM {table} WHERE {key_column} = ?"
+        self._upsert_sql = (
+            f"INSERT INTO {table} ({key_column}, {columns}) VALUES (?, {placeholders}) "
+            f"ON CONFLICT({key_column}) DO UPDATE SET {updates}"
+        )
+
+    def __getitem__(self, key):
+        row = self._conn.execute(self._select_sql, (key,)).fetchone()
+        if row is None:
+            raise KeyError(key)
+        value = self._decode(row)
+        if not isinstance(value, (dict, list)):
+            return value
+
+        def commit():
+            self[key] = root
+
+        root = _write_through(value, commit)
+        return root
+
+    def __setitem__(self, key, value):
+        self._conn.execute(self._upsert_sql, (key, *self._encode(value)))
+
+    def __delitem__(self, key):
+        cursor = self._conn.execute(f"DELETE FROM {self._table} WHERE {self._key} = ?", (key,))
+        if cursor.rowcount == 0:
+            raise KeyError(key)
+
+    def __contains__(self, key):
+        return self._conn.execute(
+            f"SELECT 1 FROM {self._table} WHERE {self._key} = ?", (key,)
+        ).fetchone() is not None
+
+    def __iter__(self):
+        return iter([row[0] for row in self._conn.execute(f"SELECT {self._key} FROM {self._table}")])
+
+    def __len__(self):
+        return self._conn.execute(f"SELECT COUNT(*) FROM {self._table}").fetchone()[0]
+
+def _encode_bot_mute(mute_data) -> tuple:
+    # Перманентный мут хранится как NULL, чтобы индекс по сроку содержал только конечные значения
+    if not isinstance(mute_data, dict):
+        mute_data = {"until": mute_data, "exclusive": False}
+    until = mute_data["until"]
+    return (None if until == float('inf') else until, int(bool(mute_data.get("exclusive", False))))
+
+def _decode_bot_mute(row: tuple) -> Dict[str, Union[float, bool]]:
+    until, exclusive = row
+    return {"until": float('inf') if until is None else until, "exclusive": bool(exclusive)}
+
+class SqliteStore:
+    """
+    Хранилище состояния модерации в SQLite (режим WAL).
+
+    Изменения пишутся построчно в момент присваивания, поэтому пометки
+    «данные изменены» здесь не нужны. При первом запуске данные однократно
+    переносятся из JSON-файлов.
+    """
+
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT);
+        CREATE TABLE IF NOT EXISTS warnings (user_id INTEGER PRIMARY KEY, count INTEGER NOT NULL);
+        CREATE TABLE IF NOT EXISTS mute_history (user_id INTEGER PRIMARY KEY, value INTEGER NOT NULL);
+        CREATE TABLE IF NOT EXISTS bot_mute (
+            user_id INTEGER PRIMARY KEY,
+            until REAL,
+            exclusive INTEGER NOT NULL DEFAULT 0
+        );
+        CREATE INDEX IF NOT EXISTS idx_bot_mute_until ON bot_mute (until);
+        CREATE TABLE IF NOT EXISTS binds (content_id TEXT PRIMARY KEY, command TEXT NOT NULL);
+        CREATE TABLE IF NOT EXISTS forbidden_content (content_id TEXT PRIMARY KEY, data TEXT NOT NULL);
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.conn = sqlite3.connect(path, isolation_level=None)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.executescript(self.SCHEMA)
+        self.warnings = SqliteTable(
+            self.conn, "warnings", "user_id", ("count",),
+            lambda value: (value,), lambda row: row[0]
+        )
+        self.mute_history = SqliteTable(
+            self.conn, "mute_history", "user_id", ("value",),
+            lambda value: (value,), lambda row: row[0]
+        )
+        self.bot_mute = SqliteTable(
+            self.conn, "bot_mute", "user_id", ("until", "exclusive"),
+            _encode_bot_mute, _decode_bot_mute
+        )
+        self.binds = SqliteTable(
+            self.conn, "binds", "content_id", ("command",),
+            lambda value: (value,), lambda row: row[0]
+        )
+        self.forbidden_content = SqliteTable(
+            self.conn, "forbidden_content", "content_id", ("data",),
+            lambda value: (json.dumps(value, ensure_ascii=False),), lambda row: json.loads(row[0])
+        )
+        self.migrate_from_json()
+
+    def migrate_from_json(self):
+        """Однократно переносит данные из JSON-файлов в базу"""
+        if self.conn.execute("SELECT 1 FROM meta WHERE key = 'migrated_from_json'").fetchone():
+            return
+
+        def read(path: str) -> dict:
+            try:
+                if os.path.exists(path):
+                    with open(path, 'r', encoding='utf-8') as f:
+                        return json.load(f)
+            except Exception as e:
+                logger.error(f"Ошибка при чтении {path} для миграции: {e}")
+            return {}
+
+        def parse_until(value) -> float:
+            return float('inf') if value == "inf" else float(value)
+
+        self.conn.execute("BEGIN")
+        try:
+            for user_id, count in read(WARNINGS_FILE).items():
+                self.warnings[int(user_id)] = count
+            for user_id, value in read(MUTE_HISTORY_FILE).items():
+                self.mute_history[int(user_id)] = value
+            for user_id, mute_data in read(BOT_MUTE_FILE).items():
+                if isinstance(mute_data, dict):
+                    mute_data = {
+                        "until": parse_until(mute_data.get("until")),
+                        "exclusive": mute_data.get("exclusive", False)
+                    }
+                else:
+                    mute_data = {"until": parse_until(mute_data), "exclusive": False}
+                self.bot_mute[int(user_id)] = mute_data
+            for content_id, command in read(BINDS_FILE).items():
+                self.binds[content_id] = command
+            for content_id, data in read(FORBIDDEN_CONTENT_FILE).items():
+                self.forbidden_content[content_id] = data
+            self.conn.execute("INSERT INTO meta (key, value) VALUES ('migrated_from_json', ?)",
+                              (str(time.time()),))
+            self.conn.execute("COMMIT")
+            logger.info(f"Данные из JSON-файлов перенесены в {self.path}")
+        except Exception:
+            self.conn.execute("ROLLBACK")
+            raise
+
+    def purge_expired_bot_mutes(self, now: float) -> int:
+        """Удаляет истекшие botmute по индексу срока, возвращает количество удаленных"""
+        cursor = self.conn.execute("DELETE FROM bot_mute WHERE until IS NOT NULL AND until <= ?", (now,))
+        return cursor.rowcount
+
+    def register(self, path: str, snapshot: Callable[[], object], indent: int = 2):
+        """Совместимость с WriteBehindStore: данные уже пишутся построчно"""
+
+    def mark_dirty(self, path: str):
+        """Совместимость с WriteBehindStore: данные уже пишутся построчно"""
+
+    def mark_all_dirty(self):
+        """Совместимость с WriteBehindStore: данные уже пишутся построчно"""
+
+    async def flush(self) -> bool:
+        """Совместимость с WriteBehindStore: данные уже пишутся построчно"""
+        return True
+
+    def start(self):
+        """Совместимость с WriteBehindStore: фоновая запись не нужна"""
+
+    async def stop(self):
+        """Закрывает соединение с базой"""
+        self.conn.close()
+
+if STORAGE_BACKEND == "sqlite":
+    storage = SqliteStore(SQLITE_DB_FILE)
+else:
+    storage = WriteBehindStore(STORAGE_FLUSH_INTERVAL)
+
+# Событие журнала -> (хранилище, действие)
+JOURNAL_OPS: Dict[str, Tuple[str, str]] = {
+    "warn": ("warnings", "set"),
+    "unwarn": ("warnings", "set"),
+    "reset": ("warnings", "set"),
+    "clear": ("warnings", "delete"),
+    "mute": ("mute_history", "set"),
+    "unmute": ("mute_history", "delete"),
+    "botmute": ("bot_mute", "set"),
+    "unbotmute": ("bot_mute", "delete"),
+}
+
+class EventJournal:
+    """
+    Журнал событий модерации (только дозапись).
+
+    Каждое изменение предупреждений, истории мутов и botmute дописывается одной
+    строкой JSON. При запуске журнал проигрывается поверх снимка, а при сжатии
+    текущий сегмент закрывается, снимок сохраняется, и сегмент уходит в архив,
+    так что полная история остается доступной для аудита. Файл открывается
+    при запуске бота (или при первом событии), а не при импорте.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.events_since_compaction = 0
+        self._file = None
+
+    def open(self):
+        """Открывает журнал для дозаписи"""
+        if self._file is not None:
+            return
+        self._file = open(self.path, 'a', encoding='utf-8')
+        # Оборванная при аварии строка не должна склеиться со следующим событием
+        if self._file.tell() and not self._ends_with_newline():
+            self._file.write("\n")
+            self._file.flush()
+
+    def _ends_with_newline(self) -> bool:
+        with open(self.path, 'rb') as f:
+            f.seek(-1, os.SEEK_END)
+            return f.read(1) == b"\n"
+
+    def append(self, op: str, user_id: int, value=None):
+        """Дописывает событие в журнал"""
+        if op not in JOURNAL_OPS:
+            raise ValueError(f"Неизвестное событие журнала: {op}")
+        event = {"ts": time.time(), "op": op, "user_id": user_id}
+        if value is not None:
+            event["value"] = value
+        try:
+            self.open()
+            self._file.write(json.dumps(event, ensure_ascii=False) + "\n")
+            self._file.flush()
+            self.events_since_compaction += 1
+        except Exception as e:
+            logger.error(f"Ошибка при записи события {op} в журнал: {e}")
+
+    def _pending_segments(self) -> List[str]:
+        """Сегменты, снимок для которых еще не подтвержден"""
+        directory = os.path.dirname(self.path) or "."
+        prefix = os.path.basename(self.path) + ".pending-"
+        return sorted(
+            os.path.join(directory, name) for name in os.listdir(directory) if name.startswith(prefix)
+        )
+
+    def replay(self, tables: Dict[str, MutableMapping]) -> int:
+        """Проигрывает неподтвержденные сегменты и текущий журнал, возвращает число событий"""
+        applied = 0
+        for path in self._pending_segments() + [self.path]:
+            if not os.path.exists(path):
+                continue
+            with open(path, 'r', encoding='utf-8') as f:
+                for line_number, line in enumerate(f, 1):
+                    try:
+                        event = json.loads(line)
+                        table_name, action = JOURNAL_OPS[event["op"]]
+                    except (ValueError, KeyError) as e:
+                        # Оборванная последняя строка после аварийного завершения
+                        logger.error(f"Пропущена поврежденная запись {path}:{line_number}: {e}")
+                        continue
+                    table = tables[table_name]
+                    user_id = event["user_id"]
+                    if action == "set":
+                        table[user_id] = decode_journal_value(table_name, event.get("value"))
+                    elif user_id in table:
+                        del table[user_id]
+                    applied += 1
+        return applied
+
+    async def compact(self):
+        """Сохраняет снимок состояния и переносит текущий сегмент журнала в архив"""
+        pending_path = f"{self.path}.pending-{time.time_ns()}"
+        self.open()
+        self._file.close()
+        os.replace(self.path, pending_path)
+        self._file = open(self.path, 'a', encoding='utf-8')
+        self.events_since_compaction = 0
+
+        # Сбросы идут по очереди, поэтому снимок будет взят уже после ротации и покроет все
+        # события закрытого сегмента. Сегмент уходит в архив только после успешной записи этого снимка
+        storage.mark_all_dirty()
+        if not await storage.flush():
+            logger.error("Снимок не сохранен, сегмент журнала будет проигран при следующем запуске")
+            return
+
+        for path in self._pending_segments():
+            archive_path = path.replace(".pending-", ".", 1)
+            os.replace(path, archive_path)
+        logger.info("Журнал событий сжат")
+
+    async def run_compaction(self, interval: float, max_events: int):
+        """Периодически сжимает журнал"""
+        last_compaction = time.monotonic()
+        while True:
+            await asyncio.sleep(min(interval, 60))
+            if not self.events_since_compaction:
+                continue
+            if (self.events_since_compaction >= max_events
+                    or time.monotonic() - last_compaction >= interval):
+                try:
+                    await self.compact()
+                except Exception as e:
+                    logger.error(f"Ошибка при сжатии журнала событий: {e}")
+                last_compaction = time.monotonic()
+
+    def close(self):
+        """Сбрасывает журнал на диск и закрывает файл"""
+        if self._file is None or self._file.closed:
+            return
+        try:
+            self._file.flush()
+            os.fsync(self._file.fileno())
+        finally:
+            self._file.close()
+
+def encode_journal_value(value):
+    """Готовит значение для записи в журнал (бесконечный срок botmute хранится как "inf")"""
+    if isinstance(value, dict) and value.get("until") == float('inf'):
+        return {**value, "until": "inf"}
+    return value
+
+def decode_journal_value(table_name: str, value):
+    """Восстанавливает значение из журнала"""
+    if table_name == "bot_mute" and isinstance(value, dict) and value.get("until") == "inf":
+        return {**value, "until": float('inf')}
+    return value
+
+def record_event(op: str, user_id: int, value=None):
+    """Записывает событие модерации в журнал"""
+    journal.append(op, user_id, encode_journal_value(value))
+
+JOURNAL_FILE = os.getenv("JOURNAL_FILE", "events.jsonl")
+# Журнал сжимается раз в JOURNAL_COMPACT_INTERVAL секунд или после JOURNAL_COMPACT_EVENTS событий
+JOURNAL_COMPACT_INTERVAL = float(os.getenv("JOURNAL_COMPACT_INTERVAL", "3600"))
+JOURNAL_COMPACT_EVENTS = int(os.getenv("JOURNAL_COMPACT_EVENTS", "10000"))
+
+journal = EventJournal(JOURNAL_FILE)
+
+TIMERS_FILE = os.getenv("TIMERS_FILE", "timers.json")
+
+class TimerService:
+    """
+    Таймеры с точным срабатыванием вместо периодических проверок.
+
+    Таймер задается видом (vote_expire, ua_mode_end, ...), ключом и временем
+    срабатывания (unix time). Все таймеры лежат в одной куче, фоновая задача
+    спит до ближайшего и вызывает обработчик его вида. Повторное назначение
+    таймера с тем же видом и ключом заменяет прежний. Ожидающие таймеры
+    сохраняются в файл и после перезапуска срабатывают (просроченные — сразу).
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.handlers: Dict[str, Callable[[str, dict], Awaitable[None]]] = {}
+        # (вид, ключ) -> (время срабатывания, порядковый номер, данные)
+        self.timers: Dict[Tuple[str, str], Tuple[float, int, dict]] = {}
+        self._heap: List[Tuple[float, int, str, str]] = []
+        self._seq = 0
+        self._wakeup: Optional[asyncio.Event] = None
+        self._task: Optional[asyncio.Task] = None
+        self.fired = 0
+        self.store = WriteBehindStore(STORAGE_FLUSH_INTERVAL)
+        self.store.register(path, self._snapshot)
+        self._load()
+
+    def _load(self):
+        try:
+            if os.path.exists(self.path):
+                with open(self.path, 'r', encoding='utf-8') as f:
+                    for entry in json.load(f):
+                        self._push(entry["kind"], entry["key"], float(entry["when"]), entry.get("data") or {})
+                logger.info(f"Загружено таймеров: {len(self.timers)}")
+        except Exception as e:
+            logger.error(f"Ошибка при загрузке таймеров: {e}")
+
+    def _snapshot(self) -> List[dict]:
+        return [
+            {"kind": kind, "key": key, "when": when, "data": data}
+            for (kind, key), (when, _, data) in self.timers.items()
+        ]
+
+    def _push(self, kind: str, key: str, when: float, data: dict):
+        self._seq += 1
+        self.timers[(kind, key)] = (when, self._seq, data)
+        heapq.heappush(self._heap, (when, self._seq, kind, key))
+
+    def register_handler(self, kind: str, handler: Callable[[str, dict], Awaitable[None]]):
+        """Регистрирует обработчик таймеров вида kind"""
+        self.handlers[kind] = handler
+
+    def pending(self, kind: str) -> List[Tuple[str, float, dict]]:
+        """Возвращает ожидающие таймеры вида kind: (ключ, время, данные)"""
+        return [(key, when, data) for (k, key), (when, _, data) in self.timers.items() if k == kind]
+
+    def schedule(self, kind: str, key: str, when: float, data: Optional[dict] = None):
+        """Назначает (или переназначает) таймер"""
+        self._push(kind, key, when, data or {})
+        self.store.mark_dirty(self.path)
+        # Будим фоновую задачу, если новый таймер раньше текущего ближайшего
+        if self._wakeup is not None and self._heap[0][1] == self._seq:
+            self._wakeup.set()
+
+    def cancel(self, kind: str, key: str) -> bool:
+        """Отменяет таймер; запись в куче удаляется лениво при срабатывании"""
+        if self.timers.pop((kind, key), None) is None:
+            return False
+        self.store.mark_dirty(self.path)
+        return True
+
+    def _is_current(self, seq: int, kind: str, key: str) -> bool:
+        """Не отменен и не переназначен ли таймер, которому соответствует запись кучи"""
+        current = self.timers.get((kind, key))
+        return current is not None and current[1] == seq
+
+    def _pop_due(self, now: float) -> List[Tuple[str, str, dict]]:
+        due = []
+        while self._heap and self._heap[0][0] <= now:
+            _, seq, kind, key = heapq.heappop(self._heap)
+            if not self._is_current(seq, kind, key):
+                continue
+            due.append((kind, key, self.timers.pop((kind, key))[2]))
+        if due:
+            self.store.mark_dirty(self.path)
+        return due
+
+    async def _fire(self, kind: str, key: str, data: dict):
+        handler = self.handlers.get(kind)
+        if handler is None:
+            logger.error(f"Нет обработчика для таймера {kind}")
+            return
+        try:
+            await handler(key, data)
+        except Exception as e:
+            logger.error(f"Ошибка при срабатывании таймера {kind} ({key}): {e}")
+
+    async def _run(self):
+        while True:
+            self._wakeup.clear()
+            for kind, key, data in self._pop_due(time.time()):
+                self.fired += 1
+                asyncio.create_task(self._fire(kind, key, data))
+            # Отбрасываем с вершины кучи записи отмененных таймеров
+            while self._heap and not self._is_current(*self._heap[0][1:]):
+                heapq.heappop(self._heap)
+            timeout = max(0.0, self._heap[0][0] - time.time()) if self._heap else None
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
+
+    def start(self):
+        """Запускает фоновую задачу таймеров и их сохранение"""
+        if self._task is None:
+            self._wakeup = asyncio.Event()
+            self._task = asyncio.create_task(self._run())
+            self.store.start()
+
+    async def stop(self):
+        """Останавливает таймеры и сохраняет ожидающие"""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        await self.store.stop()
+
+    def stats_lines(self) -> List[str]:
+        return [f"Ожидающих таймеров: {len(self.timers)}, сработало: {self.fired}"]
+
+timers = TimerService(TIMERS_FILE)
+stats_providers["Таймеры"] = timers.stats_lines
+
 # Функции для работы с JSON
 def load_data() -> tuple[Dict[int, int], Dict[int, int]]:
     warnings = {}
@@ -120,18 +997,12 @@ def load_data() -> tuple[Dict[int, int], Dict[int, int]]:
     return warnings, mute_history
 
 def save_warnings(data: Dict[int, int]):
-    try:
-        with open(WARNINGS_FILE, 'w', encoding='utf-8') as f:
-            json.dump(data, f, ensure_ascii=False, indent=2)
-    except Exception as e:
-        logger.error(f"Ошибка при сохранении предупреждений: {e}")
+    """Помечает предупреждения для отложенной записи"""
+    storage.mark_dirty(WARNINGS_FILE)
 
 def save_mute_history(data: Dict[int, int]):
-    try:
-        with open(MUTE_HISTORY_FILE, 'w', encoding='utf-8') as f:
-            json.dump(data, f, ensure_ascii=False, indent=2)
-    except Exception as e:
-        logger.error(f"Ошибка при сохранении истории мутов: {e}")
+    """Помечает историю мутов для отложенной записи"""
+    storage.mark_dirty(MUTE_HISTORY_FILE)
 
 def load_forbidden_content():
     """Загружает список запрещенного контента"""
@@ -144,12 +1015,8 @@ def load_forbidden_content():
         logger.error(f"Ошибка при загрузке списка запрещенного контента: {e}")
 
 def save_forbidden_content():
-    """Сохраняет список запрещенного контента"""
-    try:
-        with open(FORBIDDEN_CONTENT_FILE, 'w', encoding='utf-8') as f:
-            json.dump(forbidden_content, f, indent=2, ensure_ascii=False)
-    except Exception as e:
-        logger.error(f"Ошибка при сохранении списка запрещенного контента: {e}")
+    """Помечает список запрещенного контента для отложенной записи"""
+    storage.mark_dirty(FORBIDDEN_CONTENT_FILE)
 
 def get_content_id(message: types.Message) -> Optional[str]:
     """Получает уникальный идентификатор контента"""
@@ -160,12 +1027,333 @@ def get_content_id(message: types.Message) -> Optional[str]:
     return None
 
 # Загружаем данные при запуске
-warnings, mute_history = load_data()
-load_forbidden_content()
 bot_muted_users: Dict[int, int] = {}
+if isinstance(storage, SqliteStore):
+    # Записи читаются из базы по требованию, полная загрузка не нужна
+    warnings, mute_history = storage.warnings, storage.mute_history
+    forbidden_content = storage.forbidden_content
+else:
+    warnings, mute_history = load_data()
+
+    # Загружаем список запрещенного контента при запуске
+    load_forbidden_content()
+
+# Снимки берутся в event loop, поэтому фоновая запись не видит изменений посреди сериализации
+storage.register(WARNINGS_FILE, lambda: dict(warnings))
+storage.register(MUTE_HISTORY_FILE, lambda: dict(mute_history))
+storage.register(FORBIDDEN_CONTENT_FILE, lambda: dict(forbidden_content))
+
+# Кэш озвучки: каталог с MP3, предел размера и числа записей
+TTS_CACHE_DIR = os.getenv("TTS_CACHE_DIR", "tts_cache")
+TTS_CACHE_MAX_MB = float(os.getenv("TTS_CACHE_MAX_MB", "100"))
+TTS_CACHE_MAX_ENTRIES = int(os.getenv("TTS_CACHE_MAX_ENTRIES", "5000"))
+
+class TtsCache:
+    """
+    Кэш озвучки с адресацией по содержимому.
+
+    Ключ — хеш нормализованного текста и языка. Для каждого ключа хранится MP3 на
+    диске (с вытеснением давно не использованных по суммарному размеру) и file_id,
+    который Telegram вернул после первой отправки: повторная фраза отправляется
+    по file_id без синтеза и загрузки.
+    """
+
+    def __init__(self, directory: str, max_bytes: int, max_entries: int):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.max_entries = max_entries
+        self.index_path = os.path.join(directory, "index.json")
+        self.file_id_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.evictions = 0
+        # Ключ -> {"size": размер MP3 (0, если файла нет), "last_used": время, "file_id": file_id}
+        self.entries: OrderedDict[str, Dict[str, object]] = OrderedDict()
+        try:
+            if os.path.exists(self.index_path):
+                with open(self.index_path, 'r', encoding='utf-8') as f:
+                    loaded = json.load(f)
+                for key, entry in sorted(loaded.items(), key=lambda item: item[1].get("last_used", 0)):
+                    self.entries[key] = entry
+        except Exception as e:
+            logger.error(f"Ошибка при загрузке индекса кэша озвучки: {e}")
+        self.store = WriteBehindStore(STORAGE_FLUSH_INTERVAL)
+        self.store.register(self.index_path, lambda: {key: dict(entry) for key, entry in self.entries.items()})
+
+    def start(self):
+        """Создает каталог кэша и запускает фоновое сохранение индекса (при запуске бота, а не при импорте)"""
+        os.makedirs(self.directory, exist_ok=True)
+        self.store.start()
+
+    @staticmethod
+    def make_key(text: str, lang: str) -> str:
+        normalized = " ".join(unicodedata.normalize("NFKC", text).split())
+        return hashlib.sha256(f"{lang}\n{normalized}".encode("utf-8")).hexdigest()
+
+    def audio_path(self, key: str) -> str:
+        return os.path.join(self.directory, f"{key}.mp3")
+
+    def _touch(self, key: str) -> Dict[str, object]:
+        entry = self.entries.setdefault(key, {"size": 0, "file_id": None})
+        entry["last_used"] = time.time()
+        self.entries.move_to_end(key)
+        self.store.mark_dirty(self.index_path)
+        return entry
+
+    def get_file_id(self, key: str) -> Optional[str]:
+        """Возвращает сохраненный file_id голосового сообщения"""
+        entry = self.entries.get(key)
+        if entry and entry.get("file_id"):
+            self._touch(key)
+            self.file_id_hits += 1
+            return entry["file_id"]
+        return None
+
+    def set_file_id(self, key: str, file_id: str):
+        self._touch(key)["file_id"] = file_id
+
+    def forget_file_id(self, key: str):
+        """Забывает file_id, который Telegram больше не принимает"""
+        entry = self.entries.get(key)
+        if entry:
+            entry["file_id"] = None
+            self.store.mark_dirty(self.index_path)
+
+    def get_audio_path(self, key: str) -> Optional[str]:
+        """Возвращает путь к закэшированному MP3 или None"""
+        entry = self.entries.get(key)
+        path = self.audio_path(key)
+        if entry and entry.get("size") and os.path.exists(path):
+            self._touch(key)
+            self.disk_hits += 1
+            return path
+        self.misses += 1
+        return None
+
+    @staticmethod
+    def _write_audio(path: str, data: bytes):
+        # Пишем во временный файл, чтобы в кэш не попал недописанный MP3
+        temp_path = f"{path}.tmp"
+        with open(temp_path, 'wb') as f:
+            f.write(data)
+        os.replace(temp_path, path)
+
+    async def put_audio(self, key: str, data: bytes):
+        """Сохраняет MP3 в кэш вне event loop и вытесняет старые записи при превышении лимитов"""
+        try:
+            loop = asyncio.get_running_loop()
+            await loop.run_in_executor(None, self._write_audio, self.audio_path(key), data)
+        except Exception as e:
+            logger.error(f"Ошибка при сохранении озвучки в кэш: {e}")
+            return
+        self._touch(key)["size"] = len(data)
+        self._evict()
+
+    def _evict(self):
+        total = sum(entry.get("size", 0) for entry in self.entries.values())
+        for key in list(self.entries):
+            if total <= self.max_bytes and len(self.entries) <= self.max_entries:
+                break
+            entry = self.entries[key]
+            if entry.get("size"):
+                try:
+                    os.unlink(self.audio_path(key))
+                except FileNotFoundError:
+                    pass
+                except Exception as e:
+                    logger.error(f"Ошибка при удалении файла кэша озвучки: {e}")
+                total -= entry["size"]
+                entry["size"] = 0
+                self.evictions += 1
+            # Запись с file_id полезна и без файла, пока не превышен лимит числа записей
+            if not entry.get("file_id") or len(self.entries) > self.max_entries:
+                del self.entries[key]
+        self.store.mark_dirty(self.index_path)
+
+    def stats_lines(self) -> List[str]:
+        total = self.file_id_hits + self.disk_hits + self.misses
+        if not total:
+            return []
+        size_mb = sum(entry.get("size", 0) for entry in self.entries.values()) / (1024 * 1024)
+        return [
+            f"Запросов: {total}, по file_id: {self.file_id_hits} ({self.file_id_hits / total:.0%}), "
+            f"из файла: {self.disk_hits} ({self.disk_hits / total:.0%}), синтез: {self.misses}",
+            f"Записей: {len(self.entries)}, на диске: {size_mb:.1f}/{self.max_bytes / (1024 * 1024):.0f} МБ, "
+            f"вытеснено: {self.evictions}",
+        ]
+
+def synthesize_speech(text: str, lang: str) -> bytes:
+    """Синтезирует речь в памяти (выполняется в пуле потоков: gTTS делает блокирующие HTTP-запросы)"""
+    from gtts import gTTS  # Импортируется при первом использовании, чтобы не замедлять запуск
+    buffer = io.BytesIO()
+    gTTS(text=text, lang=lang).write_to_fp(buffer)
+    return buffer.getvalue()
+
+# Длинные тексты синтезируются по частям параллельно: размер части и число одновременных запросов
+TTS_CHUNK_CHARS = int(os.getenv("TTS_CHUNK_CHARS", "200"))
+TTS_CHUNK_CONCURRENCY = int(os.getenv("TTS_CHUNK_CONCURRENCY", "4"))
+# Максимальная длина текста для озвучки
+TTS_MAX_LENGTH = int(os.getenv("TTS_MAX_LENGTH", "3000"))
 
-# Загружаем список запрещенного контента при запуске
-load_forbidden_content()
+_SENTENCE_END_RE = re.compile(r"(?<=[.!?…;])\s+")
+
+def split_tts_text(text: str, limit: int) -> List[str]:
+    """Делит текст на части не длиннее limit символов, по возможности по границам предложений"""
+    chunks = []
+    current = ""
+    for sentence in _SENTENCE_END_RE.split(text.strip()):
+        # Слишком длинное предложение делим по пробелам
+        pieces = [sentence]
+        if len(sentence) > limit:
+            pieces = []
+            piece = ""
+            for word in sentence.split():
+                if piece and len(piece) + 1 + len(word) > limit:
+                    pieces.append(piece)
+                    piece = ""
+                piece = f"{piece} {word}" if piece else word
+            if piece:
+                pieces.append(piece)
+        for piece in pieces:
+            if current and len(current) + 1 + len(piece) > limit:
+                chunks.append(current)
+                current = ""
+            current = f"{current} {piece}" if current else piece
+    if current:
+        chunks.append(current)
+    return chunks
+
+async def synthesize_long_speech(text: str, lang: str) -> bytes:
+    """Синтезирует речь, для длинных текстов — по частям параллельно, склеивая MP3 по порядку"""
+    loop = asyncio.get_running_loop()
+    chunks = split_tts_text(text, TTS_CHUNK_CHARS)
+    if len(chunks) <= 1:
+        return await loop.run_in_executor(tts_executor, synthesize_speech, text, lang)
+
+    semaphore = asyncio.Semaphore(TTS_CHUNK_CONCURRENCY)
+
+    async def synthesize_chunk(chunk: str) -> bytes:
+        async with semaphore:
+            return await loop.run_in_executor(tts_executor, synthesize_speech, chunk, lang)
+
+    # gather сохраняет порядок частей, а MP3-кадры можно склеивать последовательно
+    parts = await asyncio.gather(*(synthesize_chunk(chunk) for chunk in chunks))
+    logger.info(f"Текст озвучен по частям: {len(chunks)}")
+    return b"".join(parts)
+
+# Очередь синтеза: число одновременных синтезов и максимальная длина очереди
+TTS_WORKERS = int(os.getenv("TTS_WORKERS", "2"))
+TTS_QUEUE_SIZE = int(os.getenv("TTS_QUEUE_SIZE", "20"))
+# Потоки для блокирующих запросов gTTS. Отдельный пул, чтобы синтез не занимал пул по умолчанию,
+# в котором идут запись состояния, кэша озвучки и поиск по архиву. По умолчанию хватает на все
+# части всех одновременных синтезов
+TTS_THREADS = int(os.getenv("TTS_THREADS") or TTS_WORKERS * TTS_CHUNK_CONCURRENCY)
+
+tts_executor = ThreadPoolExecutor(max_workers=TTS_THREADS, thread_name_prefix="tts")
+
+class TtsQueueFull(Exception):
+    """Очередь синтеза речи переполнена"""
+
+class TtsScheduler:
+    """
+    Очередь синтеза речи с пулом обработчиков.
+
+    Задачи хранятся в отдельной очереди для каждого чата, а обработчики берут их
+    по кругу, поэтому один активный чат не задерживает остальные. При
+    переполнении общей очереди задача сразу отклоняется.
+    """
+
+    def __init__(self, workers: int, max_size: int):
+        self.workers = workers
+        self.max_size = max_size
+        self.size = 0
+        self.max_seen_size = 0
+        self.completed = 0
+        self.rejected = 0
+        self.skipped = 0
+        self.total_wait = 0.0  # Только по выполненным задачам, чтобы среднее делилось на completed
+        self.max_wait = 0.0
+        self._queues: Dict[int, deque] = {}
+        self._ready: deque = deque()  # Чаты с задачами в порядке обхода
+        self._has_jobs = asyncio.Event()
+        self._tasks: List[asyncio.Task] = []
+
+    async def run(self, chat_id: int, job: Callable[[], Awaitable]):
+        """Ставит задачу в очередь чата и ждет результат"""
+        if self.size >= self.max_size:
+            self.rejected += 1
+            raise TtsQueueFull()
+        future = asyncio.get_running_loop().create_future()
+        chat_queue = self._queues.get(chat_id)
+        if chat_queue is None:
+            chat_queue = self._queues[chat_id] = deque()
+            self._ready.append(chat_id)
+        chat_queue.append((time.monotonic(), job, future))
+        self.size += 1
+        self.max_seen_size = max(self.max_seen_size, self.size)
+        self._has_jobs.set()
+        return await future
+
+    def _next_job(self):
+        chat_id = self._ready.popleft()
+        chat_queue = self._queues[chat_id]
+        item = chat_queue.popleft()
+        if chat_queue:
+            self._ready.append(chat_id)
+        else:
+            del self._queues[chat_id]
+        self.size -= 1
+        return item
+
+    async def _worker(self):
+        while True:
+            while not self._ready:
+                self._has_jobs.clear()
+                await self._has_jobs.wait()
+            enqueued_at, job, future = self._next_job()
+            if future.done():
+                # Ожидавший обработчик уже отменен
+                self.skipped += 1
+                continue
+            wait = time.monotonic() - enqueued_at
+            self.total_wait += wait
+            self.max_wait = max(self.max_wait, wait)
+            try:
+                result = await job()
+            except Exception as e:
+                if not future.done():
+                    future.set_exception(e)
+            else:
+                if not future.done():
+                    future.set_result(result)
+            finally:
+                self.completed += 1
+
+    def start(self):
+        """Запускает обработчики очереди"""
+        if not self._tasks:
+            self._tasks = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+
+    async def stop(self):
+        """Останавливает обработчики очереди"""
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    def stats_lines(self) -> List[str]:
+        average_wait = self.total_wait / self.completed if self.completed else 0.0
+        return [
+            f"Очередь: {self.size}/{self.max_size} (максимум {self.max_seen_size}), чатов в очереди: {len(self._queues)}",
+            f"Выполнено: {self.completed}, отклонено: {self.rejected}, пропущено отмененных: {self.skipped}, "
+            f"ожидание в среднем {average_wait:.2f} с, максимум {self.max_wait:.2f} с",
+        ]
+
+tts_scheduler = TtsScheduler(TTS_WORKERS, TTS_QUEUE_SIZE)
+stats_providers["Очередь озвучки"] = tts_scheduler.stats_lines
+
+tts_cache = TtsCache(TTS_CACHE_DIR, int(TTS_CACHE_MAX_MB * 1024 * 1024), TTS_CACHE_MAX_ENTRIES)
+stats_providers["Озвучка"] = tts_cache.stats_lines
 
 # Регистрируем команду TTS первой
 @dp.message(Command("tts", ignore_case=True))
@@ -210,12 +1398,15 @@ async def text_to_speech(message: types.Message):
         
     logger.info(f"Получен текст для озвучивания: {text}")
     
+    if len(text) > TTS_MAX_LENGTH:
+        last_tts_use.pop(message.from_user.id, None)
+        await message.reply(f"Текст слишком длинный для озвучки (максимум {TTS_MAX_LENGTH} символов)")
+        return
+    
     try:
         # Определяем язык текста с помощью lingua
         try:
-            detected_language = language_detector.detect_language_of(text)
-            confidence_values = language_detector.compute_language_confidence_values(text)
-            confidence = next((conf for lang, conf in confidence_values if lang == detected_language), 0)
+            detected_language, confidence = await language_service.detect_with_confidence(text)
             
             logger.info(f"Определен язык текста: {detected_language} с уверенностью {confidence:.2f}")
             
@@ -241,35 +1432,60 @@ async def text_to_speech(message: types.Message):
             
         logger.info(f"Выбран язык для озвучки: {lang}")
         
-        logger.info("Начинаем преобразование текста в речь")
-        # Создаем временный файл для сохранения аудио
-        with tempfile.NamedTemporaryFile(suffix='.mp3', delete=False) as temp_file:
-            # Преобразуем текст в речь
-            tts = gTTS(text=text, lang=lang)
-            tts.save(temp_file.name)
-            logger.info("Аудио файл создан")
-            
-            # Отправляем голосовое сообщение
+        cache_key = tts_cache.make_key(text, lang)
+        
+        # Фраза уже отправлялась - пересылаем по file_id без синтеза и загрузки
+        file_id = tts_cache.get_file_id(cache_key)
+        if file_id:
             try:
-                with open(temp_file.name, 'rb') as audio:
-                    await bot.send_voice(
-                        chat_id=message.chat.id,
-                        voice=FSInputFile(temp_file.name),
-                        reply_to_message_id=message.message_id
-                    )
-            except Exception as e:
-                logger.error(f"Ошибка при отправке голосового сообщения: {e}")
-                await bot.send_message(
+                await bot.send_voice(
                     chat_id=message.chat.id,
-                    text="Не удалось отправить голосовое сообщение",
+                    voice=file_id,
                     reply_to_message_id=message.message_id
                 )
-                
-        # Удаляем временный файл
+                logger.info("Голосовое сообщение отправлено из кэша по file_id")
+                return
+            except Exception as e:
+                logger.error(f"Ошибка при отправке голосового сообщения по file_id: {e}")
+                tts_cache.forget_file_id(cache_key)
+        
+        audio_path = tts_cache.get_audio_path(cache_key)
+        if audio_path is not None:
+            voice = FSInputFile(audio_path)
+        else:
+            logger.info("Начинаем преобразование текста в речь")
+            try:
+                audio = await tts_scheduler.run(
+                    message.chat.id,
+                    lambda: synthesize_long_speech(text, lang)
+                )
+            except TtsQueueFull:
+                logger.info("Очередь озвучки переполнена, запрос отклонен")
+                # Отклоненный запрос не должен расходовать кулдаун пользователя
+                last_tts_use.pop(message.from_user.id, None)
+                await message.reply("Сейчас слишком много запросов на озвучку, попробуйте позже")
+                return
+            logger.info("Аудио создано")
+            voice = BufferedInputFile(audio, filename="voice.mp3")
+            # В кэш пишем в фоне, отправка не ждет диска
+            asyncio.create_task(tts_cache.put_audio(cache_key, audio))
+        
+        # Отправляем голосовое сообщение
         try:
-            os.unlink(temp_file.name)
+            sent_voice = await bot.send_voice(
+                chat_id=message.chat.id,
+                voice=voice,
+                reply_to_message_id=message.message_id
+            )
+            if sent_voice.voice:
+                tts_cache.set_file_id(cache_key, sent_voice.voice.file_id)
         except Exception as e:
-            logger.error(f"Ошибка при удалении временного файла: {e}")
+            logger.error(f"Ошибка при отправке голосового сообщения: {e}")
+            await bot.send_message(
+                chat_id=message.chat.id,
+                text="Не удалось отправить голосовое сообщение",
+                reply_to_message_id=message.message_id
+            )
             
     except Exception as e:
         logger.error(f"Ошибка при создании голосового сообщения: {e}")
@@ -288,7 +1504,7 @@ async def ua_mode_command(message: types.Message):
         logger.info(f"Пользователь {message.from_user.first_name} вызвал /uamode в группе {message.chat.title} ({message.chat.id})")
         
         # Проверяем права администратора
-        if not is_admin(message.from_user.id):
+        if not is_admin(message.from_user.id, message.chat.id):
             logger.info(f"Отказано в доступе пользователю {message.from_user.id}")
             try:
                 await message.delete()
@@ -347,6 +1563,7 @@ async def ua_mode_command(message: types.Message):
 
         # Устанавливаем время окончания режима
         ua_mode[message.chat.id] = datetime.now() + timedelta(minutes=duration)
+        timers.schedule("ua_mode_end", str(message.chat.id), ua_mode[message.chat.id].timestamp())
         logger.info(f"Установлено время окончания режима: {ua_mode[message.chat.id]}")
         
         # Форматируем сообщение о включении режима
@@ -371,22 +1588,179 @@ async def ua_mode_command(message: types.Message):
         except:
             pass
 
-def is_admin(user_id: int) -> bool:
-    """Проверяет, является ли пользователь администратором"""
-    return user_id in ADMIN_IDS
+async def end_ua_mode(key: str, data: dict):
+    """Выключает украинский режим по окончании времени"""
+    if ua_mode.pop(int(key), None) is not None:
+        logger.info(f"Украинский режим в чате {key} закончился")
+
+timers.register_handler("ua_mode_end", end_ua_mode)
+
+# Украинский режим, включенный до перезапуска, восстанавливаем по его таймерам
+for ua_chat_id, ua_mode_until, _ in timers.pending("ua_mode_end"):
+    ua_mode[int(ua_chat_id)] = datetime.fromtimestamp(ua_mode_until)
+
+# Кэш участников чатов: сколько секунд хранится запись участника и список администраторов чата
+CHAT_MEMBER_TTL = float(os.getenv("CHAT_MEMBER_TTL", "300"))
+CHAT_ADMINS_TTL = float(os.getenv("CHAT_ADMINS_TTL", "600"))
+CHAT_MEMBER_CACHE_SIZE = int(os.getenv("CHAT_MEMBER_CACHE_SIZE", "5000"))
+# Считать ли администраторов чата (а не только ADMIN_IDS) администраторами бота в этом чате
+HONOR_CHAT_ADMINS = os.getenv("HONOR_CHAT_ADMINS", "false").lower() == "true"
+
+ADMIN_STATUSES = {"creator", "administrator"}
+
+class ChatMemberCache:
+    """
+    Кэш getChatMember и списков администраторов с TTL.
+
+    Записи обновляются по обновлениям chat_member / my_chat_member, поэтому
+    изменения прав видны сразу, а TTL лишь страхует от пропущенных обновлений.
+    Проверка администратора чата (is_chat_admin) никогда не обращается к API:
+    устаревший список обновляется в фоне. Неудачный запрос тоже запоминается,
+    чтобы не повторять его на каждом сообщении.
+    """
 
-def can_be_restricted(user_id: int) -> bool:
+    # Через сколько секунд повторить запрос администраторов после ошибки
+    ADMINS_RETRY_INTERVAL = 60
+
+    def __init__(self, member_ttl: float, admins_ttl: float, max_size: int):
+        self.member_ttl = member_ttl
+        self.admins_ttl = admins_ttl
+        self.max_size = max_size
+        # (chat_id, user_id) -> (время истечения, участник), в порядке последнего использования
+        self.members: OrderedDict = OrderedDict()
+        # chat_id -> (время истечения, ID администраторов)
+        self.admins: Dict[int, Tuple[float, Set[int]]] = {}
+        self._admins_refreshing: Set[int] = set()
+        self.hits = 0
+        self.misses = 0
+
+    def _store_member(self, chat_id: int, member: types.ChatMember):
+        key = (chat_id, member.user.id)
+        self.members[key] = (time.time() + self.member_ttl, member)
+        self.members.move_to_end(key)
+        while len(self.members) > self.max_size:
+            self.members.popitem(last=False)
+
+    async def get_member(self, chat_id: int, user_id: int) -> types.ChatMember:
+        """getChatMember с кэшированием"""
+        key = (chat_id, user_id)
+        cached = self.members.get(key)
+        if cached is not None and cached[0] > time.time():
+            self.hits += 1
+            self.members.move_to_end(key)
+            return cached[1]
+        self.misses += 1
+        member = await bot.get_chat_member(chat_id, user_id)
+        self._store_member(chat_id, member)
+        return member
+
+    async def get_admins(self, chat_id: int) -> Set[int]:
+        """ID администраторов чата с кэшированием"""
+        cached = self.admins.get(chat_id)
+        if cached is not None and cached[0] > time.time():
+            return cached[1]
+        administrators = await bot.get_chat_administrators(chat_id)
+        admin_ids = set()
+        for member in administrators:
+            admin_ids.add(member.user.id)
+            self._store_member(chat_id, member)
+        self.admins[chat_id] = (time.time() + self.admins_ttl, admin_ids)
+        return admin_ids
+
+    def _admins_failed(self, chat_id: int, error: Exception):
+        logger.error(f"Ошибка при получении администраторов чата {chat_id}: {error}")
+        # Прежний список (или пустой) используется до повторной попытки
+        cached = self.admins.get(chat_id)
+        self.admins[chat_id] = (time.time() + self.ADMINS_RETRY_INTERVAL, cached[1] if cached else set())
+
+    async def _refresh_admins(self, chat_id: int):
+        # Просроченный список остается в кэше и используется, пока не придет новый
+        try:
+            await self.get_admins(chat_id)
+        except Exception as e:
+            self._admins_failed(chat_id, e)
+        finally:
+            self._admins_refreshing.discard(chat_id)
+
+    def is_chat_admin(self, chat_id: int, user_id: int) -> bool:
+        """Является ли пользователь администратором чата (по кэшу, без обращения к API)"""
+        cached = self.admins.get(chat_id)
+        if (cached is None or cached[0] <= time.time()) and chat_id not in self._admins_refreshing:
+            self._admins_refreshing.add(chat_id)
+            asyncio.create_task(self._refresh_admins(chat_id))
+        return cached is not None and user_id in cached[1]
+
+    def apply_update(self, update: types.ChatMemberUpdated):
+        """Обновляет кэш по обновлению chat_member или my_chat_member"""
+        chat_id = update.chat.id
+        member = update.new_chat_member
+        self._store_member(chat_id, member)
+        cached = self.admins.get(chat_id)
+        if cached is not None:
+            if member.status in ADMIN_STATUSES:
+                cached[1].add(member.user.id)
+            else:
+                cached[1].discard(member.user.id)
+
+    async def prefetch_admins(self, chat_ids: Iterable[int]):
+        """Загружает списки администраторов заранее"""
+        for chat_id in chat_ids:
+            try:
+                admin_ids = await self.get_admins(chat_id)
+                logger.info(f"Загружены администраторы чата {chat_id}: {len(admin_ids)}")
+            except Exception as e:
+                self._admins_failed(chat_id, e)
+
+    def stats_lines(self) -> List[str]:
+        total = self.hits + self.misses
+        if not total and not self.admins:
+            return []
+        return [
+            f"Запросов участника: {total}, из кэша: {self.hits / total:.0%}" if total else "Запросов участника: 0",
+            f"Записей участников: {len(self.members)}, чатов со списком администраторов: {len(self.admins)}"
+        ]
+
+chat_members = ChatMemberCache(CHAT_MEMBER_TTL, CHAT_ADMINS_TTL, CHAT_MEMBER_CACHE_SIZE)
+stats_providers["Участники чатов"] = chat_members.stats_lines
+
+@dp.chat_member()
+async def chat_member_updated(update: types.ChatMemberUpdated):
+    """Поддерживает кэш участников в актуальном состоянии"""
+    chat_members.apply_update(update)
+
+@dp.my_chat_member()
+async def bot_member_updated(update: types.ChatMemberUpdated):
+    """Права самого бота изменились: обновляем кэш и пересоздаем ссылку режима ссылок"""
+    chat_members.apply_update(update)
+    chat_links.links.pop(update.chat.id, None)
+
+def is_admin(user_id: int, chat_id: Optional[int] = None) -> bool:
+    """
+    Проверяет, является ли пользователь администратором.
+    При HONOR_CHAT_ADMINS администратором считается и администратор чата chat_id (по кэшу),
+    если это отслеживаемая группа: в личных и прочих чатах списка администраторов нет.
+    """
+    if user_id in ADMIN_IDS:
+        return True
+    # ID групп и супергрупп отрицательные
+    return (
+        HONOR_CHAT_ADMINS and chat_id is not None and chat_id < 0 and chat_id in MONITORED_GROUPS
+        and chat_members.is_chat_admin(chat_id, user_id)
+    )
+
+def can_be_restricted(user_id: int, chat_id: Optional[int] = None) -> bool:
     """Проверяет, можно ли ограничить пользователя"""
     # Нельзя ограничивать админов и самого бота
-    return not (is_admin(user_id) or user_id == BOT_ID)
+    return not (is_admin(user_id, chat_id) or user_id == BOT_ID)
 
 async def issue_warning(chat_id: int, target_user: types.User) -> str:
     """Выдает предупреждение пользователю и возвращает текст сообщения"""
-    if not can_be_restricted(target_user.id):
+    if not can_be_restricted(target_user.id, chat_id):
         return "Этого пользователя нельзя предупредить"
 
     warnings[target_user.id] = warnings.get(target_user.id, 0) + 1
     warn_count = warnings[target_user.id]
+    record_event("warn", target_user.id, warn_count)
     response = f"Выдано предупреждение пользователю {target_user.full_name}. Всего предупреждений: {warn_count}"
 
     if warn_count >= 3:
@@ -394,10 +1768,12 @@ async def issue_warning(chat_id: int, target_user: types.User) -> str:
         last_mute_duration = mute_history.get(target_user.id, 300)  # 5 минут базовый мут
         new_mute_duration = last_mute_duration * 2
         mute_history[target_user.id] = new_mute_duration
+        record_event("mute", target_user.id, new_mute_duration)
         save_mute_history(mute_history)
 
         # Сразу обнуляем варны
         warnings[target_user.id] = 0
+        record_event("reset", target_user.id, 0)
         save_warnings(warnings)
 
         until_date = datetime.now() + timedelta(seconds=new_mute_duration)
@@ -431,61 +1807,174 @@ async def issue_warning(chat_id: int, target_user: types.User) -> str:
 
     return response
 
+# deleteMessages принимает не больше 100 сообщений за вызов
+DELETE_BATCH_SIZE = 100
+
+def is_already_deleted(error: Exception) -> bool:
+    """Сообщение уже удалено (пользователем, другим админом или прошлым вызовом)"""
+    return "message to delete not found" in str(error).lower()
+
+async def delete_messages_batched(messages: Iterable[Tuple[int, int]]) -> Dict[Tuple[int, int], str]:
+    """
+    Удаляет сообщения пачками через deleteMessages
+    Принимает пары (chat_id, message_id), повторы отбрасываются
+    Возвращает {(chat_id, message_id): ошибка} для сообщений, которые остались в чате;
+    уже удаленные сообщения ошибкой не считаются
+    """
+    by_chat: Dict[int, List[int]] = {}
+    for chat_id, message_id in dict.fromkeys(messages):
+        by_chat.setdefault(chat_id, []).append(message_id)
+
+    failures: Dict[Tuple[int, int], str] = {}
+    for chat_id, message_ids in by_chat.items():
+        for start in range(0, len(message_ids), DELETE_BATCH_SIZE):
+            batch = message_ids[start:start + DELETE_BATCH_SIZE]
+            try:
+                await bot.delete_messages(chat_id, batch)
+                logger.info(f"Удалено сообщений в чате {chat_id}: {len(batch)}")
+            except Exception as e:
+                # deleteMessages не сообщает, какое именно сообщение не удалилось, поэтому уточняем по одному
+                logger.error(f"Ошибка при пакетном удалении сообщений в чате {chat_id}: {e}")
+                for message_id in batch:
+                    try:
+                        await bot.delete_message(chat_id, message_id)
+                    except Exception as single_error:
+                        if not is_already_deleted(single_error):
+                            failures[(chat_id, message_id)] = str(single_error)
+    for (chat_id, message_id), error in failures.items():
+        logger.error(f"Ошибка при удалении сообщения {message_id} в чате {chat_id}: {error}")
+    return failures
+
+# Не чаще одной правки сообщения голосования за интервал (секунды)
+VOTE_EDIT_INTERVAL = float(os.getenv("VOTE_EDIT_INTERVAL", "1"))
+
+class VoteMessageRenderer:
+    """
+    Отложенная отрисовка сообщений голосований.
+
+    Обработчики только задают желаемое состояние сообщения (текст и кнопки), а
+    фоновая задача раз в интервал отправляет не больше одной правки на
+    сообщение, пропуская правки, которые ничего не меняют.
+    """
+
+    def __init__(self, interval: float):
+        self.interval = interval
+        self.desired: Dict[Tuple[int, int], Tuple[str, Optional[InlineKeyboardMarkup]]] = {}
+        self.rendered: Dict[Tuple[int, int], Tuple[str, Optional[InlineKeyboardMarkup]]] = {}
+        self.final: Set[Tuple[int, int]] = set()
+        self.requested = 0
+        self.edits = 0
+        self.skipped = 0
+        self._task: Optional[asyncio.Task] = None
+
+    def render(self, chat_id: int, message_id: int, text: str,
+               reply_markup: Optional[InlineKeyboardMarkup] = None, final: bool = False):
+        """Задает желаемое состояние сообщения; final — после этой правки сообщение больше не меняется"""
+        key = (chat_id, message_id)
+        self.requested += 1
+        self.desired[key] = (text, reply_markup)
+        if final:
+            self.final.add(key)
+
+    async def flush(self):
+        """Отправляет накопленные правки"""
+        pending, self.desired = self.desired, {}
+        for key, state in pending.items():
+            if self.rendered.get(key) == state:
+                self.skipped += 1
+            else:
+                chat_id, message_id = key
+                text, reply_markup = state
+                try:
+                    await bot.edit_message_text(
+                        chat_id=chat_id,
+                        message_id=message_id,
+                        text=text,
+                        reply_markup=reply_markup
+                    )
+                    self.rendered[key] = state
+                    self.edits += 1
+                except Exception as e:
+                    logger.error(f"Ошибка при обновлении сообщения голосования: {e}")
+            if key in self.final and key not in self.desired:
+                self.final.discard(key)
+                self.rendered.pop(key, None)
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.interval)
+            try:
+                await self.flush()
+            except Exception as e:
+                logger.error(f"Ошибка при отрисовке голосований: {e}")
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        """Останавливает фоновую задачу и отправляет оставшиеся правки"""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        await self.flush()
+
+    def stats_lines(self) -> List[str]:
+        if not self.requested:
+            return []
+        return [
+            f"Запрошено правок: {self.requested}, отправлено: {self.edits}, "
+            f"пропущено без изменений: {self.skipped}, объединено: {self.requested - self.edits - self.skipped - len(self.desired)}"
+        ]
+
+vote_renderer = VoteMessageRenderer(VOTE_EDIT_INTERVAL)
+stats_providers["Сообщения голосований"] = vote_renderer.stats_lines
+
 async def end_vote(vote_id: str, chat_id: int, message_id: int, reason: str):
     """Завершает голосование и обновляет сообщение"""
-    if vote_id in active_votes:
-        try:
-            await bot.edit_message_text(
-                chat_id=chat_id,
-                message_id=message_id,
-                text=f"Голосование завершено\n\n**{reason}**",
-                reply_markup=None  # Убираем кнопку после завершения
+    # Голосование убираем сразу, чтобы параллельные нажатия не завершили его повторно
+    vote = active_votes.pop(vote_id, None)
+    if vote is None:
+        return
+    timers.cancel("vote_expire", vote_id)
+    # Убираем кнопку после завершения
+    vote_renderer.render(chat_id, message_id, f"Голосование завершено\n\n**{reason}**", None, final=True)
+    # Удаляем сообщения, если они есть
+    _, _, _, _, messages_to_delete = vote
+    if messages_to_delete:
+        failures = await delete_messages_batched((chat_id, msg_id) for msg_id in messages_to_delete)
+        if failures:
+            # Оставшиеся сообщения админам придется удалить вручную - сообщаем об этом в итоге голосования
+            logger.warning(f"Голосование {vote_id}: не удалено сообщений {len(failures)} из {len(messages_to_delete)}")
+            vote_renderer.render(
+                chat_id, message_id,
+                f"Голосование завершено\n\n**{reason}**\n\nНе удалось удалить сообщений: {len(failures)}",
+                None, final=True
             )
-        except Exception as e:
-            logger.error(f"Ошибка при завершении голосования: {e}")
-        finally:
-            if vote_id in active_votes:
-                # Удаляем сообщения, если они есть
-                _, _, _, _, messages_to_delete = active_votes[vote_id]
-                for msg_id in messages_to_delete:
-                    try:
-                        await bot.delete_message(chat_id, msg_id)
-                        logger.info(f"Удалено сообщение {msg_id} при завершении голосования")
-                    except Exception as e:
-                        logger.error(f"Ошибка при удалении сообщения {msg_id}: {e}")
-                del active_votes[vote_id]
 
-async def check_vote_expiration():
-    """Проверяет истекшие голосования"""
-    while is_running:  # Используем глобальный флаг для корректного завершения
-        try:
-            current_time = datetime.now()
-            to_remove = []
-            
-            for vote_id, (voters, message_id, chat_id, end_time, _) in active_votes.items():
-                if current_time >= end_time:
-                    # Если время истекло, завершаем голосование
-                    try:
-                        await bot.edit_message_text(
-                            chat_id=chat_id,
-                            message_id=message_id,
-                            text=f"Голосование закончено\n\n**Это голосование уже закончено**",
-                            reply_markup=None
-                        )
-                    except Exception as e:
-                        logger.error(f"Ошибка при завершении голосования: {e}")
-                    finally:
-                        to_remove.append(vote_id)
-            
-            # Удаляем завершенные голосования
-            for vote_id in to_remove:
-                if vote_id in active_votes:
-                    del active_votes[vote_id]
-                
-        except Exception as e:
-            logger.error(f"Ошибка при проверке истекших голосований: {e}")
-            
-        await asyncio.sleep(10)  # Проверяем каждые 10 секунд
+def schedule_vote_expiration(vote_id: str):
+    """Назначает таймер окончания голосования"""
+    _, message_id, chat_id, end_time, _ = active_votes[vote_id]
+    # Чат и сообщение сохраняем в таймере, чтобы закрыть голосование и после перезапуска
+    timers.schedule("vote_expire", vote_id, end_time.timestamp(), {"chat_id": chat_id, "message_id": message_id})
+
+async def expire_vote(vote_id: str, data: dict):
+    """Завершает голосование по истечении времени"""
+    if vote_id in settling_votes:
+        # Голоса уже набраны и варн выдается - голосование завершит end_vote
+        return
+    active_votes.pop(vote_id, None)
+    vote_renderer.render(
+        data["chat_id"], data["message_id"],
+        "Голосование закончено\n\n**Это голосование уже закончено**",
+        None, final=True
+    )
+
+timers.register_handler("vote_expire", expire_vote)
 
 @dp.message(Command("votewarn"))
 async def votewarn_command(message: types.Message):
@@ -524,7 +2013,7 @@ async def votewarn_command(message: types.Message):
         await message.reply("Вы не можете голосовать за предупреждение самому себе")
         return
         
-    if not can_be_restricted(target_user.id):
+    if not can_be_restricted(target_user.id, message.chat.id):
         logger.info(f"Попытка выдать предупреждение защищенному пользователю {target_user.full_name}")
         await message.reply("Этого пользователя нельзя предупредить")
         return
@@ -553,6 +2042,7 @@ async def votewarn_command(message: types.Message):
         datetime.now() + timedelta(hours=1),
         []  # Пустой список сообщений для удаления
     )
+    schedule_vote_expiration(vote_id)
     logger.info(f"Создано голосование ID: {vote_id}")
     logger.info(f"- Сообщение ID: {vote_msg.message_id}")
     logger.info(f"- Чат ID: {message.chat.id}")
@@ -565,7 +2055,7 @@ async def handle_votewarn(callback: types.CallbackQuery):
     logger.info(f"Получен голос в голосовании {vote_id}")
     logger.info(f"- От пользователя: {callback.from_user.full_name} (ID: {callback.from_user.id})")
     
-    if vote_id not in active_votes:
+    if vote_id not in active_votes or vote_id in settling_votes:
         logger.info(f"Попытка проголосовать в завершенном голосовании {vote_id}")
         await callback.answer("Это голосование уже закончено", show_alert=True)
         return
@@ -596,36 +2086,29 @@ async def handle_votewarn(callback: types.CallbackQuery):
     
     # Если набралось 2 голоса (включая инициатора)
     if len(voters) >= 2:
+        # Занимаем голосование до первого await, чтобы одновременные голоса не выдали второй варн
+        settling_votes.add(vote_id)
         try:
-            target_user = await bot.get_chat_member(chat_id, target_user_id)
+            target_user = await chat_members.get_member(chat_id, target_user_id)
             warning_result = await issue_warning(chat_id, target_user.user)
             logger.info(f"Выдано предупреждение пользователю {target_user.user.full_name}")
             logger.info(f"- Результат: {warning_result}")
             
-            # Удаляем сообщения только после успешного голосования
-            for msg_id in messages_to_delete:
-                try:
-                    await bot.delete_message(chat_id, msg_id)
-                    logger.info(f"Удалено сообщение {msg_id} после успешного голосования")
-                except Exception as e:
-                    logger.error(f"Ошибка при удалении сообщения {msg_id}: {e}")
-            
+            # Сообщения из голосования удаляет end_vote одним пакетом
             await end_vote(vote_id, chat_id, message_id, f"Голосование завершено!\n{warning_result}")
             
         except Exception as e:
             logger.error(f"Ошибка при выдаче предупреждения: {e}")
             await callback.answer("Произошла ошибка при выдаче предупреждения", show_alert=True)
+        finally:
+            settling_votes.discard(vote_id)
     else:
-        # Обновляем сообщение с текущим количеством голосов
-        try:
-            await bot.edit_message_text(
-                chat_id=chat_id,
-                message_id=message_id,
-                text=f"Голосование за варн продолжается\nГолосов: {len(voters)}/2",
-                reply_markup=callback.message.reply_markup
-            )
-        except Exception as e:
-            logger.error(f"Ошибка при обновлении сообщения голосования: {e}")
+        # Обновляем сообщение с текущим количеством голосов (правка отправится с ближайшей отрисовкой)
+        vote_renderer.render(
+            chat_id, message_id,
+            f"Голосование за варн продолжается\nГолосов: {len(voters)}/2",
+            callback.message.reply_markup
+        )
         
         await callback.answer("Ваш голос учтен")
 
@@ -636,7 +2119,7 @@ async def warn_command(message: types.Message):
     logger.info(f"Получена команда warn от пользователя {message.from_user.id}")
     
     # Проверяем права администратора
-    if not is_admin(message.from_user.id):
+    if not is_admin(message.from_user.id, message.chat.id):
         logger.info(f"Отказано в доступе пользователю {message.from_user.id}")
         try:
             await message.delete()
@@ -661,7 +2144,7 @@ async def warn_command(message: types.Message):
     target_user = message.reply_to_message.from_user
     
     # Проверяем, можно ли выдать предупреждение пользователю
-    if not can_be_restricted(target_user.id):
+    if not can_be_restricted(target_user.id, message.chat.id):
         await message.reply("Этого пользователя нельзя предупредить")
         return
     
@@ -672,6 +2155,7 @@ async def warn_command(message: types.Message):
     # Выдаем предупреждение
     warnings[target_user.id] = warnings.get(target_user.id, 0) + 1
     warn_count = warnings[target_user.id]
+    record_event("warn", target_user.id, warn_count)
     
     # Сохраняем предупреждения
     save_warnings(warnings)
@@ -698,6 +2182,7 @@ async def warn_command(message: types.Message):
             mute_count = mute_history.get(target_user.id, 0)
             new_duration = base_duration * (2 ** mute_count)
             mute_history[target_user.id] = mute_count + 1
+            record_event("mute", target_user.id, mute_count + 1)
             save_mute_history(mute_history)
             
             # Ограничиваем отправку стикеров и GIF
@@ -729,6 +2214,7 @@ async def warn_command(message: types.Message):
             
             # Очищаем предупреждения
             warnings[target_user.id] = 0
+            record_event("reset", target_user.id, 0)
             save_warnings(warnings)
             
         except Exception as e:
@@ -738,13 +2224,14 @@ async def warn_command(message: types.Message):
 
 @dp.callback_query(lambda c: c.data.startswith('unwarn_'))
 async def unwarn_callback(callback: types.CallbackQuery):
-    if not is_admin(callback.from_user.id):
+    if not is_admin(callback.from_user.id, callback.message.chat.id):
         await callback.answer("У вас нет прав для отмены предупреждения", show_alert=True)
         return
 
     user_id = int(callback.data.split('_')[1])
     if user_id in warnings:
         warnings[user_id] = max(0, warnings[user_id] - 1)
+        record_event("unwarn", user_id, warnings[user_id])
         save_warnings(warnings)
         await callback.message.edit_text(
             f"Предупреждение отменено. Текущее количество предупреждений: {warnings[user_id]}"
@@ -753,7 +2240,7 @@ async def unwarn_callback(callback: types.CallbackQuery):
 
 @dp.message(Command("gifmute"))
 async def gifmute_user(message: types.Message):
-    if not is_admin(message.from_user.id):
+    if not is_admin(message.from_user.id, message.chat.id):
         await message.reply("У вас нет прав для использования этой команды")
         return
 
@@ -763,7 +2250,7 @@ async def gifmute_user(message: types.Message):
 
     target_user = message.reply_to_message.from_user
     
-    if not can_be_restricted(target_user.id):
+    if not can_be_restricted(target_user.id, message.chat.id):
         await message.reply("Этого пользователя нельзя ограничить")
         return
 
@@ -830,7 +2317,7 @@ async def gifmute_user(message: types.Message):
 
 @dp.callback_query(lambda c: c.data.startswith('unmute_'))
 async def unmute_callback(callback: types.CallbackQuery):
-    if not is_admin(callback.from_user.id):
+    if not is_admin(callback.from_user.id, callback.message.chat.id):
         await callback.answer("У вас нет прав для снятия ограничений", show_alert=True)
         return
 
@@ -855,6 +2342,7 @@ async def unmute_callback(callback: types.CallbackQuery):
         )
         if user_id in mute_history:
             del mute_history[user_id]
+            record_event("unmute", user_id)
             save_mute_history(mute_history)
         
         await callback.message.edit_text("Ограничения сняты")
@@ -865,7 +2353,7 @@ async def unmute_callback(callback: types.CallbackQuery):
 @dp.message(Command("unmute"))
 async def unmute_user(message: types.Message):
     """Снимает ограничения с пользователя"""
-    if not is_admin(message.from_user.id):
+    if not is_admin(message.from_user.id, message.chat.id):
         return
 
     if not message.reply_to_message:
@@ -873,7 +2361,7 @@ async def unmute_user(message: types.Message):
         return
 
     target_user = message.reply_to_message.from_user
-    if not can_be_restricted(target_user.id):
+    if not can_be_restricted(target_user.id, message.chat.id):
         await message.reply("С этого пользователя нельзя снять ограничения")
         return
 
@@ -900,16 +2388,20 @@ async def unmute_user(message: types.Message):
             # Очищаем все ограничения
             if target_user.id in bot_muted_users:
                 del bot_muted_users[target_user.id]
+                record_event("unbotmute", target_user.id)
                 save_bot_muted_users()
+                timers.cancel("botmute_expire", str(target_user.id))
                 logger.info(f"Снят botmute с пользователя {target_user.full_name}")
 
             if target_user.id in mute_history:
                 del mute_history[target_user.id]
+                record_event("unmute", target_user.id)
                 save_mute_history(mute_history)
                 logger.info(f"Очищена история мутов пользователя {target_user.full_name}")
 
             if target_user.id in warnings:
                 del warnings[target_user.id]
+                record_event("clear", target_user.id)
                 save_warnings(warnings)
                 logger.info(f"Очищены предупреждения пользователя {target_user.full_name}")
 
@@ -925,7 +2417,7 @@ async def unmute_user(message: types.Message):
 
 @dp.message(Command("warns"))
 async def check_warns(message: types.Message):
-    if message.reply_to_message and is_admin(message.from_user.id):
+    if message.reply_to_message and is_admin(message.from_user.id, message.chat.id):
         # Админ проверяет варны другого пользователя
         target_user = message.reply_to_message.from_user
         warn_count = warnings.get(target_user.id, 0)
@@ -946,7 +2438,7 @@ async def check_warns(message: types.Message):
 
 @dp.callback_query(lambda c: c.data.startswith('clear_warns_'))
 async def clear_warns_callback(callback: types.CallbackQuery):
-    if not is_admin(callback.from_user.id):
+    if not is_admin(callback.from_user.id, callback.message.chat.id):
         await callback.answer("У вас нет прав для очистки предупреждений", show_alert=True)
         return
 
@@ -954,10 +2446,11 @@ async def clear_warns_callback(callback: types.CallbackQuery):
     if user_id in warnings:
         old_count = warnings[user_id]
         del warnings[user_id]
+        record_event("clear", user_id)
         save_warnings(warnings)
         # Получаем информацию о пользователе
         try:
-            user = await bot.get_chat_member(callback.message.chat.id, user_id)
+            user = await chat_members.get_member(callback.message.chat.id, user_id)
             await callback.message.edit_text(
                 f"Все предупреждения пользователя {user.user.full_name} очищены (было: {old_count})"
             )
@@ -999,6 +2492,9 @@ async def links_command(message: types.Message):
     
     links_mode_counter = count
     logger.info(f"Установлен счетчик ссылок: {count}")
+    # Ссылки для отслеживаемых групп готовим заранее, чтобы они были уже в первых записях
+    for group_id in MONITORED_GROUPS - {MAIN_GROUP}:
+        chat_links.refresh(group_id)
     await message.reply(f"Следующие {count} записей в логах будут содержать ссылки на группы вместо ID")
 
 @dp.message(Command("bind", ignore_case=True))
@@ -1068,7 +2564,7 @@ async def getadmin_command(message: types.Message):
     
     try:
         # Проверяем права бота
-        bot_member = await bot.get_chat_member(message.chat.id, bot.id)
+        bot_member = await chat_members.get_member(message.chat.id, bot.id)
         if not bot_member.can_promote_members:
             await message.reply("У бота нет прав на назначение администраторов")
             return
@@ -1226,6 +2722,7 @@ async def handle_media(message: types.Message):
                 datetime.now() + timedelta(hours=1),
                 []  # Пустой список сообщений для удаления
             )
+            schedule_vote_expiration(vote_id)
             logger.info(f"Создано голосование за варн ID: {vote_id}")
 
             # Удаляем запрещенный контент
@@ -1288,6 +2785,11 @@ async def help_command(message: types.Message):
 def load_bot_muted_users() -> Dict[int, Union[float, Dict[str, Union[float, bool]]]]:
     """Загружает список замьюченных пользователей"""
     global bot_muted_users
+    if isinstance(storage, SqliteStore):
+        bot_muted_users = storage.bot_mute
+        removed = storage.purge_expired_bot_mutes(datetime.now().timestamp())
+        logger.info(f"Удалено истекших botmute: {removed}, активных: {len(bot_muted_users)}")
+        return bot_muted_users
     try:
         if os.path.exists(BOT_MUTE_FILE):
             with open(BOT_MUTE_FILE, 'r', encoding='utf-8') as f:
@@ -1326,65 +2828,89 @@ def load_bot_muted_users() -> Dict[int, Union[float, Dict[str, Union[float, bool
         bot_muted_users = {}
     return bot_muted_users
 
+def bot_muted_users_snapshot() -> Dict[str, object]:
+    """Готовит копию списка замьюченных пользователей для записи в JSON"""
+    # Конвертируем float('inf') в "inf" для JSON
+    data_to_save = {}
+    for user_id, mute_data in bot_muted_users.items():
+        if isinstance(mute_data, dict):
+            data_to_save[str(user_id)] = {
+                'until': "inf" if mute_data['until'] == float('inf') else mute_data['until'],
+                'exclusive': mute_data.get('exclusive', False)
+            }
+        else:
+            data_to_save[str(user_id)] = "inf" if mute_data == float('inf') else mute_data
+    return data_to_save
+
 def save_bot_muted_users():
-    """Сохраняет список замьюченных пользователей"""
-    try:
-        # Конвертируем float('inf') в "inf" для JSON
-        data_to_save = {}
-        for user_id, mute_data in bot_muted_users.items():
-            if isinstance(mute_data, dict):
-                data_to_save[str(user_id)] = {
-                    'until': "inf" if mute_data['until'] == float('inf') else mute_data['until'],
-                    'exclusive': mute_data.get('exclusive', False)
-                }
-            else:
-                data_to_save[str(user_id)] = "inf" if mute_data == float('inf') else mute_data
-                
-        with open(BOT_MUTE_FILE, 'w', encoding='utf-8') as f:
-            json.dump(data_to_save, f, ensure_ascii=False, indent=4)
-        logger.info("Список замьюченных пользователей сохранен")
-    except Exception as e:
-        logger.error(f"Ошибка при сохранении списка botmute: {e}")
+    """Помечает список замьюченных пользователей для отложенной записи"""
+    storage.mark_dirty(BOT_MUTE_FILE)
+
+def get_bot_mute_data(user_id: int) -> Optional[dict]:
+    """Получает данные о муте пользователя"""
+    mute_data = bot_muted_users.get(user_id)
+    if mute_data is None:
+        return None
+    if isinstance(mute_data, dict):
+        return mute_data
+    # Для обратной совместимости
+    return {"until": mute_data}
 
 def is_bot_muted(user_id: int) -> bool:
-    """Проверяет, запрещено ли пользователю использовать бота"""
+    """Проверяет, запрещено ли пользователю использовать бота (истекшие муты снимает таймер)"""
     mute_data = get_bot_mute_data(user_id)
     if mute_data:
-        if mute_data["until"] == float('inf'):  # Перманентный мут
-            return True
-        current_time = int(datetime.now().timestamp())
-        if current_time >= mute_data["until"]:
-            del bot_muted_users[user_id]
-            save_bot_muted_users()
-            return False
-        return True
+        return mute_data["until"] > datetime.now().timestamp()
     return False
 
+def schedule_bot_mute_expiry(user_id: int):
+    """Назначает таймер снятия botmute (для перманентного мута таймер не нужен)"""
+    mute_data = get_bot_mute_data(user_id)
+    if mute_data and mute_data["until"] != float('inf'):
+        timers.schedule("botmute_expire", str(user_id), float(mute_data["until"]))
+    else:
+        timers.cancel("botmute_expire", str(user_id))
+
+async def expire_bot_mute(key: str, data: dict):
+    """Снимает истекший botmute"""
+    user_id = int(key)
+    mute_data = get_bot_mute_data(user_id)
+    if mute_data is None or is_bot_muted(user_id):
+        return
+    del bot_muted_users[user_id]
+    record_event("unbotmute", user_id)
+    save_bot_muted_users()
+    logger.info(f"Истек botmute пользователя {user_id}")
+
+timers.register_handler("botmute_expire", expire_bot_mute)
+
 # Загружаем список замьюченных пользователей при запуске
 load_bot_muted_users()
+storage.register(BOT_MUTE_FILE, bot_muted_users_snapshot, indent=4)
 
-async def check_restrictions(message: types.Message) -> bool:
-    """Проверяет ограничения для пользователя (botmute и флуд)"""
-    # Пропускаем проверки для админов
-    if is_admin(message.from_user.id):
+# Проигрываем события, которые могли не попасть в снимок
+replayed_events = journal.replay({
+    "warnings": warnings,
+    "mute_history": mute_history,
+    "bot_mute": bot_muted_users,
+})
+if replayed_events:
+    logger.info(f"Проиграно событий из журнала: {replayed_events}")
+    storage.mark_all_dirty()
+
+# Таймеры снятия botmute восстанавливаем по самому списку мутов
+for muted_user_id in list(bot_muted_users):
+    schedule_bot_mute_expiry(muted_user_id)
+
+def is_blocked_by_bot_mute(message: types.Message) -> bool:
+    """Проверяет, запрещено ли пользователю пользоваться ботом в этом чате (botmute)"""
+    if not is_bot_muted(message.from_user.id):
         return False
-        
-    # Проверяем флуд в любом случае
-    is_flood = await check_flood(message)
-    if is_flood:
-        return True
-    
-    # Проверяем botmute
-    if is_bot_muted(message.from_user.id):
-        mute_data = get_bot_mute_data(message.from_user.id)
-        if mute_data and mute_data.get("exclusive"):
-            # Разрешаем использование в основной группе
-            if message.chat.id == MAIN_GROUP:
-                return False
-            return True
-        return True
-        
-    return False
+    mute_data = get_bot_mute_data(message.from_user.id)
+    # Exclusive мут разрешает использование в основной группе
+    if mute_data and mute_data.get("exclusive") and message.chat.id == MAIN_GROUP:
+        return False
+    return True
 
 # Команда kick должна быть зарегистрирована до middleware
 @dp.message(Command("kick"), F.chat.type.in_({"group", "supergroup"}), flags={"long_operation": "kick"})
@@ -1392,7 +2918,7 @@ async def kick_user(message: types.Message):
     """Исключает пользователя из группы"""
     try:
         # Проверяем права через список админов
-        is_admin_user = is_admin(message.from_user.id)
+        is_admin_user = is_admin(message.from_user.id, message.chat.id)
         
         # Если команда не в ответ на сообщение
         if not message.reply_to_message:
@@ -1408,7 +2934,7 @@ async def kick_user(message: types.Message):
             target_user = message.from_user
             
         # Проверяем можно ли кикнуть пользователя
-        if is_admin(target_user.id):
+        if is_admin(target_user.id, message.chat.id):
             await message.reply("Этого пользователя нельзя исключить")
             return
             
@@ -1501,23 +3027,292 @@ async def delete_bot_message(message: types.Message):
     except Exception as e:
         logger.error(f"Ошибка при удалении сообщения: {e}")
 
-# Middleware для проверки ограничений
-@dp.message.middleware()
-async def restrictions_middleware(handler, event: types.Message, data: dict):
-    """Middleware для проверки ограничений и старых сообщений"""
+# Статистика этапов конвейера модерации: этап -> [количество вызовов, суммарное время в секундах]
+pipeline_stats: Dict[str, List[float]] = {}
+
+# Время от запуска процесса до первого обновления (секунды)
+time_to_first_update: Optional[float] = None
+first_update_received = asyncio.Event()
+
+def record_stage_time(stage: str, started: float):
+    """Учитывает время выполнения этапа конвейера"""
+    stats = pipeline_stats.setdefault(stage, [0, 0.0])
+    stats[0] += 1
+    stats[1] += time.perf_counter() - started
+
+def pipeline_stats_lines() -> List[str]:
+    lines = []
+    if time_to_first_update is not None:
+        lines.append(f"Первое обновление через {time_to_first_update:.2f} с после запуска")
+    for stage, (count, total) in pipeline_stats.items():
+        average_ms = total / count * 1000 if count else 0
+        lines.append(f"{stage}: {int(count)} вызовов, в среднем {average_ms:.2f} мс")
+    return lines
+
+# Журнал сообщений из групп: файл, размер очереди, размер пачки и интервал сброса (секунды)
+MESSAGE_LOG_FILE = os.getenv("MESSAGE_LOG_FILE", "messages.txt")
+MESSAGE_LOG_QUEUE_SIZE = int(os.getenv("MESSAGE_LOG_QUEUE_SIZE", "10000"))
+MESSAGE_LOG_BATCH_SIZE = int(os.getenv("MESSAGE_LOG_BATCH_SIZE", "500"))
+MESSAGE_LOG_FLUSH_INTERVAL = float(os.getenv("MESSAGE_LOG_FLUSH_INTERVAL", "1"))
+# При превышении этого размера файл сжимается в gzip и начинается новый (0 — без ротации)
+MESSAGE_LOG_MAX_MB = float(os.getenv("MESSAGE_LOG_MAX_MB", "50"))
+
+class MessageLogWriter:
+    """
+    Фоновая запись журнала сообщений.
+
+    Обработчики только кладут строку в ограниченную очередь. Отдельный поток
+    забирает строки пачками (по размеру или по времени) и дописывает их в файл.
+    Когда файл вырастает больше лимита, он переименовывается и сжимается в
+    gzip. При переполнении очереди строки отбрасываются и учитываются.
+    """
+
+    _STOP = object()
+
+    def __init__(self, path: str, queue_size: int, batch_size: int, flush_interval: float, max_bytes: int,
+                 on_flush: Optional[Callable[[], None]] = None):
+        self.path = path
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_bytes = max_bytes
+        # Вызывается в потоке записи после каждой записанной пачки
+        self.on_flush = on_flush
+        self._queue: queue.Queue = queue.Queue(maxsize=queue_size)
+        self._thread: Optional[threading.Thread] = None
+        self.written = 0
+        self.dropped = 0
+        self.rotations = 0
+
+    def write(self, line: str):
+        """Ставит строку в очередь записи, не блокируя event loop"""
+        try:
+            self._queue.put_nowait(line)
+        except queue.Full:
+            self.dropped += 1
+
+    def _take_batch(self) -> Tuple[List[str], bool]:
+        """Ждет первую строку не дольше интервала сброса и добирает пачку из очереди"""
+        lines = []
+        try:
+            item = self._queue.get(timeout=self.flush_interval)
+        except queue.Empty:
+            return lines, False
+        while True:
+            if item is self._STOP:
+                return lines, True
+            lines.append(item)
+            if len(lines) >= self.batch_size:
+                return lines, False
+            try:
+                item = self._queue.get_nowait()
+            except queue.Empty:
+                return lines, False
+
+    def _rotate(self, f):
+        """Закрывает текущий файл, сжимает его в gzip и открывает новый"""
+        f.close()
+        rotated_path = f"{self.path}.{datetime.now().strftime('%Y%m%d-%H%M%S-%f')}"
+        os.replace(self.path, rotated_path)
+        try:
+            with open(rotated_path, 'rb') as src, gzip.open(f"{rotated_path}.gz", 'wb') as dst:
+                shutil.copyfileobj(src, dst)
+            os.remove(rotated_path)
+        except Exception as e:
+            logger.error(f"Ошибка при сжатии журнала сообщений {rotated_path}: {e}")
+        self.rotations += 1
+        return open(self.path, 'a', encoding='utf-8')
+
+    def _run(self):
+        f = open(self.path, 'a', encoding='utf-8')
+        try:
+            while True:
+                lines, stop = self._take_batch()
+                if lines:
+                    try:
+                        f.write("".join(lines))
+                        f.flush()
+                        self.written += len(lines)
+                        # До ротации: индекс архива должен дочитать файл, пока тот не переименован
+                        if self.on_flush is not None:
+                            self.on_flush()
+                        if self.max_bytes and f.tell() >= self.max_bytes:
+                            f = self._rotate(f)
+                    except Exception as e:
+                        logger.error(f"Ошибка при записи журнала {self.path}: {e}")
+                if stop:
+                    return
+        finally:
+            f.close()
+
+    def start(self):
+        """Запускает поток записи"""
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="message-log-writer", daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        """Дописывает оставшиеся в очереди строки и останавливает поток"""
+        if self._thread is None:
+            return
+        # Сигнал остановки ставим в очередь последним, поэтому все строки перед ним будут записаны
+        self._queue.put(self._STOP)
+        self._thread.join()
+        self._thread = None
+
+    def stats_lines(self) -> List[str]:
+        return [
+            f"Записано строк: {self.written}, в очереди: {self._queue.qsize()}, "
+            f"отброшено при переполнении: {self.dropped}, ротаций: {self.rotations}"
+        ]
+
+message_log = MessageLogWriter(
+    MESSAGE_LOG_FILE,
+    MESSAGE_LOG_QUEUE_SIZE,
+    MESSAGE_LOG_BATCH_SIZE,
+    MESSAGE_LOG_FLUSH_INTERVAL,
+    int(MESSAGE_LOG_MAX_MB * 1024 * 1024)
+)
+stats_providers["Журнал сообщений"] = message_log.stats_lines
+
+# Структурированный архив тех же сообщений (JSONL) и его полнотекстовый индекс для /search
+MESSAGE_ARCHIVE = os.getenv("MESSAGE_ARCHIVE", "true").lower() == "true"
+MESSAGE_ARCHIVE_FILE = os.getenv("MESSAGE_ARCHIVE_FILE", "messages.jsonl")
+MESSAGE_ARCHIVE_INDEX = os.getenv("MESSAGE_ARCHIVE_INDEX", "messages_index.db")
+MESSAGE_ARCHIVE_MAX_MB = float(os.getenv("MESSAGE_ARCHIVE_MAX_MB", "50"))
+
+message_archive: Optional[MessageArchive] = None
+archive_log: Optional[MessageLogWriter] = None
+
+def open_message_archive():
+    """Открывает архив и его индекс при запуске бота (не при импорте: индекс создает файл базы)"""
+    global message_archive, archive_log
+    if not MESSAGE_ARCHIVE or message_archive is not None:
+        return
+    message_archive = MessageArchive(MESSAGE_ARCHIVE_FILE, MESSAGE_ARCHIVE_INDEX)
+    # Архив пишется и ротируется тем же способом, что и messages.txt. После каждой пачки индекс
+    # догоняет архив в том же потоке, поэтому к ротации файл уже проиндексирован целиком
+    archive_log = MessageLogWriter(
+        MESSAGE_ARCHIVE_FILE,
+        MESSAGE_LOG_QUEUE_SIZE,
+        MESSAGE_LOG_BATCH_SIZE,
+        MESSAGE_LOG_FLUSH_INTERVAL,
+        int(MESSAGE_ARCHIVE_MAX_MB * 1024 * 1024),
+        on_flush=message_archive.sync_index
+    )
+    stats_providers["Архив сообщений"] = archive_log.stats_lines
+
+def archive_message(event: types.Message):
+    """Ставит сообщение в очередь записи в архив"""
+    if archive_log is None:
+        return
+    record = {
+        "chat_id": event.chat.id,
+        "chat_title": event.chat.title,
+        "user_id": event.from_user.id,
+        "username": event.from_user.username,
+        "full_name": event.from_user.full_name,
+        "message_id": event.message_id,
+        "date": event.date.timestamp(),
+        "content_type": event.content_type,
+        "text": event.text or event.caption,
+    }
+    archive_log.write(json.dumps(record, ensure_ascii=False) + "\n")
+
+# Режим ссылок: сколько секунд живет пригласительная ссылка
+INVITE_LINK_TTL = float(os.getenv("INVITE_LINK_TTL", "3600"))
+
+class ChatLinkCache:
+    """
+    Пригласительные ссылки для режима ссылок.
+
+    На чат создается одна ссылка со сроком действия INVITE_LINK_TTL, которая
+    переиспользуется для всех записей журнала. Права бота в чате берутся из
+    кэша участников. Ссылка создается в фоне: пока ее нет, запись в журнале
+    получает ID чата, и логирование никогда не ждет API. Ссылку, которую не
+    удалось вовремя заменить, после истечения срока в журнал не пишем.
+    """
+
+    # Ссылку заменяем новой заранее, чтобы в журнал не попала уже истекшая
+    RENEW_MARGIN = 60
+
+    def __init__(self, link_ttl: float):
+        self.link_ttl = link_ttl
+        # chat_id -> (время обновления, ссылка или None, если у бота нет прав на приглашения, время истечения)
+        self.links: Dict[int, Tuple[float, Optional[str], float]] = {}
+        self._refreshing: Set[int] = set()
+        self.hits = 0
+        self.misses = 0
+        self.created = 0
+
+    def describe(self, chat: types.Chat) -> Tuple[str, bool]:
+        """
+        Название чата со ссылкой из кэша и признак, что ссылка попала в запись.
+        При отсутствии или устаревании ссылки запускает ее обновление.
+        """
+        now = time.time()
+        entry = self.links.get(chat.id)
+        if entry is None or entry[0] <= now:
+            self.refresh(chat.id)
+        if entry is None or entry[2] <= now:
+            self.misses += 1
+            return f"{chat.title} ({chat.id})", False
+        self.hits += 1
+        if entry[1] is None:
+            return f"{chat.title} (нет прав на создание ссылки)", False
+        return f"{chat.title} ({entry[1]})", True
+
+    def refresh(self, chat_id: int):
+        """Запускает фоновое обновление ссылки, если оно еще не идет"""
+        if chat_id not in self._refreshing:
+            self._refreshing.add(chat_id)
+            asyncio.create_task(self._refresh(chat_id))
+
+    async def _refresh(self, chat_id: int):
+        try:
+            bot_member = await chat_members.get_member(chat_id, bot.id)
+            if not getattr(bot_member, "can_invite_users", False):
+                # Права перепроверим, когда истечет запись в кэше участников (или придет my_chat_member)
+                recheck_at = time.time() + chat_members.member_ttl
+                self.links[chat_id] = (recheck_at, None, recheck_at)
+                return
+            created_at = time.time()
+            invite_link = await bot.create_chat_invite_link(
+                chat_id,
+                expire_date=datetime.now() + timedelta(seconds=self.link_ttl)
+            )
+            self.created += 1
+            self.links[chat_id] = (
+                created_at + max(self.link_ttl - self.RENEW_MARGIN, 0),
+                invite_link.invite_link,
+                created_at + self.link_ttl
+            )
+        except Exception as e:
+            logger.error(f"Ошибка при создании ссылки: {e}")
+        finally:
+            self._refreshing.discard(chat_id)
+
+    def stats_lines(self) -> List[str]:
+        if not self.hits and not self.misses:
+            return []
+        return [
+            f"Записей со ссылкой из кэша: {self.hits}, без ссылки: {self.misses}, "
+            f"создано ссылок: {self.created}, чатов в кэше: {len(self.links)}"
+        ]
+
+chat_links = ChatLinkCache(INVITE_LINK_TTL)
+stats_providers["Режим ссылок"] = chat_links.stats_lines
+
+async def log_message(event: types.Message):
+    """Логирует команды и записывает сообщения из групп (кроме основной) в messages.txt"""
     global links_mode_counter
-    
+
     # Логируем все команды
     if event.text and event.text.startswith('/'):
         logger.info(
             f"Пользователь {event.from_user.full_name} вызвал {event.text.split()[0]} "
             f"в {'ЛС' if event.chat.type == 'private' else f'группе {event.chat.title}'} ({event.chat.id})"
         )
-    
-    # Пропускаем проверки для админов в ЛС
-    if event.chat.type == 'private' and is_admin(event.from_user.id):
-        return await handler(event, data)
-    
+
     # Логируем сообщения из всех групп кроме основной
     if event.chat.id != MAIN_GROUP and event.chat.type != 'private':
         try:
@@ -1559,48 +3354,71 @@ async def restrictions_middleware(handler, event: types.Message, data: dict):
                 elif event.venue:
                     content = "[venue]"
             
-            # Получаем ссылку на группу если включен режим ссылок
+            # Получаем ссылку на группу если включен режим ссылок (из кэша, без обращения к API)
             chat_info = ""
             if links_mode_counter is not None and links_mode_counter > 0:
-                try:
-                    # Проверяем, что бот является администратором группы
-                    bot_member = await bot.get_chat_member(event.chat.id, bot.id)
-                    if bot_member.can_invite_users:
-                        invite_link = await bot.create_chat_invite_link(event.chat.id)
-                        chat_info = f"{event.chat.title} ({invite_link.invite_link})"
-                    else:
-                        chat_info = f"{event.chat.title} (нет прав на создание ссылки)"
+                chat_info, has_link = chat_links.describe(event.chat)
+                # Счетчик считает записи со ссылкой: пока ссылка создается, записи с ID его не тратят
+                if has_link:
                     links_mode_counter -= 1
                     if links_mode_counter == 0:
                         links_mode_counter = None
-                except Exception as e:
-                    logger.error(f"Ошибка при создании ссылки: {e}")
-                    chat_info = f"{event.chat.title} ({event.chat.id})"
             else:
                 chat_info = f"{event.chat.title} ({event.chat.id})"
             
-            log_message = (
+            log_line = (
                 f"{chat_info} | "
                 f"{event.from_user.full_name} (@{username}): "
                 f"{content}\n"
             )
             
-            with open("messages.txt", "a", encoding='utf-8') as f:
-                f.write(log_message)
+            message_log.write(log_line)
+            archive_message(event)
         except Exception as e:
             logger.error(f"Ошибка при логировании сообщения: {e}")
-    
+
+# Middleware для проверки ограничений
+@dp.message.outer_middleware()
+async def restrictions_middleware(handler, event: types.Message, data: dict):
+    """
+    Единый конвейер модерации:
+    лог -> старые сообщения -> админы -> botmute -> флуд -> украинский режим -> обработчики.
+    Каждый этап выполняется не более одного раза на сообщение.
+    """
+    global time_to_first_update
+    started = time.perf_counter()
+    if time_to_first_update is None:
+        time_to_first_update = started - process_start_time
+        logger.info(f"Первое обновление получено через {time_to_first_update:.2f} с после запуска процесса")
+        first_update_received.set()
+    await log_message(event)
+    record_stage_time("log", started)
+
     # Пропускаем сообщения, отправленные до запуска бота
     if event.date.timestamp() < bot_start_time:
         logger.debug(f"Пропущено старое сообщение от {event.date}")
         return
-    
-    # Пропускаем проверки для админов
-    if is_admin(event.from_user.id):
-        return await handler(event, data)
-    
-    # Проверяем ограничения
-    if await check_restrictions(event):
+
+    # Админы не проверяются на botmute и флуд
+    is_blocked = False
+    if not is_admin(event.from_user.id, event.chat.id):
+        started = time.perf_counter()
+        is_blocked = is_blocked_by_bot_mute(event)
+        record_stage_time("botmute", started)
+
+        started = time.perf_counter()
+        is_flood = await check_flood(event)
+        record_stage_time("flood", started)
+        if is_flood:
+            return
+
+    started = time.perf_counter()
+    language_violation = await check_language(event)
+    record_stage_time("ua_mode", started)
+    if language_violation:
+        return
+
+    if is_blocked:
         # Если есть ограничения и это команда - удаляем её
         if event.text and event.text.startswith('/'):
             try:
@@ -1609,18 +3427,15 @@ async def restrictions_middleware(handler, event: types.Message, data: dict):
             except Exception as e:
                 logger.error(f"Ошибка при удалении команды: {e}")
         return
-    
-    return await handler(event, data)
 
-def get_bot_mute_data(user_id: int) -> Optional[dict]:
-    """Получает данные о муте пользователя"""
-    if user_id in bot_muted_users:
-        if isinstance(bot_muted_users[user_id], dict):
-            return bot_muted_users[user_id]
-        else:
-            # Для обратной совместимости
-            return {"until": bot_muted_users[user_id]}
-    return None
+    started = time.perf_counter()
+    try:
+        return await handler(event, data)
+    finally:
+        record_stage_time("handlers", started)
+
+stats_providers["Конвейер модерации"] = pipeline_stats_lines
+stats_providers["Определение языка"] = language_service.stats_lines
 
 @dp.message(Command("botmute"))
 async def botmute_user(message: types.Message):
@@ -1646,7 +3461,9 @@ async def botmute_user(message: types.Message):
             "exclusive": False
         }
         bot_muted_users[target_user.id] = mute_data
+        record_event("botmute", target_user.id, mute_data)
         save_bot_muted_users()
+        schedule_bot_mute_expiry(target_user.id)
         await message.reply(f"Пользователь {target_user.full_name} получил перманентный мут")
         logger.info(f"Выдан перманентный мут пользователю {target_user.full_name} (ID: {target_user.id})")
         return
@@ -1657,7 +3474,9 @@ async def botmute_user(message: types.Message):
     if duration_str == '-u':
         if target_user.id in bot_muted_users:
             del bot_muted_users[target_user.id]
+            record_event("unbotmute", target_user.id)
             save_bot_muted_users()
+            timers.cancel("botmute_expire", str(target_user.id))
             await message.reply(f"Мут снят с пользователя {target_user.full_name}")
             logger.info(f"Снят мут с пользователя {target_user.full_name} (ID: {target_user.id})")
         else:
@@ -1673,7 +3492,9 @@ async def botmute_user(message: types.Message):
             "exclusive": True
         }
         bot_muted_users[target_user.id] = mute_data
+        record_event("botmute", target_user.id, mute_data)
         save_bot_muted_users()
+        schedule_bot_mute_expiry(target_user.id)
         await message.reply(f"Пользователь {target_user.full_name} получил перманентный exclusive мут")
         logger.info(f"Выдан перманентный exclusive мут пользователю {target_user.full_name} (ID: {target_user.id})")
         return
@@ -1703,7 +3524,9 @@ async def botmute_user(message: types.Message):
             "exclusive": is_exclusive
         }
         bot_muted_users[target_user.id] = mute_data
+        record_event("botmute", target_user.id, mute_data)
         save_bot_muted_users()
+        schedule_bot_mute_expiry(target_user.id)
         
         # Форматируем сообщение о муте
         if unit == 's':
@@ -1726,45 +3549,213 @@ async def botmute_user(message: types.Message):
         )
         logger.error(f"Ошибка при обработке времени botmute: {e}")
 
-# Обработчик всех остальных сообщений
-@dp.message()
-async def handle_all_messages(message: types.Message):
-    """Обработчик всех сообщений"""
-    # Проверяем ограничения
-    if await check_restrictions(message):
-        return
-
-async def restore_permissions(chat_id: int, user_id: int, permissions: types.ChatPermissions):
+async def restore_permissions(key: str, data: dict):
     """Восстанавливает права пользователя после временного мута за флуд"""
-    await asyncio.sleep(60)  # Ждем 1 минуту
-    try:
-        await bot.restrict_chat_member(
-            chat_id=chat_id,
-            user_id=user_id,
-            permissions=permissions
-        )
-    except Exception as e:
-        logger.error(f"Ошибка при восстановлении прав пользователя: {e}")
+    await bot.restrict_chat_member(
+        chat_id=data["chat_id"],
+        user_id=data["user_id"],
+        permissions=types.ChatPermissions(**data["permissions"])
+    )
+
+timers.register_handler("restore_permissions", restore_permissions)
+
+# Невидимые символы, которыми обходят проверку повторов
+_INVISIBLE_CHARS = dict.fromkeys(
+    map(ord, "\u00ad\u180e\u200b\u200c\u200d\u200e\u200f\u2060\u2061\u2062\u2063\u2064\ufeff\ufe0e\ufe0f"),
+    None
+)
+_NON_WORD_RE = re.compile(r"[\W_]+")
+
+def normalize_text(text: str) -> str:
+    """
+    Приводит текст к каноническому виду: NFKC, регистр, без невидимых символов,
+    эмодзи и знаков препинания, слова через один пробел
+    """
+    folded = unicodedata.normalize("NFKC", text).translate(_INVISIBLE_CHARS).casefold()
+    normalized = " ".join(_NON_WORD_RE.sub(" ", folded).split())
+    # Сообщения только из эмодзи/символов сравниваем по самим символам
+    return normalized or " ".join(folded.split())
+
+def digest64(data: str) -> int:
+    """64-битный хеш строки"""
+    return int.from_bytes(hashlib.blake2b(data.encode("utf-8"), digest_size=8).digest(), "big")
 
-def get_message_hash(message: types.Message) -> str:
-    """Создает хеш сообщения для сравнения"""
+# Максимальное число признаков, учитываемых в SimHash
+SIMHASH_MAX_FEATURES = 256
+
+def simhash64(normalized: str) -> int:
+    """SimHash по словам (для коротких текстов — по триграммам символов)"""
+    words = normalized.split()
+    if len(words) >= 3:
+        features = words
+    else:
+        compact = normalized.replace(" ", "")
+        features = [compact[i:i + 3] for i in range(max(1, len(compact) - 2))]
+    weights: Dict[str, int] = {}
+    for feature in features:
+        weights[feature] = weights.get(feature, 0) + 1
+        if len(weights) >= SIMHASH_MAX_FEATURES:
+            break
+    vector = [0] * 64
+    for feature, weight in weights.items():
+        h = digest64(feature)
+        for bit in range(64):
+            vector[bit] += weight if (h >> bit) & 1 else -weight
+    result = 0
+    for bit, value in enumerate(vector):
+        if value > 0:
+            result |= 1 << bit
+    return result
+
+def is_same_message(first_hash: int, second_hash: int) -> bool:
+    """Сравнивает хеши сообщений (в режиме SimHash — с допуском по расстоянию Хэмминга)"""
+    if FLOOD_SIMHASH:
+        return (first_hash ^ second_hash).bit_count() <= FLOOD_SIMHASH_DISTANCE
+    return first_hash == second_hash
+
+def get_message_hash(message: types.Message) -> int:
+    """Создает 64-битный хеш сообщения для сравнения (размер не зависит от длины текста)"""
     if message.text:
-        return f"text_{message.text}"
+        normalized = normalize_text(message.text)
+        return simhash64(normalized) if FLOOD_SIMHASH else digest64(f"text_{normalized}")
     elif message.sticker:
-        return f"sticker_{message.sticker.file_unique_id}"
+        key = f"sticker_{message.sticker.file_unique_id}"
     elif message.animation:
-        return f"animation_{message.animation.file_unique_id}"
+        key = f"animation_{message.animation.file_unique_id}"
     elif message.photo:
-        return f"photo_{message.photo[-1].file_unique_id}"
+        key = f"photo_{message.photo[-1].file_unique_id}"
     elif message.video:
-        return f"video_{message.video.file_unique_id}"
+        key = f"video_{message.video.file_unique_id}"
     elif message.voice:
-        return f"voice_{message.voice.file_unique_id}"
+        key = f"voice_{message.voice.file_unique_id}"
     elif message.video_note:
-        return f"video_note_{message.video_note.file_unique_id}"
+        key = f"video_note_{message.video_note.file_unique_id}"
     elif message.document:
-        return f"document_{message.document.file_unique_id}"
-    return f"other_{message.message_id}"
+        key = f"document_{message.document.file_unique_id}"
+    else:
+        key = f"other_{message.message_id}"
+    return digest64(key)
+
+# Параметры антифлуда: окно (секунды) и порог срабатывания
+FLOOD_RATE_WINDOW = 3  # 5 или более сообщений за 3 секунды
+FLOOD_RATE_LIMIT = 5
+FLOOD_REPEAT_WINDOW = 10  # 3 одинаковых сообщения за 10 секунд
+FLOOD_REPEAT_LIMIT = 3
+FLOOD_LONG_WINDOW = 5  # 2 длинных сообщения за 5 секунд
+FLOOD_LONG_LIMIT = 2
+FLOOD_LONG_LENGTH = 1200
+# Верхняя граница числа записей в каждом окне пользователя
+FLOOD_HISTORY_CAP = 50
+# Пользователи без сообщений дольше самого длинного окна удаляются из истории
+FLOOD_IDLE_TIMEOUT = max(FLOOD_RATE_WINDOW, FLOOD_REPEAT_WINDOW, FLOOD_LONG_WINDOW)
+FLOOD_SWEEP_INTERVAL = 60
+# Режим SimHash: похожие (а не только одинаковые) тексты считаются повтором
+FLOOD_SIMHASH = os.getenv("FLOOD_SIMHASH", "false").lower() == "true"
+FLOOD_SIMHASH_DISTANCE = int(os.getenv("FLOOD_SIMHASH_DISTANCE", "3"))
+
+class FloodState:
+    """
+    Скользящие окна антифлуда для одного пользователя в одном чате.
+
+    Окно — плоский список, в котором поля записей идут подряд (время, message_id
+    или время, хеш, message_id): без отдельного кортежа на каждое сообщение
+    состояние заметно меньше, а хранится оно для каждого активного пользователя.
+    В окне не больше FLOOD_HISTORY_CAP записей, устаревшие удаляются с начала
+    одним срезом. Повторы считаются перебором хешей окна: при таком ограничении
+    это дешевле, чем держать для каждого пользователя словарь счетчиков. Окно
+    длинных сообщений создается только при первом длинном сообщении.
+    """
+
+    __slots__ = ("messages", "last_messages", "long_messages", "last_seen")
+
+    def __init__(self):
+        self.messages: List[float] = []  # время, message_id — для проверки частоты
+        self.last_messages: List[float] = []  # время, хеш, message_id — для проверки повторов
+        self.long_messages: Optional[List[float]] = None  # время, message_id — для проверки длинных сообщений
+        self.last_seen = 0.0
+
+    @staticmethod
+    def _trim(window: list, stride: int, oldest: float):
+        """Удаляет с начала окна устаревшие записи и записи сверх FLOOD_HISTORY_CAP (stride — полей в записи)"""
+        size = len(window)
+        drop = max(0, size - FLOOD_HISTORY_CAP * stride)
+        while drop < size and window[drop] < oldest:
+            drop += stride
+        if drop:
+            del window[:drop]
+
+    def add_message(self, now: float, message_id: int) -> int:
+        """Добавляет сообщение в окно частоты, возвращает количество сообщений в окне"""
+        self.messages += (now, message_id)
+        self._trim(self.messages, 2, now - FLOOD_RATE_WINDOW)
+        return len(self.messages) // 2
+
+    def add_long_message(self, now: float, message_id: int) -> int:
+        """Добавляет длинное сообщение, возвращает количество длинных сообщений в окне"""
+        if self.long_messages is None:
+            self.long_messages = []
+        self.long_messages += (now, message_id)
+        self._trim(self.long_messages, 2, now - FLOOD_LONG_WINDOW)
+        return len(self.long_messages) // 2
+
+    def add_hash(self, now: float, msg_hash: int, message_id: int) -> int:
+        """Добавляет хеш сообщения, возвращает количество таких же сообщений в окне"""
+        window = self.last_messages
+        window += (now, msg_hash, message_id)
+        self._trim(window, 3, now - FLOOD_REPEAT_WINDOW)
+        if FLOOD_SIMHASH:
+            return sum(1 for h in window[1::3] if is_same_message(h, msg_hash))
+        return window[1::3].count(msg_hash)
+
+    def rate_message_ids(self) -> List[int]:
+        """Сообщения из окна частоты"""
+        return self.messages[1::2]
+
+    def long_message_ids(self) -> List[int]:
+        """Сообщения из окна длинных сообщений"""
+        return self.long_messages[1::2] if self.long_messages else []
+
+    def repeated_message_ids(self, msg_hash: int) -> List[int]:
+        """Сообщения из окна повторов, совпадающие с msg_hash"""
+        window = self.last_messages
+        return [window[i + 2] for i in range(0, len(window), 3) if is_same_message(window[i + 1], msg_hash)]
+
+    def message_ids(self) -> List[int]:
+        """Все сообщения из окон (для удаления после голосования)"""
+        return self.rate_message_ids() + self.last_messages[2::3] + self.long_message_ids()
+
+def sweep_flood_history(now: float) -> int:
+    """Удаляет из истории флуда неактивных пользователей, возвращает количество удаленных"""
+    removed = 0
+    for chat_id in list(flood_history):
+        chat_history = flood_history[chat_id]
+        idle_users = [
+            user_id for user_id, state in chat_history.items()
+            if now - state.last_seen > FLOOD_IDLE_TIMEOUT
+        ]
+        for user_id in idle_users:
+            del chat_history[user_id]
+        removed += len(idle_users)
+        if not chat_history:
+            del flood_history[chat_id]
+    return removed
+
+def flood_stats_lines() -> List[str]:
+    tracked = sum(len(chat_history) for chat_history in flood_history.values())
+    return [f"Отслеживается пользователей: {tracked} в {len(flood_history)} чатах"]
+
+stats_providers["Антифлуд"] = flood_stats_lines
+
+async def flood_history_sweeper():
+    """Периодически очищает историю флуда от неактивных пользователей"""
+    while True:
+        await asyncio.sleep(FLOOD_SWEEP_INTERVAL)
+        try:
+            removed = sweep_flood_history(time.monotonic())
+            if removed:
+                logger.debug(f"Из истории флуда удалено неактивных пользователей: {removed}")
+        except Exception as e:
+            logger.error(f"Ошибка при очистке истории флуда: {e}")
 
 async def check_flood(message: types.Message) -> bool:
     """
@@ -1775,103 +3766,59 @@ async def check_flood(message: types.Message) -> bool:
     if message.chat.id not in MONITORED_GROUPS:
         return False
 
-    if is_admin(message.from_user.id):
+    if is_admin(message.from_user.id, message.chat.id):
         return False
 
-    current_time = datetime.now().timestamp()
+    current_time = time.monotonic()
     chat_id = message.chat.id
     user_id = message.from_user.id
 
-    # Инициализируем структуры данных если их нет
-    if chat_id not in flood_history:
-        flood_history[chat_id] = {}
-    if user_id not in flood_history[chat_id]:
-        flood_history[chat_id][user_id] = {
-            "messages": [],  # для проверки частоты
-            "last_messages": [],  # для проверки повторов
-            "long_messages": []  # для проверки длинных сообщений
-        }
-
-    user_history = flood_history[chat_id][user_id]
+    chat_history = flood_history.setdefault(chat_id, {})
+    user_history = chat_history.get(user_id)
+    if user_history is None:
+        user_history = chat_history[user_id] = FloodState()
+    user_history.last_seen = current_time
     
-    # 1. Проверка длинных сообщений (>1200 символов)
-    is_long_message = False
-    if message.text and len(message.text) > 1200:
-        is_long_message = True
-    elif message.caption and len(message.caption) > 1200:
-        is_long_message = True
-    
-    if is_long_message:
-        # Очищаем старые записи (старше 5 секунд)
-        user_history["long_messages"] = [
-            (t, mid) for t, mid in user_history["long_messages"]
-            if current_time - t <= 5
-        ]
-        
-        # Добавляем текущее сообщение
-        user_history["long_messages"].append((current_time, message.message_id))
-        
-        # Проверяем количество длинных сообщений за 5 секунд
-        if len(user_history["long_messages"]) >= 2:
+    # 1. Проверка длинных сообщений
+    text = message.text or message.caption
+    if text and len(text) > FLOOD_LONG_LENGTH:
+        if user_history.add_long_message(current_time, message.message_id) >= FLOOD_LONG_LIMIT:
             logger.info(f"Обнаружен флуд: длинные сообщения от пользователя {message.from_user.full_name}")
             if await handle_flood_violation(message, "отправка длинных сообщений подряд"):
                 # Удаляем все длинные сообщения
-                for _, msg_id in user_history["long_messages"]:
-                    try:
-                        await bot.delete_message(chat_id, msg_id)
-                    except Exception as e:
-                        logger.error(f"Ошибка при удалении сообщения {msg_id}: {e}")
+                await delete_flood_messages(message, user_history.long_message_ids(), "длинные сообщения")
                 return True
     
     # 2. Проверка повторяющихся сообщений
     msg_hash = get_message_hash(message)
-    user_history["last_messages"].append((current_time, msg_hash, message.message_id))
-    
-    # Удаляем старые сообщения (старше 10 секунд)
-    user_history["last_messages"] = [
-        (t, h, mid) for t, h, mid in user_history["last_messages"]
-        if current_time - t <= 10
-    ]
-    
-    # Считаем повторы
-    hash_counts = {}
-    for _, msg_hash, _ in user_history["last_messages"]:
-        hash_counts[msg_hash] = hash_counts.get(msg_hash, 0) + 1
-        if hash_counts[msg_hash] >= 3:
-            logger.info(f"Обнаружен флуд: повторяющиеся сообщения от пользователя {message.from_user.full_name}")
-            if await handle_flood_violation(message, "повторяющиеся сообщения"):
-                # Удаляем все повторяющиеся сообщения
-                for t, h, mid in user_history["last_messages"]:
-                    if h == msg_hash:
-                        try:
-                            await bot.delete_message(chat_id, mid)
-                        except Exception as e:
-                            logger.error(f"Ошибка при удалении сообщения {mid}: {e}")
-                return True
+    if user_history.add_hash(current_time, msg_hash, message.message_id) >= FLOOD_REPEAT_LIMIT:
+        logger.info(f"Обнаружен флуд: повторяющиеся сообщения от пользователя {message.from_user.full_name}")
+        if await handle_flood_violation(message, "повторяющиеся сообщения"):
+            # Удаляем все повторяющиеся сообщения
+            await delete_flood_messages(message, user_history.repeated_message_ids(msg_hash), "повторяющиеся сообщения")
+            return True
     
     # 3. Проверка частоты сообщений
-    user_history["messages"].append((current_time, message.message_id))
-    
-    # Удаляем старые сообщения (старше 3 секунд)
-    user_history["messages"] = [
-        (t, mid) for t, mid in user_history["messages"]
-        if current_time - t <= 3
-    ]
-    
-    # Проверяем частоту (5 или более сообщений за 3 секунды)
-    if len(user_history["messages"]) >= 5:
+    if user_history.add_message(current_time, message.message_id) >= FLOOD_RATE_LIMIT:
         logger.info(f"Обнаружен флуд: частые сообщения от пользователя {message.from_user.full_name}")
         if await handle_flood_violation(message, "слишком частая отправка сообщений"):
             # Удаляем все сообщения за последние 3 секунды
-            for _, msg_id in user_history["messages"]:
-                try:
-                    await bot.delete_message(chat_id, msg_id)
-                except Exception as e:
-                    logger.error(f"Ошибка при удалении сообщения {msg_id}: {e}")
+            await delete_flood_messages(message, user_history.rate_message_ids(), "частые сообщения")
             return True
     
     return False
 
+async def delete_flood_messages(message: types.Message, message_ids: List[int], reason: str):
+    """Удаляет сообщения флуда и сообщает о тех, что остались в чате"""
+    chat_id = message.chat.id
+    failures = await delete_messages_batched((chat_id, msg_id) for msg_id in message_ids)
+    if failures:
+        errors = sorted(set(failures.values()))
+        logger.warning(
+            f"Флуд ({reason}) от пользователя {message.from_user.full_name} ({message.from_user.id}): "
+            f"не удалено сообщений {len(failures)} из {len(message_ids)} в чате {chat_id}: {'; '.join(errors)}"
+        )
+
 async def handle_flood_violation(message: types.Message, reason: str) -> bool:
     """Обрабатывает нарушение антифлуда"""
     try:
@@ -1892,15 +3839,10 @@ async def handle_flood_violation(message: types.Message, reason: str) -> bool:
         user_id = message.from_user.id
         messages_to_delete = []
         
-        if chat_id in flood_history and user_id in flood_history[chat_id]:
-            user_history = flood_history[chat_id][user_id]
-            # Собираем все сообщения для удаления
-            if "messages" in user_history:
-                messages_to_delete.extend(msg_id for _, msg_id in user_history["messages"])
-            if "last_messages" in user_history:
-                messages_to_delete.extend(msg_id for _, _, msg_id in user_history["last_messages"])
-            if "long_messages" in user_history:
-                messages_to_delete.extend(msg_id for _, msg_id in user_history["long_messages"])
+        user_history = flood_history.get(chat_id, {}).get(user_id)
+        if user_history is not None:
+            # Собираем все сообщения для удаления (одно сообщение может быть в нескольких окнах)
+            messages_to_delete.extend(dict.fromkeys(user_history.message_ids()))
         
         active_votes[vote_id] = (
             {message.from_user.id},  # Добавляем нарушителя в список проголосовавших
@@ -1909,6 +3851,7 @@ async def handle_flood_violation(message: types.Message, reason: str) -> bool:
             datetime.now() + timedelta(hours=1),
             messages_to_delete  # Добавляем список сообщений для удаления
         )
+        schedule_vote_expiration(vote_id)
         
         # Запрещаем отправку сообщений на 1 минуту
         await message.chat.restrict(
@@ -1923,27 +3866,34 @@ async def handle_flood_violation(message: types.Message, reason: str) -> bool:
             "until": mute_until,
             "exclusive": False
         }
+        record_event("botmute", message.from_user.id, bot_muted_users[message.from_user.id])
         save_bot_muted_users()
         
+        schedule_bot_mute_expiry(message.from_user.id)
+        
         # Через минуту снимаем ограничения чата
-        asyncio.create_task(
-            restore_permissions(
-                message.chat.id, 
-                message.from_user.id,
-                types.ChatPermissions(
-                    can_send_messages=True,
-                    can_send_media_messages=True,
-                    can_send_other_messages=True,
-                    can_send_polls=True,
-                    can_send_audios=True,
-                    can_send_documents=True,
-                    can_send_photos=True,
-                    can_send_videos=True,
-                    can_send_video_notes=True,
-                    can_send_voice_notes=True,
-                    can_add_web_page_previews=True
-                )
-            )
+        permissions = types.ChatPermissions(
+            can_send_messages=True,
+            can_send_media_messages=True,
+            can_send_other_messages=True,
+            can_send_polls=True,
+            can_send_audios=True,
+            can_send_documents=True,
+            can_send_photos=True,
+            can_send_videos=True,
+            can_send_video_notes=True,
+            can_send_voice_notes=True,
+            can_add_web_page_previews=True
+        )
+        timers.schedule(
+            "restore_permissions",
+            f"{message.chat.id}:{message.from_user.id}",
+            time.time() + 60,
+            {
+                "chat_id": message.chat.id,
+                "user_id": message.from_user.id,
+                "permissions": permissions.model_dump(exclude_none=True)
+            }
         )
         
         return True
@@ -1963,15 +3913,12 @@ def load_binds() -> Dict[str, str]:
     return {}
 
 def save_binds():
-    """Сохраняет список биндов"""
-    try:
-        with open(BINDS_FILE, 'w', encoding='utf-8') as f:
-            json.dump(binds, f, ensure_ascii=False, indent=2)
-    except Exception as e:
-        logger.error(f"Ошибка при сохранении биндов: {e}")
+    """Помечает список биндов для отложенной записи"""
+    storage.mark_dirty(BINDS_FILE)
 
 # Загружаем бинды при запуске
-binds = load_binds()
+binds = storage.binds if isinstance(storage, SqliteStore) else load_binds()
+storage.register(BINDS_FILE, lambda: dict(binds))
 
 @dp.message(Command("binds", ignore_case=True))
 async def list_binds(message: types.Message):
@@ -1994,35 +3941,181 @@ async def list_binds(message: types.Message):
     
     await message.reply("Список активных биндов:\n" + "\n".join(bind_list))
 
-# Общий обработчик сообщений должен быть последним
-@dp.message()
-async def check_language(message: types.Message):
-    """Проверяет язык сообщений в украинском режиме"""
+@dp.message(Command("stats", ignore_case=True))
+async def stats_command(message: types.Message):
+    """Показывает внутреннюю статистику бота"""
+    if not is_admin(message.from_user.id):
+        try:
+            await message.delete()
+        except Exception as e:
+            logger.error(f"Ошибка при удалении команды: {e}")
+        return
+    
+    sections = []
+    for title, provider in stats_providers.items():
+        try:
+            lines = provider()
+        except Exception as e:
+            logger.error(f"Ошибка при сборе статистики {title}: {e}")
+            continue
+        if lines:
+            sections.append(f"{title}:\n" + "\n".join(f"• {line}" for line in lines))
+    
+    await message.reply("\n\n".join(sections) if sections else "Статистика пока не собрана")
+
+# Сколько сообщений /search показывает по умолчанию и максимум
+SEARCH_DEFAULT_LIMIT = 20
+SEARCH_MAX_LIMIT = 100
+
+@dp.message(Command("search", ignore_case=True))
+async def search_command(message: types.Message):
+    """
+    Ищет сообщения в архиве.
+    /search [user:ID|@username] [chat:ID] [since:2024-01-31] [until:2024-02-01] [limit:N] [фраза]
+    Ответом на сообщение ищет сообщения его автора.
+    """
+    if not is_admin(message.from_user.id):
+        try:
+            await message.delete()
+        except Exception as e:
+            logger.error(f"Ошибка при удалении команды: {e}")
+        return
+    
+    if message_archive is None:
+        await message.reply("Архив сообщений отключен")
+        return
+    
+    filters = {"user": None, "chat_id": None, "since": None, "until": None}
+    limit = SEARCH_DEFAULT_LIMIT
+    words = []
+    try:
+        for arg in message.text.split()[1:]:
+            key, _, value = arg.partition(":")
+            key = key.lower()
+            if value and key == "user":
+                filters["user"] = parse_user(value)
+            elif value and key == "chat":
+                filters["chat_id"] = int(value)
+            elif value and key in ("since", "until"):
+                filters[key] = parse_archive_time(value)
+            elif value and key == "limit":
+                limit = max(1, min(int(value), SEARCH_MAX_LIMIT))
+            else:
+                words.append(arg)
+    except ValueError as e:
+        await message.reply(
+            f"Ошибка в параметрах: {e}\n"
+            "Использование: /search [user:ID|@username] [chat:ID] [since:2024-01-31] [until:2024-02-01] [limit:N] [фраза]"
+        )
+        return
+    
+    if filters["user"] is None and message.reply_to_message:
+        filters["user"] = message.reply_to_message.from_user.id
+    phrase = " ".join(words) or None
+    if phrase is None and all(value is None for value in filters.values()):
+        await message.reply(
+            "Использование: /search [user:ID|@username] [chat:ID] [since:2024-01-31] [until:2024-02-01] [limit:N] [фраза]\n"
+            "Ответом на сообщение ищет сообщения его автора"
+        )
+        return
+    
+    loop = asyncio.get_running_loop()
+    started = time.perf_counter()
+    try:
+        records = await loop.run_in_executor(
+            None, lambda: message_archive.search(phrase=phrase, limit=limit, **filters)
+        )
+    except Exception as e:
+        logger.error(f"Ошибка при поиске в архиве: {e}")
+        await message.reply("Ошибка при поиске в архиве")
+        return
+    elapsed_ms = (time.perf_counter() - started) * 1000
+    
+    if not records:
+        await message.reply(f"Ничего не найдено ({elapsed_ms:.0f} мс)")
+        return
+    
+    header = f"Найдено: {len(records)} ({elapsed_ms:.0f} мс)\n\n"
+    text = header + "\n".join(format_record(record) for record in records)
+    # Ограничение Telegram на длину сообщения
+    if len(text) > 4096:
+        text = text[:4093] + "..."
+    await message.reply(text)
+
+# Буквы, которые есть только в украинском или только в русском алфавите
+UKRAINIAN_ONLY_LETTERS = frozenset("іїєґІЇЄҐ")
+RUSSIAN_ONLY_LETTERS = frozenset("ыэъёЫЭЪЁ")
+_CYRILLIC_RE = re.compile(r"[\u0400-\u04ff]")
+_LATIN_RE = re.compile(r"[A-Za-z]")
+
+# Счетчики быстрой проверки по алфавиту: решено без lingua, передано в lingua и время lingua
+script_check_stats = {"hits": 0, "fallbacks": 0, "lingua_time": 0.0}
+
+def classify_script(text: str) -> Optional[bool]:
+    """
+    Быстрая проверка по алфавиту для украинского режима
+    Возвращает True (украинский), False (точно не украинский) или None, если нужен lingua
+    """
+    letters = set(text)
+    has_ukrainian = not UKRAINIAN_ONLY_LETTERS.isdisjoint(letters)
+    has_russian = not RUSSIAN_ONLY_LETTERS.isdisjoint(letters)
+    if has_ukrainian and not has_russian:
+        return True
+    if has_russian and not has_ukrainian:
+        return False
+    if not has_ukrainian and _CYRILLIC_RE.search(text) is None and _LATIN_RE.search(text) is not None:
+        # Только латиница — точно не украинский
+        return False
+    return None
+
+def script_check_stats_lines() -> List[str]:
+    hits = script_check_stats["hits"]
+    fallbacks = script_check_stats["fallbacks"]
+    total = hits + fallbacks
+    if not total:
+        return []
+    average_lingua = script_check_stats["lingua_time"] / fallbacks if fallbacks else 0.0
+    return [
+        f"Решено по алфавиту: {hits}/{total} ({hits / total:.0%})",
+        f"Среднее время lingua: {average_lingua * 1000:.1f} мс, сэкономлено примерно {hits * average_lingua:.1f} с",
+    ]
+
+stats_providers["Украинский режим"] = script_check_stats_lines
+
+async def check_language(message: types.Message) -> bool:
+    """
+    Проверяет язык сообщений в украинском режиме
+    Возвращает True, если сообщение нарушает режим и дальше не обрабатывается
+    """
     # Пропускаем команды
     if message.text and message.text.startswith('/'):
-        return
+        return False
         
-    # Проверяем, активен ли украинский режим для этого чата
+    # Проверяем, активен ли украинский режим для этого чата (по окончании его снимает таймер)
     if message.chat.id not in ua_mode:
-        return
-        
-    # Проверяем, не истекло ли время режима
-    if datetime.now() > ua_mode[message.chat.id]:
-        del ua_mode[message.chat.id]
-        return
+        return False
         
     # Проверяем только текстовые сообщения
     if not message.text and not message.caption:
-        return
+        return False
         
     text = message.text or message.caption
     
     try:
-        # Определяем язык текста
-        detected_language = language_detector.detect_language_of(text)
+        # Сначала пробуем решить по алфавиту, lingua — только для неоднозначных текстов
+        is_ukrainian = classify_script(text)
+        if is_ukrainian is not None:
+            script_check_stats["hits"] += 1
+            detected_language = "по алфавиту"
+        else:
+            started = time.perf_counter()
+            detected_language = await language_service.detect(text)
+            script_check_stats["fallbacks"] += 1
+            script_check_stats["lingua_time"] += time.perf_counter() - started
+            is_ukrainian = detected_language == Language.UKRAINIAN
         
         # Если язык не украинский
-        if detected_language != Language.UKRAINIAN:
+        if not is_ukrainian:
             logger.info(f"Обнаружен неукраинский язык: {detected_language}")
             
             try:
@@ -2031,7 +4124,7 @@ async def check_language(message: types.Message):
                 logger.info(f"Удалено сообщение на неукраинском языке от пользователя {message.from_user.full_name}")
                 
                 # Если пользователь не админ, выдаем мут
-                if not is_admin(message.from_user.id):
+                if not is_admin(message.from_user.id, message.chat.id):
                     # Мутим пользователя на минуту
                     until_date = datetime.now() + timedelta(minutes=1)
                     await message.chat.restrict(
@@ -2058,9 +4151,237 @@ async def check_language(message: types.Message):
                     
             except Exception as e:
                 logger.error(f"Ошибка при применении ограничений: {e}")
+            return True
                 
+    except LanguageDetectionUnavailable as e:
+        # Без уверенного результата сообщение не наказываем
+        logger.warning(f"Проверка языка пропущена: {e}")
     except Exception as e:
         logger.error(f"Ошибка при определении языка: {e}")
+    return False
+
+# Бюджеты исходящих запросов: общий (в секунду) и на групповой чат (в минуту, с запасом на всплеск)
+OUTBOUND_GLOBAL_PER_SECOND = float(os.getenv("OUTBOUND_GLOBAL_PER_SECOND", "30"))
+OUTBOUND_CHAT_PER_MINUTE = float(os.getenv("OUTBOUND_CHAT_PER_MINUTE", "20"))
+OUTBOUND_CHAT_BURST = float(os.getenv("OUTBOUND_CHAT_BURST", "5"))
+# Сколько раз повторять запрос после ответа 429
+OUTBOUND_MAX_RETRIES = int(os.getenv("OUTBOUND_MAX_RETRIES", "3"))
+# Максимум ожидающих запросов (ограничения и удаление принимаются всегда) и максимальное ожидание в секундах
+OUTBOUND_MAX_WAITING = int(os.getenv("OUTBOUND_MAX_WAITING", "1000"))
+OUTBOUND_MAX_WAIT = float(os.getenv("OUTBOUND_MAX_WAIT", "30"))
+
+# Приоритеты исходящих запросов: меньше — важнее
+PRIORITY_MODERATION = 0
+PRIORITY_DEFAULT = 1
+PRIORITY_COSMETIC = 2
+MODERATION_METHODS = {"restrictChatMember", "banChatMember", "unbanChatMember", "deleteMessage", "deleteMessages"}
+COSMETIC_METHODS = {"editMessageText", "editMessageReplyMarkup", "editMessageCaption", "setChatAdministratorCustomTitle"}
+
+class TokenBucket:
+    """Корзина токенов: rate токенов в секунду, не больше capacity"""
+
+    __slots__ = ("rate", "capacity", "tokens", "updated", "blocked_until")
+
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+        self.blocked_until = 0.0
+
+    def _refill(self, now: float):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def available(self, now: float) -> bool:
+        self._refill(now)
+        return now >= self.blocked_until and self.tokens >= 1
+
+    def take(self):
+        self.tokens -= 1
+
+    def ready_in(self, now: float) -> float:
+        """Через сколько секунд появится токен"""
+        self._refill(now)
+        wait = 0.0 if self.tokens >= 1 else (1 - self.tokens) / self.rate
+        return max(wait, self.blocked_until - now)
+
+class OutboundRequestDropped(Exception):
+    """Запрос к Telegram не отправлен: очередь переполнена или истекло время ожидания"""
+
+class OutboundScheduler(BaseRequestMiddleware):
+    """
+    Планировщик исходящих запросов к Telegram (middleware сессии aiogram).
+
+    Запросы к чатам проходят через общую корзину токенов и корзину чата.
+    Ограничения и удаление корзину чата не расходуют: лимит на групповой чат
+    относится к отправке сообщений, а модерация не должна ждать за ними.
+    Ожидающие запросы обслуживаются по приоритету: ограничения и удаление
+    раньше обычных сообщений, а правки сообщений в последнюю очередь. На ответ
+    429 чат блокируется на retry_after, и запрос автоматически повторяется.
+    Очередь ограничена по длине и времени ожидания, лишние запросы получают
+    OutboundRequestDropped.
+    """
+
+    def __init__(self, global_rate: float, chat_rate: float, chat_burst: float, max_retries: int,
+                 max_waiting: int, max_wait: float):
+        self.global_bucket = TokenBucket(global_rate, global_rate)
+        self.chat_rate = chat_rate
+        self.chat_burst = chat_burst
+        self.max_retries = max_retries
+        self.max_waiting = max_waiting
+        self.max_wait_time = max_wait
+        self.chat_buckets: Dict[Union[int, str], TokenBucket] = {}
+        self.waiting: List[Tuple[int, int, Union[int, str], asyncio.Future, float]] = []
+        self.sent = 0
+        self.dropped = 0
+        self.retry_after_count = 0
+        self.total_wait = 0.0
+        self.max_wait = 0.0
+        self._seq = 0
+        self._wakeup = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+
+    def _chat_bucket(self, chat_id: Union[int, str]) -> TokenBucket:
+        bucket = self.chat_buckets.get(chat_id)
+        if bucket is None:
+            # В личных чатах Telegram допускает около одного сообщения в секунду
+            if isinstance(chat_id, int) and chat_id > 0:
+                bucket = TokenBucket(1.0, 1.0)
+            else:
+                bucket = TokenBucket(self.chat_rate, self.chat_burst)
+            self.chat_buckets[chat_id] = bucket
+        return bucket
+
+    async def acquire(self, chat_id: Union[int, str], priority: int):
+        """Ждет разрешения на запрос к чату"""
+        if priority != PRIORITY_MODERATION and len(self.waiting) >= self.max_waiting:
+            self.dropped += 1
+            raise OutboundRequestDropped("очередь исходящих запросов переполнена")
+        if self._task is None:
+            self._task = asyncio.create_task(self._pump())
+        future = asyncio.get_running_loop().create_future()
+        self._seq += 1
+        heapq.heappush(self.waiting, (priority, self._seq, chat_id, future, time.monotonic()))
+        self._wakeup.set()
+        try:
+            # По таймауту future отменяется, и _pump пропускает запрос
+            await asyncio.wait_for(future, self.max_wait_time)
+        except asyncio.TimeoutError:
+            self.dropped += 1
+            raise OutboundRequestDropped(f"запрос к чату {chat_id} ждал отправки дольше {self.max_wait_time:.0f} с")
+
+    async def _pump(self):
+        while True:
+            if not self.waiting:
+                self._wakeup.clear()
+                await self._wakeup.wait()
+                continue
+            now = time.monotonic()
+            next_ready = None
+            remaining = []
+            granted = False
+            for item in sorted(self.waiting):
+                priority, _, chat_id, future, enqueued_at = item
+                if future.done():
+                    continue
+                chat_bucket = self._chat_bucket(chat_id)
+                moderation = priority == PRIORITY_MODERATION
+                if not self.global_bucket.available(now):
+                    next_ready = self.global_bucket.ready_in(now)
+                    remaining.append(item)
+                    continue
+                if moderation and now < chat_bucket.blocked_until:
+                    # Модерация не расходует корзину чата, но блокировку после 429 соблюдает
+                    wait = chat_bucket.blocked_until - now
+                    next_ready = wait if next_ready is None else min(next_ready, wait)
+                    remaining.append(item)
+                    continue
+                if not moderation and not chat_bucket.available(now):
+                    wait = chat_bucket.ready_in(now)
+                    next_ready = wait if next_ready is None else min(next_ready, wait)
+                    remaining.append(item)
+                    continue
+                self.global_bucket.take()
+                if not moderation:
+                    chat_bucket.take()
+                waited = now - enqueued_at
+                self.total_wait += waited
+                self.max_wait = max(self.max_wait, waited)
+                self.sent += 1
+                future.set_result(None)
+                granted = True
+            heapq.heapify(remaining)
+            self.waiting = remaining
+            if self.waiting and not granted:
+                self._wakeup.clear()
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), max(next_ready or 0.05, 0.01))
+                except asyncio.TimeoutError:
+                    pass
+
+    async def stop(self):
+        """Останавливает обработку очереди; ожидающие запросы отменяются"""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        for _, _, _, future, _ in self.waiting:
+            future.cancel()
+        self.waiting = []
+
+    async def __call__(self, make_request, bot: Bot, method):
+        api_method = getattr(method, "__api_method__", "")
+        chat_id = getattr(method, "chat_id", None)
+        # Запросы на чтение и запросы без чата не ограничиваем
+        if chat_id is None or api_method.startswith("get"):
+            return await make_request(bot, method)
+        if api_method in MODERATION_METHODS:
+            priority = PRIORITY_MODERATION
+        elif api_method in COSMETIC_METHODS:
+            priority = PRIORITY_COSMETIC
+        else:
+            priority = PRIORITY_DEFAULT
+
+        attempt = 0
+        while True:
+            await self.acquire(chat_id, priority)
+            try:
+                return await make_request(bot, method)
+            except TelegramRetryAfter as e:
+                self.retry_after_count += 1
+                self._chat_bucket(chat_id).blocked_until = time.monotonic() + e.retry_after
+                if attempt >= self.max_retries:
+                    raise
+                attempt += 1
+                logger.warning(f"Telegram ограничил {api_method} в чате {chat_id}, повтор через {e.retry_after} с")
+
+    def stats_lines(self) -> List[str]:
+        average_wait = self.total_wait / self.sent if self.sent else 0.0
+        blocked = sum(1 for bucket in self.chat_buckets.values() if bucket.blocked_until > time.monotonic())
+        return [
+            f"Ожидают отправки: {len(self.waiting)}/{self.max_waiting}, отправлено: {self.sent}, "
+            f"отброшено: {self.dropped}, ответов 429: {self.retry_after_count}",
+            f"Ожидание в среднем {average_wait * 1000:.0f} мс, максимум {self.max_wait:.2f} с, "
+            f"заблокировано чатов: {blocked}",
+        ]
+
+outbound_scheduler = OutboundScheduler(
+    OUTBOUND_GLOBAL_PER_SECOND, OUTBOUND_CHAT_PER_MINUTE / 60, OUTBOUND_CHAT_BURST, OUTBOUND_MAX_RETRIES,
+    OUTBOUND_MAX_WAITING, OUTBOUND_MAX_WAIT
+)
+stats_providers["Исходящие запросы"] = outbound_scheduler.stats_lines
+
+async def warm_up_language_detector():
+    """Прогревает детектор языка после первого обновления или через LANG_WARMUP_DELAY секунд"""
+    try:
+        await asyncio.wait_for(first_update_received.wait(), LANG_WARMUP_DELAY)
+    except asyncio.TimeoutError:
+        pass
+    await language_service.warm_up()
 
 async def initialize_bot():
     """Инициализация бота"""
@@ -2076,6 +4397,8 @@ async def initialize_bot():
     
     # Создаем бота без дополнительных настроек
     bot = Bot(token=TOKEN)
+    # Все исходящие запросы проходят через планировщик с учетом лимитов Telegram
+    bot.session.middleware(outbound_scheduler)
     return bot
 
 def check_env_vars():
@@ -2121,6 +4444,93 @@ def check_env_vars():
     logger.info(f"Отслеживаемые группы: {os.getenv('MONITORED_GROUPS')}")
     logger.info(f"Количество администраторов: {len(os.getenv('ADMIN_IDS').split(','))}")
 
+# Режим вебхука: если задан WEBHOOK_URL, обновления принимает встроенный aiohttp-сервер вместо long polling
+WEBHOOK_URL = os.getenv("WEBHOOK_URL", "").rstrip("/")
+WEBHOOK_PATH = os.getenv("WEBHOOK_PATH", "/webhook")
+# Секрет, который Telegram присылает в заголовке каждого запроса вебхука. Без проверки любой, кто
+# достучится до сервера, может подделать обновление от имени администратора. Если секрет не задан,
+# создаем случайный: он передается Telegram в setWebhook при каждом запуске
+WEBHOOK_SECRET = os.getenv("WEBHOOK_SECRET") or secrets.token_urlsafe(32)
+WEBAPP_HOST = os.getenv("WEBAPP_HOST", "0.0.0.0")
+WEBAPP_PORT = int(os.getenv("WEBAPP_PORT", "8080"))
+# Сколько секунд при остановке ждать обработки уже принятых обновлений
+WEBHOOK_SHUTDOWN_TIMEOUT = float(os.getenv("WEBHOOK_SHUTDOWN_TIMEOUT", "10"))
+
+# Отбрасывать ли накопившиеся за время простоя обновления на стороне Telegram.
+# По умолчанию нет: старые сообщения бот пропускает сам, а в очереди кроме них лежат
+# нажатия кнопок голосований и изменения участников и админов чатов, которые терять нельзя.
+# Включать, только если после долгого простоя очередь слишком велика
+DROP_PENDING_UPDATES = os.getenv("DROP_PENDING_UPDATES", "false").lower() == "true"
+
+# Задачи обработки обновлений, принятых вебхуком; при остановке их дожидаемся
+webhook_update_tasks: Set[asyncio.Task] = set()
+
+async def process_webhook_update(bot: Bot, update: dict):
+    """Обрабатывает обновление из вебхука в фоне"""
+    result = await dp.feed_raw_update(bot, update)
+    # Ответ вебхука уже отправлен, поэтому метод, возвращенный обработчиком, вызываем сами
+    if isinstance(result, TelegramMethod):
+        await dp.silent_call_request(bot, result)
+
+def make_webhook_handler(bot: Bot):
+    """Обработчик запросов Telegram: проверяет секрет, отвечает сразу, обновление обрабатывает в фоне"""
+    async def handle(request: web.Request) -> web.Response:
+        if not secrets.compare_digest(
+            request.headers.get("X-Telegram-Bot-Api-Secret-Token", ""), WEBHOOK_SECRET
+        ):
+            return web.Response(body="Unauthorized", status=401)
+        update = await request.json(loads=bot.session.json_loads)
+        task = asyncio.create_task(process_webhook_update(bot, update))
+        webhook_update_tasks.add(task)
+        task.add_done_callback(webhook_update_tasks.discard)
+        return web.json_response({})
+    return handle
+
+async def run_webhook(bot: Bot, allowed_updates: List[str]):
+    """
+    Принимает обновления через вебхук.
+
+    Telegram получает ответ сразу, обновление обрабатывается в фоне. При
+    остановке сервер перестает принимать запросы, дожидается уже принятых
+    обновлений и только потом снимает dispatcher.
+    """
+    app = web.Application()
+    app.router.add_post(WEBHOOK_PATH, make_webhook_handler(bot))
+    setup_application(app, dp, bot=bot)
+
+    runner = web.AppRunner(app)
+    await runner.setup()
+    site = web.TCPSite(runner, WEBAPP_HOST, WEBAPP_PORT)
+    await site.start()
+    logger.info(f"Вебхук-сервер слушает {WEBAPP_HOST}:{WEBAPP_PORT}{WEBHOOK_PATH}")
+
+    await bot.set_webhook(
+        f"{WEBHOOK_URL}{WEBHOOK_PATH}",
+        secret_token=WEBHOOK_SECRET,
+        allowed_updates=allowed_updates,
+        drop_pending_updates=DROP_PENDING_UPDATES
+    )
+
+    stop_event = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        try:
+            loop.add_signal_handler(sig, stop_event.set)
+        except NotImplementedError:
+            pass
+
+    try:
+        await stop_event.wait()
+    finally:
+        logger.info("Останавливаем вебхук-сервер...")
+        await site.stop()
+        pending = list(webhook_update_tasks)
+        if pending:
+            done, not_done = await asyncio.wait(pending, timeout=WEBHOOK_SHUTDOWN_TIMEOUT)
+            if not_done:
+                logger.warning(f"Не дождались обработки обновлений: {len(not_done)}")
+        await runner.cleanup()
+
 async def main():
     """Основная функция запуска бота"""
     global bot, bot_start_time, is_running
@@ -2139,14 +4549,61 @@ async def main():
     # Инициализируем бота
     bot = await initialize_bot()
     
-    # Запускаем проверку истекших голосований
-    asyncio.create_task(check_vote_expiration())
+    # Заранее загружаем администраторов отслеживаемых групп (в фоне, чтобы не задерживать запуск)
+    asyncio.create_task(chat_members.prefetch_admins(MONITORED_GROUPS))
+    
+    # Запускаем таймеры (окончание голосований, режимов и мутов) и отрисовку сообщений голосований
+    timers.start()
+    vote_renderer.start()
+    
+    # Запускаем очистку истории флуда от неактивных пользователей
+    asyncio.create_task(flood_history_sweeper())
+    
+    # Запускаем фоновое сохранение индекса кэша озвучки и обработчики очереди синтеза
+    tts_cache.start()
+    tts_scheduler.start()
+    
+    # Детектор языка прогреваем в фоне, когда бот уже принимает обновления
+    if LANG_WARMUP:
+        asyncio.create_task(warm_up_language_detector())
+    
+    # Запускаем фоновую запись журнала сообщений, сохранение данных и сжатие журнала событий
+    message_log.start()
+    open_message_archive()
+    if archive_log is not None:
+        archive_log.start()
+    storage.start()
+    journal.open()
+    asyncio.create_task(journal.run_compaction(JOURNAL_COMPACT_INTERVAL, JOURNAL_COMPACT_EVENTS))
+    
+    # Запрашиваем у Telegram только те типы обновлений, для которых есть обработчики
+    allowed_updates = dp.resolve_used_update_types()
+    logger.info(f"Типы получаемых обновлений: {', '.join(allowed_updates)}")
     
     try:
-        await dp.start_polling(bot)
+        if WEBHOOK_URL:
+            await run_webhook(bot, allowed_updates)
+        else:
+            # Вебхук, оставшийся от запуска в режиме вебхука, мешает getUpdates.
+            # С DROP_PENDING_UPDATES Telegram заодно отбрасывает очередь, накопившуюся за время простоя
+            await bot.delete_webhook(drop_pending_updates=DROP_PENDING_UPDATES)
+            await dp.start_polling(bot, allowed_updates=allowed_updates)
     except Exception as e:
         logger.error(f"Ошибка при запуске бота: {e}")
     finally:
+        await timers.stop()
+        await vote_renderer.stop()
+        await storage.stop()
+        journal.close()
+        message_log.stop()
+        if archive_log is not None:
+            archive_log.stop()
+        await tts_scheduler.stop()
+        tts_executor.shutdown(wait=False, cancel_futures=True)
+        await tts_cache.store.stop()
+        language_service.shutdown()
+        # Последним перед закрытием сессии: выше еще отправляются финальные правки голосований
+        await outbound_scheduler.stop()
         await bot.session.close()
 
 if __name__ == "__main__":
@@ -0,0 +1,126 @@
+"""
+Определение языка с помощью lingua для пула потоков или процессов бота.
+
+Модуль импортируется рабочими процессами пула (контекст spawn), поэтому при
+импорте он ничего не делает: не читает окружение, не создает бота и детектор.
+Настройки передаются явно: в пуле процессов через initializer init_worker,
+в пуле потоков бот сам вызывает configure перед созданием пула. Детектор
+создается при первом обращении отдельно в каждом процессе.
+
+Результаты возвращаются как (имя языка, уверенность), а не Language, чтобы
+их можно было передать между процессами.
+"""
+
+import logging
+import threading
+import time
+from typing import Dict, List, Optional, Tuple
+
+from lingua import Language, LanguageDetectorBuilder
+
+logger = logging.getLogger(__name__)
+
+# Языки, между которыми выбирает детектор
+LANGUAGES = (Language.RUSSIAN, Language.UKRAINIAN, Language.ENGLISH, Language.POLISH)
+
+# Короткие тексты на каждом языке: lingua подгружает модели языка при первом
+# тексте, где этот язык возможен, поэтому прогрев проходит по всем языкам
+WARM_UP_TEXTS = (
+    "Привет, как у тебя дела?",
+    "Привіт, як у тебе справи?",
+    "Hello, how are you doing?",
+    "Cześć, jak się masz?",
+)
+
+# Значения по умолчанию; бот передает свои через configure
+_settings: Dict[str, object] = {
+    "low_accuracy": False,
+    "preload_models": False,
+    "min_confidence_margin": 0.25,
+}
+
+_detector = None
+_detector_lock = threading.Lock()
+
+
+def configure(settings: Dict[str, object]):
+    """Задает настройки детектора для текущего процесса"""
+    unknown = set(settings) - set(_settings)
+    if unknown:
+        raise ValueError(f"Неизвестные настройки детектора языка: {', '.join(sorted(unknown))}")
+    _settings.update(settings)
+
+
+def init_worker(settings: Dict[str, object], warm: bool = False):
+    """Initializer пула процессов: настраивает детектор и при warm сразу прогревает его"""
+    configure(settings)
+    if warm:
+        warm_up()
+
+
+def get_detector():
+    """Возвращает детектор языка, создавая его при первом обращении"""
+    global _detector
+    if _detector is None:
+        with _detector_lock:
+            if _detector is None:
+                started = time.perf_counter()
+                builder = LanguageDetectorBuilder.from_languages(*LANGUAGES)
+                if _settings["low_accuracy"]:
+                    builder = builder.with_low_accuracy_mode()
+                if _settings["preload_models"]:
+                    builder = builder.with_preloaded_language_models()
+                _detector = builder.build()
+                logger.info(f"Детектор языка создан за {time.perf_counter() - started:.2f} с")
+    return _detector
+
+
+def _confidence_pairs(confidence_values) -> List[Tuple[object, float]]:
+    """Приводит значения уверенности lingua к списку пар (язык, уверенность)"""
+    pairs = []
+    for item in confidence_values:
+        if hasattr(item, "language"):
+            pairs.append((item.language, item.value))
+        else:
+            language, value = item
+            pairs.append((language, value))
+    return pairs
+
+
+def pick_language(confidence_values) -> Tuple[Optional[str], float]:
+    """Выбирает язык по значениям уверенности; None, если отрыв от второго языка мал"""
+    pairs = sorted(_confidence_pairs(confidence_values), key=lambda pair: pair[1], reverse=True)
+    if not pairs or pairs[0][1] <= 0:
+        return None, 0.0
+    language, confidence = pairs[0]
+    runner_up = pairs[1][1] if len(pairs) > 1 else 0.0
+    if confidence - runner_up < _settings["min_confidence_margin"]:
+        return None, confidence
+    return language.name, confidence
+
+
+def detect_language(text: str) -> Tuple[Optional[str], float]:
+    """Задача пула: определяет язык и уверенность за один проход модели"""
+    return pick_language(get_detector().compute_language_confidence_values(text))
+
+
+def detect_languages_batch(texts: List[str]) -> List[Tuple[Optional[str], float]]:
+    """Задача пула: определяет языки пачки текстов одним параллельным вызовом lingua"""
+    detector = get_detector()
+    compute_in_parallel = getattr(detector, "compute_language_confidence_values_in_parallel", None)
+    if compute_in_parallel is not None:
+        results = compute_in_parallel(texts)
+    else:
+        results = [detector.compute_language_confidence_values(text) for text in texts]
+    return [pick_language(confidence_values) for confidence_values in results]
+
+
+def warm_up(_argument=None) -> float:
+    """
+    Задача пула: создает детектор и загружает модели всех языков пробным определением
+    Возвращает время прогрева в секундах
+    """
+    started = time.perf_counter()
+    for text in WARM_UP_TEXTS:
+        detect_language(text)
+    return time.perf_counter() - started
@@ -0,0 +1,394 @@
+"""
+Архив сообщений из групп.
+
+Сообщения дописываются в JSONL-файл (одна запись на строку: chat_id,
+user_id, message_id, время, тип контента, текст). Рядом лежит SQLite-индекс
+с полнотекстовым поиском FTS5, который догоняет архив инкрементально: в базе
+хранится смещение в JSONL-файле, до которого записи уже проиндексированы, и
+отпечаток первой строки файла. Бот ротирует архив (старый файл сжимается в
+messages.jsonl.<время>.gz), предварительно проиндексировав его до конца;
+по смене отпечатка индекс понимает, что файл новый, и читает его с начала.
+Старые messages.txt импортируются прямо в индекс, минуя архив. Команда
+reindex пересобирает индекс из архива и его сжатых частей, импортированные
+записи при этом сохраняются.
+
+Модуль не зависит от aiogram и запускается отдельно:
+
+    python message_archive.py search --user 123456789 --since 2024-01-01 "слово"
+    python message_archive.py import messages.txt messages.txt.20240101-000000-000000.gz
+    python message_archive.py reindex
+"""
+
+import argparse
+import glob
+import gzip
+import hashlib
+import json
+import logging
+import os
+import re
+import sqlite3
+import sys
+import threading
+import time
+from datetime import datetime
+from typing import BinaryIO, Dict, Iterable, Iterator, List, Optional, Tuple, Union
+
+logger = logging.getLogger(__name__)
+
+ARCHIVE_FILE = os.getenv("MESSAGE_ARCHIVE_FILE", "messages.jsonl")
+ARCHIVE_INDEX_FILE = os.getenv("MESSAGE_ARCHIVE_INDEX", "messages_index.db")
+
+# Поля записи архива
+RECORD_FIELDS = (
+    "chat_id", "chat_title", "user_id", "username", "full_name",
+    "message_id", "date", "content_type", "text"
+)
+_INSERT_SQL = (
+    f"INSERT INTO messages ({', '.join(RECORD_FIELDS)}, imported) "
+    f"VALUES ({', '.join('?' * len(RECORD_FIELDS))}, ?)"
+)
+
+# Строка messages.txt: "Название чата (id или ссылка) | Имя (@username): текст"
+_LEGACY_LINE_RE = re.compile(
+    r"^(?P<chat_title>.*) \((?P<chat_ref>[^()]*)\) \| (?P<full_name>.*?) \(@(?P<username>No username|[^()\s]*)\): (?P<text>.*)$"
+)
+_LEGACY_MEDIA_RE = re.compile(r"^\[(\w+)\]$")
+
+
+class MessageArchive:
+    """JSONL-архив сообщений и его полнотекстовый индекс"""
+
+    def __init__(self, archive_path: str = ARCHIVE_FILE, index_path: str = ARCHIVE_INDEX_FILE):
+        self.archive_path = archive_path
+        self.index_path = index_path
+        # Соединения с SQLite нельзя передавать между потоками, поэтому у каждого потока свое
+        self._local = threading.local()
+        self._index_lock = threading.Lock()
+        self.has_fts = True
+        self._init_schema()
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.index_path)
+            conn.row_factory = sqlite3.Row
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def _init_schema(self):
+        conn = self._connect()
+        with conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS messages ("
+                " id INTEGER PRIMARY KEY,"
+                " chat_id INTEGER, chat_title TEXT,"
+                " user_id INTEGER, username TEXT, full_name TEXT,"
+                " message_id INTEGER, date REAL,"
+                " content_type TEXT, text TEXT,"
+                " imported INTEGER NOT NULL DEFAULT 0)"
+            )
+            # Индексы, созданные до импорта напрямую в базу, без колонки imported
+            columns = {row["name"] for row in conn.execute("PRAGMA table_info(messages)")}
+            if "imported" not in columns:
+                conn.execute("ALTER TABLE messages ADD COLUMN imported INTEGER NOT NULL DEFAULT 0")
+            conn.execute("CREATE INDEX IF NOT EXISTS messages_date ON messages (date)")
+            conn.execute("CREATE INDEX IF NOT EXISTS messages_user ON messages (user_id, date)")
+            conn.execute("CREATE INDEX IF NOT EXISTS messages_chat ON messages (chat_id, date)")
+            conn.execute("CREATE INDEX IF NOT EXISTS messages_username ON messages (username COLLATE NOCASE)")
+            conn.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT)")
+            try:
+                conn.execute(
+                    "CREATE VIRTUAL TABLE IF NOT EXISTS messages_fts USING fts5("
+                    " text, content='messages', content_rowid='id',"
+                    " tokenize='unicode61 remove_diacritics 2')"
+                )
+                conn.execute(
+                    "CREATE TRIGGER IF NOT EXISTS messages_fts_insert AFTER INSERT ON messages BEGIN"
+                    " INSERT INTO messages_fts (rowid, text) VALUES (new.id, new.text);"
+                    " END"
+                )
+            except sqlite3.OperationalError as e:
+                # Сборка SQLite без FTS5: поиск по фразе работает через LIKE
+                logger.warning(f"FTS5 недоступен, поиск по тексту будет медленным: {e}")
+                self.has_fts = False
+
+    def _get_meta(self, conn: sqlite3.Connection, key: str) -> Optional[str]:
+        row = conn.execute("SELECT value FROM meta WHERE key = ?", (key,)).fetchone()
+        return row["value"] if row else None
+
+    def _set_meta(self, conn: sqlite3.Connection, key: str, value: str):
+        conn.execute(
+            "INSERT INTO meta (key, value) VALUES (?, ?) ON CONFLICT(key) DO UPDATE SET value = excluded.value",
+            (key, value)
+        )
+
+    def _head(self) -> str:
+        """Отпечаток первой полной строки архива, пустая строка — если ее еще нет"""
+        with open(self.archive_path, "rb") as f:
+            line = f.readline()
+        return hashlib.sha1(line).hexdigest() if line.endswith(b"\n") else ""
+
+    @staticmethod
+    def _read_rows(f: BinaryIO, offset: int = 0) -> Tuple[List[tuple], int]:
+        """Читает записи с текущей позиции файла; возвращает строки для индекса и смещение после последней"""
+        rows = []
+        for raw_line in f:
+            # Недописанную последнюю строку проиндексируем в следующий раз
+            if not raw_line.endswith(b"\n"):
+                break
+            offset += len(raw_line)
+            try:
+                record = json.loads(raw_line)
+            except ValueError:
+                logger.error(f"Поврежденная запись в архиве сообщений на смещении {offset - len(raw_line)}")
+                continue
+            rows.append(tuple(record.get(field) for field in RECORD_FIELDS))
+        return rows, offset
+
+    @staticmethod
+    def _insert(conn: sqlite3.Connection, rows: List[tuple], imported: bool = False) -> int:
+        conn.executemany(_INSERT_SQL, [row + (int(imported),) for row in rows])
+        return len(rows)
+
+    def _sync(self, conn: sqlite3.Connection) -> int:
+        """Индексирует новые записи архива; вызывается внутри транзакции BEGIN IMMEDIATE"""
+        if not os.path.exists(self.archive_path):
+            return 0
+        offset = int(self._get_meta(conn, "archive_offset") or 0)
+        stored_head = self._get_meta(conn, "archive_head")
+        head = self._head()
+        if stored_head is not None and stored_head != head:
+            # Архив ротирован: старый файл бот проиндексировал до конца перед переименованием
+            offset = 0
+        elif offset > os.path.getsize(self.archive_path):
+            logger.warning("Архив сообщений меньше проиндексированной части, индекс будет пересобран")
+            self._clear(conn)
+            offset = 0
+        with open(self.archive_path, "rb") as f:
+            f.seek(offset)
+            rows, offset = self._read_rows(f, offset)
+        self._insert(conn, rows)
+        self._set_meta(conn, "archive_offset", str(offset))
+        self._set_meta(conn, "archive_head", head)
+        return len(rows)
+
+    def sync_index(self) -> int:
+        """Индексирует записи архива, добавленные после прошлого вызова; возвращает их количество"""
+        if not os.path.exists(self.archive_path):
+            return 0
+        with self._index_lock:
+            conn = self._connect()
+            with conn:
+                # Блокировка записи на всю транзакцию: бот и консольный поиск в другом процессе
+                # не проиндексируют одни и те же строки дважды
+                conn.execute("BEGIN IMMEDIATE")
+                return self._sync(conn)
+
+    def _clear(self, conn: sqlite3.Connection):
+        """Удаляет из индекса записи архива; импортированные из messages.txt есть только в базе и остаются"""
+        conn.execute("DELETE FROM messages WHERE imported = 0")
+        if self.has_fts:
+            conn.execute("INSERT INTO messages_fts (messages_fts) VALUES ('rebuild')")
+        conn.execute("DELETE FROM meta WHERE key IN ('archive_offset', 'archive_head')")
+
+    def rotated_archives(self) -> List[str]:
+        """Сжатые части архива, отделенные ротацией, от старых к новым"""
+        return sorted(glob.glob(glob.escape(self.archive_path) + ".*.gz"))
+
+    def reindex(self) -> int:
+        """Пересобирает индекс из сжатых частей архива и текущего файла"""
+        with self._index_lock:
+            conn = self._connect()
+            with conn:
+                conn.execute("BEGIN IMMEDIATE")
+                self._clear(conn)
+                total = 0
+                for path in self.rotated_archives():
+                    with gzip.open(path, "rb") as f:
+                        total += self._insert(conn, self._read_rows(f)[0])
+                return total + self._sync(conn)
+
+    def insert_records(self, records: Iterable[Dict]) -> int:
+        """
+        Добавляет записи прямо в индекс, минуя JSONL-архив, в который пишет бот.
+        Такие записи помечаются импортированными: reindex их не удаляет.
+        """
+        rows = [tuple(record.get(field) for field in RECORD_FIELDS) for record in records]
+        if not rows:
+            return 0
+        with self._index_lock:
+            conn = self._connect()
+            with conn:
+                return self._insert(conn, rows, imported=True)
+
+    def search(self, user: Optional[Union[int, str]] = None, chat_id: Optional[int] = None,
+               since: Optional[float] = None, until: Optional[float] = None,
+               phrase: Optional[str] = None, limit: int = 20) -> List[Dict]:
+        """
+        Ищет сообщения, новые первыми; записи без времени (импорт messages.txt) идут последними.
+        user — ID пользователя или username (с @ или без), since/until — unix time,
+        phrase — слова или фраза для полнотекстового поиска.
+        """
+        conditions = []
+        params: List = []
+        join = ""
+        if phrase:
+            if self.has_fts:
+                join = "JOIN messages_fts ON messages_fts.rowid = m.id"
+                conditions.append("messages_fts MATCH ?")
+                # Ищем фразу целиком, кавычки внутри экранируем по правилам FTS5
+                params.append('"' + phrase.replace('"', '""') + '"')
+            else:
+                conditions.append("m.text LIKE ?")
+                params.append(f"%{phrase}%")
+        if isinstance(user, int):
+            conditions.append("m.user_id = ?")
+            params.append(user)
+        elif user:
+            conditions.append("m.username = ? COLLATE NOCASE")
+            params.append(user.lstrip("@"))
+        if chat_id is not None:
+            conditions.append("m.chat_id = ?")
+            params.append(chat_id)
+        if since is not None:
+            conditions.append("m.date >= ?")
+            params.append(since)
+        if until is not None:
+            conditions.append("m.date < ?")
+            params.append(until)
+        where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+        query = f"SELECT m.* FROM messages m {join} {where} ORDER BY m.date DESC, m.id DESC LIMIT ?"
+        params.append(limit)
+        rows = self._connect().execute(query, params).fetchall()
+        return [{field: row[field] for field in RECORD_FIELDS} for row in rows]
+
+    def count(self) -> int:
+        """Количество проиндексированных сообщений"""
+        return self._connect().execute("SELECT COUNT(*) FROM messages").fetchone()[0]
+
+
+def _open_text(path: str):
+    if path.endswith(".gz"):
+        return gzip.open(path, "rt", encoding="utf-8", errors="replace")
+    return open(path, "r", encoding="utf-8", errors="replace")
+
+
+def parse_legacy_log(path: str) -> Iterator[Dict]:
+    """
+    Разбирает messages.txt (в том числе сжатые .gz) в записи архива.
+    В старом формате нет времени, ID пользователя и сообщения; строки, не
+    похожие на начало записи, считаются продолжением многострочного текста.
+    """
+    record = None
+    with _open_text(path) as f:
+        for line in f:
+            line = line.rstrip("\n")
+            match = _LEGACY_LINE_RE.match(line)
+            if match is None:
+                if record is not None:
+                    record["text"] += "\n" + line
+                continue
+            if record is not None:
+                yield record
+            chat_ref = match.group("chat_ref")
+            username = match.group("username")
+            text = match.group("text")
+            media = _LEGACY_MEDIA_RE.match(text)
+            record = {
+                "chat_id": int(chat_ref) if re.fullmatch(r"-?\d+", chat_ref) else None,
+                "chat_title": match.group("chat_title"),
+                "user_id": None,
+                "username": None if username == "No username" else username,
+                "full_name": match.group("full_name"),
+                "message_id": None,
+                "date": None,
+                "content_type": media.group(1) if media else "text",
+                "text": None if media else text,
+            }
+    if record is not None:
+        yield record
+
+
+def import_legacy_logs(archive: MessageArchive, paths: Iterable[str], batch_size: int = 5000) -> int:
+    """Импортирует файлы messages.txt в индекс (не в JSONL-архив, который в это время может писать бот)"""
+    total = 0
+    for path in paths:
+        batch = []
+        for record in parse_legacy_log(path):
+            batch.append(record)
+            if len(batch) >= batch_size:
+                total += archive.insert_records(batch)
+                batch = []
+        total += archive.insert_records(batch)
+        logger.info(f"Импортирован {path}")
+    return total
+
+
+def parse_time(value: str) -> float:
+    """Разбирает дату вида 2024-01-31 или 2024-01-31T12:00 в unix time"""
+    for fmt in ("%Y-%m-%d", "%Y-%m-%dT%H:%M", "%Y-%m-%d %H:%M"):
+        try:
+            return datetime.strptime(value, fmt).timestamp()
+        except ValueError:
+            pass
+    raise ValueError(f"Неверный формат даты: {value}")
+
+
+def parse_user(value: str) -> Union[int, str]:
+    """ID пользователя или username"""
+    return int(value) if re.fullmatch(r"-?\d+", value) else value
+
+
+def format_record(record: Dict) -> str:
+    """Форматирует запись архива в одну строку для вывода"""
+    date = datetime.fromtimestamp(record["date"]).strftime("%d.%m.%Y %H:%M") if record["date"] else "—"
+    username = f" (@{record['username']})" if record["username"] else ""
+    text = record["text"] if record["text"] is not None else f"[{record['content_type']}]"
+    return f"{date} | {record['chat_title']} | {record['full_name']}{username}: {text}"
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Архив сообщений из групп")
+    parser.add_argument("--archive", default=ARCHIVE_FILE, help="JSONL-архив")
+    parser.add_argument("--index", default=ARCHIVE_INDEX_FILE, help="SQLite-индекс")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    search_parser = commands.add_parser("search", help="Поиск сообщений")
+    search_parser.add_argument("phrase", nargs="?", help="Слова или фраза")
+    search_parser.add_argument("--user", type=parse_user, help="ID пользователя или username")
+    search_parser.add_argument("--chat", type=int, help="ID чата")
+    search_parser.add_argument("--since", type=parse_time, help="Начало периода (2024-01-31 или 2024-01-31T12:00)")
+    search_parser.add_argument("--until", type=parse_time, help="Конец периода")
+    search_parser.add_argument("--limit", type=int, default=50)
+
+    import_parser = commands.add_parser("import", help="Импорт файлов messages.txt (.gz тоже)")
+    import_parser.add_argument("paths", nargs="+")
+
+    commands.add_parser("reindex", help="Пересобрать индекс из архива и его сжатых частей")
+
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.INFO)
+    archive = MessageArchive(args.archive, args.index)
+
+    if args.command == "search":
+        archive.sync_index()
+        started = time.perf_counter()
+        records = archive.search(args.user, args.chat, args.since, args.until, args.phrase, args.limit)
+        elapsed_ms = (time.perf_counter() - started) * 1000
+        for record in records:
+            print(format_record(record))
+        print(f"Найдено: {len(records)} за {elapsed_ms:.1f} мс", file=sys.stderr)
+    elif args.command == "import":
+        imported = import_legacy_logs(archive, args.paths)
+        print(f"Импортировано записей: {imported}")
+    elif args.command == "reindex":
+        indexed = archive.reindex()
+        print(f"Проиндексировано записей: {indexed}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
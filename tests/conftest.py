@@ -0,0 +1,65 @@
+"""
+Общие фикстуры тестов.
+
+bot.py читает конфигурацию и сохраненное состояние при импорте, поэтому каждый
+тест загружает его заново (как новый модуль) во временном каталоге с тестовыми
+переменными окружения. Повторная загрузка в том же каталоге — перезапуск бота.
+"""
+
+import asyncio
+import importlib.util
+import os
+import signal
+import sys
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if ROOT not in sys.path:
+    sys.path.insert(0, ROOT)
+
+TEST_ENV = {
+    "BOT_TOKEN": "123456:TEST",
+    "BOT_ID": "123456",
+    "MAIN_GROUP": "-1001",
+    "MONITORED_GROUPS": "-1001,-1002",
+    "ADMIN_IDS": "1",
+    "SPECIAL_SEND_USER": "1",
+    "LANG_WARMUP": "false",
+}
+
+
+def close_bot(module):
+    """Освобождает файлы и потоки загруженного bot.py"""
+    module.language_service.shutdown()
+    module.journal.close()
+    if isinstance(module.storage, module.SqliteStore):
+        asyncio.run(module.storage.stop())
+
+
+@pytest.fixture
+def load_bot(tmp_path, monkeypatch):
+    """Возвращает функцию, загружающую bot.py; именованные аргументы переопределяют переменные окружения"""
+    monkeypatch.chdir(tmp_path)
+    for name, value in TEST_ENV.items():
+        monkeypatch.setenv(name, value)
+    # bot.py ставит свои обработчики сигналов, возвращаем прежние после теста
+    handlers = {sig: signal.getsignal(sig) for sig in (signal.SIGINT, signal.SIGTERM)}
+    loaded = []
+
+    def load(**env):
+        for name, value in env.items():
+            monkeypatch.setenv(name, str(value))
+        if loaded:
+            close_bot(loaded[-1])
+        spec = importlib.util.spec_from_file_location("bot", os.path.join(ROOT, "bot.py"))
+        module = importlib.util.module_from_spec(spec)
+        spec.loader.exec_module(module)
+        loaded.append(module)
+        return module
+
+    yield load
+    if loaded:
+        close_bot(loaded[-1])
+    for sig, handler in handlers.items():
+        signal.signal(sig, handler)
@@ -0,0 +1,52 @@
+"""Локальная замена Bot API для тестов, которые запускают main()"""
+
+import asyncio
+import os
+
+from aiogram.client.telegram import TelegramAPIServer
+from aiohttp import web
+
+
+class FakeTelegramApi:
+    """Локальная замена Bot API: getMe отвечает тестовым ботом, getUpdates — пустым списком, остальное — True"""
+
+    def __init__(self):
+        self.calls = []
+        self._runner = None
+
+    async def start(self) -> str:
+        app = web.Application()
+        app.router.add_post("/bot{token}/{method}", self._handle)
+        self._runner = web.AppRunner(app)
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, "127.0.0.1", 0)
+        await site.start()
+        return f"http://127.0.0.1:{site._server.sockets[0].getsockname()[1]}"
+
+    async def stop(self):
+        await self._runner.cleanup()
+
+    async def _handle(self, request):
+        method = request.match_info["method"]
+        self.calls.append(method)
+        result = True
+        if method == "getMe":
+            result = {"id": int(os.environ["BOT_ID"]), "is_bot": True, "first_name": "Test", "username": "test_bot"}
+        elif method == "getUpdates":
+            await asyncio.sleep(0.1)
+            result = []
+        elif method == "getChatAdministrators":
+            result = []
+        return web.json_response({"ok": True, "result": result})
+
+
+def use_api_server(module, base_url: str):
+    """Направляет запросы бота, созданного в main(), на локальный сервер"""
+    initialize_bot = module.initialize_bot
+
+    async def initialize_local_bot():
+        created = await initialize_bot()
+        created.session.api = TelegramAPIServer.from_base(base_url)
+        return created
+
+    module.initialize_bot = initialize_local_bot
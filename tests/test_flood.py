@@ -0,0 +1,34 @@
+def test_windows_count_and_expire(load_bot):
+    bot = load_bot()
+    state = bot.FloodState()
+    for message_id in range(5):
+        count = state.add_message(float(message_id) * 0.5, message_id)
+    assert count == 5
+    # Через окно частоты после последнего сообщения старые записи выпадают
+    assert state.add_message(2.0 + bot.FLOOD_RATE_WINDOW + 0.1, 5) == 1
+    assert state.rate_message_ids() == [5]
+
+
+def test_repeats_and_message_ids(load_bot):
+    bot = load_bot()
+    state = bot.FloodState()
+    assert state.add_hash(0.0, 42, 1) == 1
+    assert state.add_hash(1.0, 7, 2) == 1
+    assert state.add_hash(2.0, 42, 3) == 2
+    assert state.repeated_message_ids(42) == [1, 3]
+    assert state.add_hash(bot.FLOOD_REPEAT_WINDOW + 1.5, 42, 4) == 2
+    assert state.repeated_message_ids(42) == [3, 4]
+
+    assert state.long_messages is None
+    assert state.add_long_message(3.0, 5) == 1
+    assert state.long_message_ids() == [5]
+    assert state.message_ids() == [3, 4, 5]
+
+
+def test_window_capped(load_bot):
+    bot = load_bot()
+    state = bot.FloodState()
+    for message_id in range(bot.FLOOD_HISTORY_CAP + 10):
+        count = state.add_hash(0.0, 1, message_id)
+    assert count == bot.FLOOD_HISTORY_CAP
+    assert state.repeated_message_ids(1)[0] == 10
@@ -0,0 +1,59 @@
+import asyncio
+import glob
+import json
+import os
+
+
+def test_import_does_not_create_journal(load_bot):
+    bot = load_bot()
+    assert not os.path.exists(bot.JOURNAL_FILE)
+    bot.record_event("warn", 10, 1)
+    assert os.path.exists(bot.JOURNAL_FILE)
+
+
+def test_replay_restores_unsaved_events(load_bot):
+    bot = load_bot()
+    bot.warnings[10] = 2
+    bot.record_event("warn", 10, 2)
+    bot.mute_history[11] = 1
+    bot.record_event("mute", 11, 1)
+    bot.bot_muted_users[12] = {"until": float("inf"), "exclusive": False}
+    bot.record_event("botmute", 12, bot.bot_muted_users[12])
+    bot.record_event("warn", 13, 1)
+    bot.record_event("clear", 13)
+    # Снимки не сохранялись: состояние восстанавливается только из журнала
+    assert not os.path.exists(bot.WARNINGS_FILE)
+
+    bot = load_bot()
+    assert bot.replayed_events == 5
+    assert dict(bot.warnings) == {10: 2}
+    assert dict(bot.mute_history) == {11: 1}
+    assert bot.get_bot_mute_data(12)["until"] == float("inf")
+
+
+def test_replay_skips_torn_last_line(load_bot):
+    with open("events.jsonl", "w", encoding="utf-8") as f:
+        f.write(json.dumps({"ts": 0, "op": "warn", "user_id": 10, "value": 1}) + "\n")
+        f.write('{"ts": 0, "op": "warn", "user_id": 11, "va')
+    bot = load_bot()
+    assert dict(bot.warnings) == {10: 1}
+    # Следующее событие не склеивается с оборванной строкой
+    bot.record_event("warn", 12, 1)
+    bot = load_bot()
+    assert dict(bot.warnings) == {10: 1, 12: 1}
+
+
+def test_compaction_archives_segment_after_snapshot(load_bot):
+    bot = load_bot()
+    bot.warnings[10] = 1
+    bot.record_event("warn", 10, 1)
+    asyncio.run(bot.journal.compact())
+
+    with open(bot.WARNINGS_FILE, encoding="utf-8") as f:
+        assert json.load(f) == {"10": 1}
+    assert glob.glob(f"{bot.JOURNAL_FILE}.pending-*") == []
+    assert len(glob.glob(f"{bot.JOURNAL_FILE}.*")) == 1
+
+    bot = load_bot()
+    assert bot.replayed_events == 0
+    assert dict(bot.warnings) == {10: 1}
@@ -0,0 +1,86 @@
+import asyncio
+import json
+from types import SimpleNamespace
+
+import message_archive
+
+ADMIN_ID = 1
+
+
+class FakeMessage:
+    """Сообщение с командой: ответы бота собираются в replies"""
+
+    def __init__(self, text: str, user_id: int = ADMIN_ID):
+        self.text = text
+        self.from_user = SimpleNamespace(id=user_id)
+        self.chat = SimpleNamespace(id=user_id, type="private")
+        self.reply_to_message = None
+        self.replies = []
+
+    async def reply(self, text: str, **kwargs):
+        self.replies.append(text)
+
+    async def delete(self):
+        pass
+
+
+def load_search_bot(load_bot):
+    bot = load_bot()
+    bot.open_message_archive()
+    return bot
+
+
+def seed_archive(bot, records):
+    with open(bot.MESSAGE_ARCHIVE_FILE, "a", encoding="utf-8") as f:
+        for record in records:
+            f.write(json.dumps(record, ensure_ascii=False) + "\n")
+    bot.message_archive.sync_index()
+
+
+def record(user_id: int, day: str, text: str) -> dict:
+    return {
+        "chat_id": -1002, "chat_title": "Группа", "user_id": user_id, "username": f"user{user_id}",
+        "full_name": f"User {user_id}", "message_id": user_id, "date": message_archive.parse_time(day),
+        "content_type": "text", "text": text,
+    }
+
+
+def search(bot, text: str) -> str:
+    message = FakeMessage(text)
+    asyncio.run(bot.search_command(message))
+    assert len(message.replies) == 1
+    return message.replies[0]
+
+
+def test_search_since_until(load_bot):
+    bot = load_search_bot(load_bot)
+    seed_archive(bot, [
+        record(10, "2024-01-15", "январь"),
+        record(11, "2024-02-15", "февраль"),
+        record(12, "2024-03-15", "март"),
+    ])
+
+    reply = search(bot, "/search since:2024-02-01 until:2024-03-01")
+    assert reply.startswith("Найдено: 1 ")
+    assert "февраль" in reply
+
+    reply = search(bot, "/search since:2024-02-01")
+    assert reply.startswith("Найдено: 2 ")
+    # Новые первыми
+    assert reply.index("март") < reply.index("февраль")
+
+    reply = search(bot, "/search until:2024-02-01 январь")
+    assert reply.startswith("Найдено: 1 ")
+
+
+def test_search_rejects_relative_time(load_bot):
+    bot = load_search_bot(load_bot)
+    reply = search(bot, "/search since:5m")
+    assert reply.startswith("Ошибка в параметрах")
+
+
+def test_search_requires_admin(load_bot):
+    bot = load_search_bot(load_bot)
+    message = FakeMessage("/search since:2024-02-01", user_id=999)
+    asyncio.run(bot.search_command(message))
+    assert message.replies == []
@@ -0,0 +1,60 @@
+import json
+import time
+
+import pytest
+
+
+@pytest.fixture
+def load_sqlite_bot(load_bot):
+    return lambda: load_bot(STORAGE_BACKEND="sqlite")
+
+
+def test_state_survives_restart(load_sqlite_bot):
+    bot = load_sqlite_bot()
+    until = time.time() + 3600
+    bot.warnings[10] = 2
+    bot.mute_history[11] = 3
+    bot.bot_muted_users[12] = {"until": until, "exclusive": True}
+    bot.bot_muted_users[13] = {"until": float("inf"), "exclusive": False}
+    bot.binds["sticker_abc"] = "/warn"
+    bot.forbidden_content["gif_abc"] = {"type": "gif", "muted_users": [1]}
+    # Изменения на месте тоже записываются в базу
+    bot.forbidden_content["gif_abc"]["muted_users"].append(2)
+    bot.forbidden_content["gif_abc"]["reason"] = "спам"
+    del bot.warnings[10]
+    bot.warnings[14] = 1
+
+    bot = load_sqlite_bot()
+    assert dict(bot.warnings) == {14: 1}
+    assert dict(bot.mute_history) == {11: 3}
+    assert bot.get_bot_mute_data(12) == {"until": until, "exclusive": True}
+    assert bot.get_bot_mute_data(13) == {"until": float("inf"), "exclusive": False}
+    assert dict(bot.binds) == {"sticker_abc": "/warn"}
+    assert bot.forbidden_content["gif_abc"] == {"type": "gif", "muted_users": [1, 2], "reason": "спам"}
+
+
+def test_expired_bot_mutes_purged_on_start(load_sqlite_bot):
+    bot = load_sqlite_bot()
+    bot.bot_muted_users[12] = {"until": time.time() - 1, "exclusive": False}
+    bot.bot_muted_users[13] = {"until": float("inf"), "exclusive": False}
+
+    bot = load_sqlite_bot()
+    assert 12 not in bot.bot_muted_users
+    assert 13 in bot.bot_muted_users
+
+
+def test_migrates_json_files_once(load_sqlite_bot):
+    with open("warnings.json", "w", encoding="utf-8") as f:
+        json.dump({"10": 2}, f)
+    with open("bot_mute.json", "w", encoding="utf-8") as f:
+        json.dump({"12": {"until": "inf", "exclusive": True}, "13": time.time() + 3600}, f)
+
+    bot = load_sqlite_bot()
+    assert dict(bot.warnings) == {10: 2}
+    assert bot.get_bot_mute_data(12) == {"until": float("inf"), "exclusive": True}
+    assert bot.get_bot_mute_data(13)["exclusive"] is False
+    del bot.warnings[10]
+
+    # JSON-файлы остались на месте, но повторно не переносятся
+    bot = load_sqlite_bot()
+    assert dict(bot.warnings) == {}
@@ -0,0 +1,117 @@
+import asyncio
+import json
+import os
+import time
+
+import pytest
+
+from fake_telegram import FakeTelegramApi, use_api_server
+
+TIMED_USER = 1001
+PERMANENT_USER = 1002
+
+
+def write_journal(events):
+    with open("events.jsonl", "w", encoding="utf-8") as f:
+        for event in events:
+            f.write(json.dumps(event) + "\n")
+
+
+def assert_bot_mutes_restored(bot, until):
+    assert bot.is_bot_muted(TIMED_USER)
+    assert bot.is_bot_muted(PERMANENT_USER)
+    pending = {key: when for key, when, _ in bot.timers.pending("botmute_expire")}
+    # Таймер снятия назначается только временному муту
+    assert pending == {str(TIMED_USER): until}
+
+
+def test_import_creates_no_files(load_bot, tmp_path):
+    load_bot()
+    assert os.listdir(tmp_path) == []
+
+
+@pytest.mark.parametrize("backend", ["json", "sqlite"])
+def test_import_with_bot_mutes_in_journal(load_bot, backend):
+    until = time.time() + 3600
+    write_journal([
+        {"ts": time.time(), "op": "botmute", "user_id": TIMED_USER, "value": {"until": until, "exclusive": False}},
+        {"ts": time.time(), "op": "botmute", "user_id": PERMANENT_USER, "value": {"until": "inf", "exclusive": True}},
+    ])
+    bot = load_bot(STORAGE_BACKEND=backend)
+    assert_bot_mutes_restored(bot, until)
+
+
+def test_import_with_bot_mute_file(load_bot):
+    until = time.time() + 3600
+    with open("bot_mute.json", "w", encoding="utf-8") as f:
+        json.dump({
+            str(TIMED_USER): {"until": until, "exclusive": False},
+            str(PERMANENT_USER): {"until": "inf", "exclusive": False},
+        }, f)
+    bot = load_bot()
+    assert_bot_mutes_restored(bot, until)
+
+
+def test_timers_restored_after_restart(load_bot):
+    bot = load_bot()
+    fired = []
+    when = time.time() + 0.2
+
+    async def schedule():
+        bot.timers.schedule("vote_expire", "vote-1", when, {"chat_id": -1001})
+        await bot.timers.store.flush()
+
+    asyncio.run(schedule())
+
+    bot = load_bot()
+    assert bot.timers.pending("vote_expire") == [("vote-1", when, {"chat_id": -1001})]
+
+    async def on_expire(key, data):
+        fired.append((key, data))
+
+    bot.timers.register_handler("vote_expire", on_expire)
+
+    async def run():
+        bot.timers.start()
+        await asyncio.sleep(0.5)
+        await bot.timers.stop()
+
+    asyncio.run(run())
+    assert fired == [("vote-1", {"chat_id": -1001})]
+    assert bot.timers.pending("vote_expire") == []
+
+
+def test_main_starts_with_persisted_state(load_bot, tmp_path):
+    with open("warnings.json", "w", encoding="utf-8") as f:
+        json.dump({"10": 2}, f)
+    bot = load_bot()
+    # Botmute, истекший, пока бот не работал: таймер снятия срабатывает сразу после запуска
+    write_journal([
+        {"ts": time.time(), "op": "botmute", "user_id": TIMED_USER,
+         "value": {"until": time.time() - 1, "exclusive": False}},
+    ])
+    bot = load_bot()
+    assert bot.is_bot_muted(TIMED_USER) is False
+    assert TIMED_USER in bot.bot_muted_users
+
+    async def run():
+        server = FakeTelegramApi()
+        use_api_server(bot, await server.start())
+        main_task = asyncio.create_task(bot.main())
+        deadline = time.monotonic() + 10
+        while "getUpdates" not in server.calls and time.monotonic() < deadline:
+            await asyncio.sleep(0.01)
+        await asyncio.sleep(0.1)
+        await bot.dp.stop_polling()
+        await main_task
+        await server.stop()
+        return server.calls
+
+    calls = asyncio.run(run())
+    assert "getUpdates" in calls
+    assert TIMED_USER not in bot.bot_muted_users
+    assert bot.warnings == {10: 2}
+    # Файлы состояния создаются при запуске, а не при импорте
+    assert {"events.jsonl", "messages_index.db", "tts_cache"} <= set(os.listdir(tmp_path))
+    with open("bot_mute.json", encoding="utf-8") as f:
+        assert json.load(f) == {}
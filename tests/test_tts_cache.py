@@ -0,0 +1,21 @@
+import asyncio
+import os
+
+
+def test_cache_directory_created_at_start(load_bot):
+    bot = load_bot()
+    assert not os.path.exists(bot.TTS_CACHE_DIR)
+    key = bot.TtsCache.make_key("Привет  всем", "ru")
+    assert key == bot.TtsCache.make_key("Привет всем", "ru")
+
+    async def run():
+        bot.tts_cache.start()
+        await bot.tts_cache.put_audio(key, b"mp3")
+        bot.tts_cache.set_file_id(key, "file-1")
+        await bot.tts_cache.store.stop()
+
+    asyncio.run(run())
+    assert bot.tts_cache.get_audio_path(key) == os.path.join(bot.TTS_CACHE_DIR, f"{key}.mp3")
+
+    bot = load_bot()
+    assert bot.tts_cache.get_file_id(key) == "file-1"
@@ -0,0 +1,48 @@
+import asyncio
+
+from aiogram import Bot
+from aiohttp import web
+from aiohttp.test_utils import TestClient, TestServer
+
+UPDATE = {"update_id": 1}
+
+
+def post_update(bot_module, headers: dict):
+    """Отправляет обновление обработчику вебхука; возвращает код ответа и переданные в обработку обновления"""
+    processed = []
+
+    async def process(bot, update):
+        processed.append(update)
+
+    bot_module.process_webhook_update = process
+
+    async def run():
+        telegram_bot = Bot(token=bot_module.TOKEN)
+        app = web.Application()
+        app.router.add_post(bot_module.WEBHOOK_PATH, bot_module.make_webhook_handler(telegram_bot))
+        async with TestClient(TestServer(app)) as client:
+            response = await client.post(bot_module.WEBHOOK_PATH, json=UPDATE, headers=headers)
+            status = response.status
+        await asyncio.sleep(0)
+        await telegram_bot.session.close()
+        return status
+
+    return asyncio.run(run()), processed
+
+
+def test_secret_generated_when_unset(load_bot):
+    bot = load_bot(WEBHOOK_SECRET="")
+    assert len(bot.WEBHOOK_SECRET) >= 32
+
+
+def test_webhook_rejects_missing_or_wrong_secret(load_bot):
+    bot = load_bot()
+    assert post_update(bot, {}) == (401, [])
+    assert post_update(bot, {"X-Telegram-Bot-Api-Secret-Token": "wrong"}) == (401, [])
+
+
+def test_webhook_accepts_configured_secret(load_bot):
+    bot = load_bot(WEBHOOK_SECRET="configured-secret")
+    status, processed = post_update(bot, {"X-Telegram-Bot-Api-Secret-Token": "configured-secret"})
+    assert status == 200
+    assert processed == [UPDATE]